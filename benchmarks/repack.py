@@ -0,0 +1,131 @@
+"""
+Benchmarks the repacking of GRIB files, see cds/repack.py: the size of
+each file before and after, and the time ecCodes takes to decode all
+of its values, as processing does. Without files, it benchmarks smooth
+synthetic fields on a 1 degree global grid in GRIB 1 and GRIB 2.
+
+    python benchmarks/repack.py [file.grib ...] --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List, NamedTuple, Optional
+
+sys.path.insert(
+    0,
+    os.path.normpath(
+        os.path.join(os.path.dirname(__file__), "..", "src", "data_retrieval")
+    ),
+)
+
+from cds.repack import repack_grib  # noqa: E402
+
+DEFAULT_REPEAT: int = 3
+SYNTHETIC_FIELDS: int = 51
+
+
+class Result(NamedTuple):
+    file: str
+    messages: int
+    repacked: int
+    source_bytes: int
+    repacked_bytes: int
+    # Seconds to decode every value of the file, best of the runs
+    source_decode: float
+    repacked_decode: float
+
+
+def decode_seconds(file_path: str, repeat: int = DEFAULT_REPEAT) -> float:
+    """Returns the best time to decode every message of a file"""
+    import eccodes
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with open(file_path, "rb") as f:
+            while True:
+                gid = eccodes.codes_grib_new_from_file(f)
+                if gid is None:
+                    break
+                eccodes.codes_get_values(gid)
+                eccodes.codes_release(gid)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def benchmark_file(file_path: str, repeat: int = DEFAULT_REPEAT) -> Result:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repacked_path = os.path.join(temp_dir, os.path.basename(file_path))
+        result = repack_grib(file_path, repacked_path)
+        return Result(
+            os.path.basename(file_path),
+            result.messages,
+            result.repacked,
+            result.source_size,
+            result.size,
+            decode_seconds(file_path, repeat),
+            decode_seconds(repacked_path, repeat),
+        )
+
+
+def write_synthetic_grib(file_path: str, sample: str, fields: int):
+    """Writes smooth, simply packed 16 bit fields of a 1 degree grid"""
+    import eccodes
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    gid = eccodes.codes_grib_new_from_samples(sample)
+    try:
+        eccodes.codes_set(gid, "Ni", 360)
+        eccodes.codes_set(gid, "Nj", 181)
+        eccodes.codes_set(gid, "bitsPerValue", 16)
+        with open(file_path, "wb") as f:
+            for _ in range(fields):
+                values = np.cumsum(rng.random(360 * 181) * 0.01) % 5
+                eccodes.codes_set_values(gid, values)
+                eccodes.codes_write(gid, f)
+    finally:
+        eccodes.codes_release(gid)
+
+
+def format_results(results: List[Result]) -> str:
+    lines = [
+        f"{'file':<24} {'messages':>8} {'repacked':>8} {'size MB':>8} "
+        f"{'after':>8} {'decode s':>9} {'after':>9}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.file:<24} {r.messages:>8} {r.repacked:>8} "
+            f"{r.source_bytes / 1024**2:>8.2f} "
+            f"{r.repacked_bytes / 1024**2:>8.2f} "
+            f"{r.source_decode:>9.3f} {r.repacked_decode:>9.3f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="*", help="GRIB files to repack")
+    parser.add_argument("--repeat", default=DEFAULT_REPEAT, type=int)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = args.files
+        if not files:
+            for sample in ["GRIB1", "GRIB2"]:
+                file_path = os.path.join(temp_dir, f"synthetic_{sample}.grib")
+                write_synthetic_grib(file_path, sample, SYNTHETIC_FIELDS)
+                files.append(file_path)
+        print(
+            format_results(
+                [benchmark_file(file, args.repeat) for file in files]
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
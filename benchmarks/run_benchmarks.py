@@ -0,0 +1,192 @@
+"""
+Benchmarks the retrieval commands against the local stand-in services,
+reporting the wall time, the retrieved bytes per second and the peak
+resident memory of each retrieval mode.
+
+    python benchmarks/run_benchmarks.py --queue-delay 2 --payload-mb 16
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from standin_server import StandInConfig, StandInServer
+
+CLI_PATH: str = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "src", "data_retrieval")
+)
+
+
+class Mode(NamedTuple):
+    """A retrieval mode, run as the CLI arguments of a single command"""
+
+    name: str
+    args: List[str]
+    # Runs the command once beforehand, i.e. to fill the request cache
+    warm_up: bool = False
+
+
+# Every mode writes to its own local directory, appended to the arguments
+MODES: List[Mode] = [
+    Mode(
+        "cds-era5-sequential",
+        ["cds", "era5", "--years", "2015-2022", "--target-mb", "30"]
+        + ["--workers", "1", "--max-jobs", "1"],
+    ),
+    Mode(
+        "cds-era5-async",
+        ["cds", "era5", "--years", "2015-2022", "--target-mb", "30"]
+        + ["--workers", "4", "--max-jobs", "8"],
+    ),
+    Mode(
+        "cds-ecmwf-netcdf",
+        ["cds", "ecmwf", "--format", "netcdf", "--years", "2021-2022"]
+        + ["--workers", "4", "--max-jobs", "8"],
+    ),
+    Mode(
+        "cds-era5-cached",
+        ["cds", "era5", "--years", "2015-2022", "--target-mb", "30"]
+        + ["--workers", "4", "--cache-dir", "{cache_dir}"],
+        warm_up=True,
+    ),
+    Mode("mars-sequential", ["mars", "ETH", "--years", "2019-2022"]),
+    Mode(
+        "mars-parallel",
+        ["mars", "ETH", "--years", "2019-2022", "--workers", "4"],
+    ),
+]
+
+
+class Result(NamedTuple):
+    mode: str
+    wall_seconds: float
+    bytes: int
+    bytes_per_second: float
+    peak_rss_bytes: int
+    returncode: int
+    requests: int
+
+
+def run_mode(
+    mode: Mode, server: StandInServer, work_dir: str, verbose: bool = False
+) -> Result:
+    """Runs a mode in its own process, so its peak RSS is its own"""
+    env = {**os.environ, **server.environ()}
+    cache_dir = os.path.join(work_dir, "cache")
+    args = [arg.format(cache_dir=cache_dir) for arg in mode.args]
+
+    def run(local_path: str):
+        # Stand-in payloads are not GRIB, so they are neither counted
+        # nor indexed
+        command = [sys.executable, CLI_PATH, *args, "--no-verify"]
+        command += ["--no-index"]
+        command += ["--local", local_path]
+        output = None if verbose else subprocess.DEVNULL
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command, env=env, stdout=output, stderr=output
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return time.perf_counter() - started, usage, process.returncode
+
+    if mode.warm_up:
+        run(os.path.join(work_dir, "warm-up"))
+    submitted = server.stats["submitted"]
+    local_path = os.path.join(work_dir, "output")
+    wall, usage, returncode = run(local_path)
+    size = _directory_size(local_path)
+    return Result(
+        mode=mode.name,
+        wall_seconds=wall,
+        bytes=size,
+        bytes_per_second=size / wall if wall else 0.0,
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss_bytes=usage.ru_maxrss * 1024,
+        returncode=returncode,
+        requests=server.stats["submitted"] - submitted,
+    )
+
+
+def _directory_size(path: str) -> int:
+    size = 0
+    for root, _, file_names in os.walk(path):
+        for file_name in file_names:
+            if file_name != "manifest.json":
+                size += os.path.getsize(os.path.join(root, file_name))
+    return size
+
+
+def format_results(results: List[Result]) -> str:
+    lines = [
+        f"{'mode':<22} {'requests':>8} {'wall':>8} {'size':>10} "
+        f"{'rate':>10} {'peak rss':>10} {'status':>6}"
+    ]
+    for result in results:
+        lines.append(
+            f"{result.mode:<22} {result.requests:>8} "
+            f"{result.wall_seconds:>7.2f}s "
+            f"{result.bytes / 1024**2:>8.1f}MB "
+            f"{result.bytes_per_second / 1024**2:>6.1f}MB/s "
+            f"{result.peak_rss_bytes / 1024**2:>8.1f}MB "
+            f"{result.returncode:>6}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--modes",
+        nargs="*",
+        choices=[mode.name for mode in MODES],
+        help="Modes to run (default: all)",
+    )
+    parser.add_argument("--queue-delay", default=2.0, type=float)
+    parser.add_argument(
+        "--rate-mb",
+        help="Transfer rate of a single download in MB/s",
+        default=50.0,
+        type=float,
+    )
+    parser.add_argument("--failure-rate", default=0.0, type=float)
+    parser.add_argument("--payload-mb", default=8.0, type=float)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument(
+        "--verbose", help="Show the command output", action="store_true"
+    )
+    args = parser.parse_args(argv)
+
+    config = StandInConfig(
+        queue_delay=args.queue_delay,
+        transfer_rate=args.rate_mb * 1024**2 if args.rate_mb else None,
+        failure_rate=args.failure_rate,
+        payload_size=int(args.payload_mb * 1024**2),
+        seed=0,
+    )
+    modes = [m for m in MODES if not args.modes or m.name in args.modes]
+    results = []
+    with StandInServer(config) as server:
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as work_dir:
+                results.append(run_mode(mode, server, work_dir, args.verbose))
+            print(format_results(results[-1:]).splitlines()[-1], flush=True)
+
+    print()
+    print(format_results(results))
+    if args.json:
+        report: Dict = {
+            "config": config._asdict(),
+            "results": [result._asdict() for result in results],
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Local stand-in for the Copernicus CDS API (legacy protocol used by
+cdsapi) and the ECMWF web API (used by ecmwfapi for MARS), so that
+retrievals can run end-to-end offline with a controlled queue delay,
+transfer rate, failure rate and payload size.
+
+Run it on its own and export the printed variables to point the
+retrieval commands at it:
+
+    python benchmarks/standin_server.py --port 8765 --queue-delay 5
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+
+CDS_PATH: str = "/api/v2"
+ECMWF_PATH: str = "/v1"
+# Size of the chunks written when serving a payload
+CHUNK_SIZE: int = 64 * 1024
+
+
+class StandInConfig(NamedTuple):
+    """Behaviour of the stand-in services"""
+
+    # Seconds between the submission of a request and its completion
+    queue_delay: float = 0.0
+    # Download rate of a single transfer in bytes per second, or unlimited
+    transfer_rate: Optional[float] = None
+    # Share of the requests which fail on the server
+    failure_rate: float = 0.0
+    # Size of the file returned by every request in bytes
+    payload_size: int = 1024 * 1024
+    seed: Optional[int] = None
+
+
+class _Job:
+    def __init__(self, job_id: str, ready_at: float, failed: bool):
+        self.job_id = job_id
+        self.ready_at = ready_at
+        self.failed = failed
+
+    @property
+    def ready(self) -> bool:
+        return time.monotonic() >= self.ready_at
+
+
+class StandInServer:
+    """
+    Serves both APIs from one threaded HTTP server, on a free port
+    unless one is given. Use 'environ' to point cdsapi and ecmwfapi
+    at it.
+    """
+
+    def __init__(
+        self,
+        config: StandInConfig = StandInConfig(),
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.config = config
+        self.jobs: Dict[str, _Job] = {}
+        self.stats = {"submitted": 0, "failed": 0, "bytes_served": 0}
+        self._ids = itertools.count(1)
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        # Served payloads repeat a random block, so they do not compress
+        self._block = random.Random(config.seed).randbytes(CHUNK_SIZE)
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self) -> Dict[str, str]:
+        """Environment variables which point the API clients at the server"""
+        return {
+            "CDSAPI_URL": self.url + CDS_PATH,
+            "CDSAPI_KEY": "1:standin",
+            "ECMWF_API_URL": self.url + ECMWF_PATH,
+            "ECMWF_API_KEY": "standin",
+            "ECMWF_API_EMAIL": "standin@localhost",
+        }
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def serve_forever(self):
+        """Serves in the calling thread until interrupted"""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self) -> _Job:
+        with self._lock:
+            job_id = f"standin-{next(self._ids)}"
+            failed = self._random.random() < self.config.failure_rate
+            job = _Job(
+                job_id, time.monotonic() + self.config.queue_delay, failed
+            )
+            self.jobs[job_id] = job
+            self.stats["submitted"] += 1
+            self.stats["failed"] += failed
+        return job
+
+    def write_payload(self, wfile, start: int = 0):
+        """Writes the payload from 'start', at the configured rate"""
+        rate = self.config.transfer_rate
+        began = time.monotonic()
+        sent = 0
+        position = start
+        while position < self.config.payload_size:
+            size = min(CHUNK_SIZE, self.config.payload_size - position)
+            offset = position % CHUNK_SIZE
+            chunk = (self._block[offset:] + self._block[:offset])[:size]
+            wfile.write(chunk)
+            sent += size
+            position += size
+            if rate:
+                delay = sent / rate - (time.monotonic() - began)
+                if delay > 0:
+                    time.sleep(delay)
+        with self._lock:
+            self.stats["bytes_served"] += sent
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def standin(self) -> StandInServer:
+        return self.server.standin
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def _route(self, method: str):
+        path = urlparse(self.path).path
+        routes = [
+            ("GET", rf"{CDS_PATH}/status\.json", self._cds_status),
+            (
+                "POST",
+                rf"{CDS_PATH}/resources/(?P<name>[^/]+)",
+                self._cds_submit,
+            ),
+            ("GET", rf"{CDS_PATH}/tasks/(?P<job_id>[^/]+)", self._cds_task),
+            ("DELETE", rf"{CDS_PATH}/tasks/(?P<job_id>[^/]+)", self._deleted),
+            ("GET", rf"{ECMWF_PATH}/who-am-i", self._ecmwf_user),
+            ("GET", rf"{ECMWF_PATH}/(services/[^/]+/)?info", self._ecmwf_info),
+            ("GET", rf"{ECMWF_PATH}/services/[^/]+/news", self._ecmwf_news),
+            (
+                "POST",
+                rf"{ECMWF_PATH}/services/[^/]+/requests",
+                self._ecmwf_submit,
+            ),
+            (
+                "GET",
+                rf"{ECMWF_PATH}/services/[^/]+/requests/(?P<job_id>[^/]+)",
+                self._ecmwf_request,
+            ),
+            (
+                "DELETE",
+                rf"{ECMWF_PATH}/services/[^/]+/requests/(?P<job_id>[^/]+)",
+                self._deleted,
+            ),
+            ("GET", r"/download/(?P<job_id>[^/]+)", self._download),
+        ]
+        self._read_body()
+        for route_method, pattern, handler in routes:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                handler(**match.groupdict())
+                return
+        self._send_json(404, {"message": f"Not found: {method} {path}"})
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(
+        self, code: int, body, headers: Optional[Dict[str, str]] = None
+    ):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _job(self, job_id: str) -> Optional[_Job]:
+        job = self.standin.jobs.get(job_id)
+        if job is None:
+            self._send_json(404, {"message": f"Unknown request {job_id}"})
+        return job
+
+    def _deleted(self, job_id: str):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _download(self, job_id: str):
+        if self._job(job_id) is None:
+            return
+        size = self.standin.config.payload_size
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = min(int(match.group(1)), size)
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{size - 1}/{size}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        self.standin.write_payload(self.wfile, start)
+
+    # Legacy CDS API
+
+    def _cds_status(self):
+        self._send_json(200, {})
+
+    def _cds_submit(self, name: str):
+        self._send_json(200, self._cds_reply(self.standin.submit()))
+
+    def _cds_task(self, job_id: str):
+        job = self._job(job_id)
+        if job is not None:
+            self._send_json(200, self._cds_reply(job))
+
+    def _cds_reply(self, job: _Job):
+        if not job.ready:
+            return {"state": "running", "request_id": job.job_id}
+        if job.failed:
+            return {
+                "state": "failed",
+                "request_id": job.job_id,
+                "error": {
+                    "message": "Stand-in request failed",
+                    "reason": "Configured failure rate",
+                },
+            }
+        return {
+            "state": "completed",
+            "request_id": job.job_id,
+            "location": f"/download/{job.job_id}",
+            "content_length": self.standin.config.payload_size,
+            "content_type": "application/x-grib",
+        }
+
+    # ECMWF web API
+
+    def _ecmwf_user(self):
+        self._send_json(200, {"uid": "standin", "full_name": "Stand-in"})
+
+    def _ecmwf_info(self):
+        self._send_json(200, {"info": {}})
+
+    def _ecmwf_news(self):
+        self._send_json(200, {"news": ""})
+
+    def _ecmwf_submit(self):
+        job = self.standin.submit()
+        self._ecmwf_reply(job, 202)
+
+    def _ecmwf_request(self, job_id: str):
+        job = self._job(job_id)
+        if job is not None:
+            self._ecmwf_reply(job, 200 if job.ready else 202)
+
+    def _ecmwf_reply(self, job: _Job, code: int):
+        remaining = max(0.0, job.ready_at - time.monotonic())
+        headers = {
+            "Location": f"{ECMWF_PATH}/services/mars/requests/{job.job_id}",
+            # ecmwfapi waits this many whole seconds before polling again
+            "Retry-After": str(math.ceil(remaining)),
+        }
+        if code != 200:
+            body = {"status": "active", "name": job.job_id}
+        elif job.failed:
+            body = {"status": "aborted", "error": "Stand-in request failed"}
+        else:
+            body = {
+                "status": "complete",
+                "name": job.job_id,
+                "result": {
+                    "href": f"/download/{job.job_id}",
+                    "size": self.standin.config.payload_size,
+                },
+            }
+        self._send_json(code, body, headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument(
+        "--queue-delay",
+        help="Seconds from submission to completion of every request",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--rate-mb",
+        help="Transfer rate of a single download in MB/s (default: unlimited)",
+        type=float,
+    )
+    parser.add_argument(
+        "--failure-rate",
+        help="Share of the requests which fail",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--payload-mb",
+        help="Size of the file returned by every request in MB",
+        default=1.0,
+        type=float,
+    )
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        queue_delay=args.queue_delay,
+        transfer_rate=args.rate_mb * 1024**2 if args.rate_mb else None,
+        failure_rate=args.failure_rate,
+        payload_size=int(args.payload_mb * 1024**2),
+    )
+    server = StandInServer(config, args.host, args.port)
+    for key, value in server.environ().items():
+        print(f"export {key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
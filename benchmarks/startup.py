@@ -0,0 +1,123 @@
+"""
+Benchmarks the startup time of the retrieval commands which return
+without retrieving anything, the help, plans and argument errors,
+and fails if any of them takes longer than the budget.
+
+    python benchmarks/startup.py --repeat 5 --budget 0.5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, NamedTuple, Optional, Set
+
+CLI_PATH: str = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "src", "data_retrieval")
+)
+# Seconds a command may take to start and return
+DEFAULT_BUDGET: float = 0.5
+DEFAULT_REPEAT: int = 5
+# Modules which none of the commands below should need to import
+HEAVY_MODULES: Set[str] = {
+    "azure.storage.blob",
+    "cdsapi",
+    "ecmwfapi",
+    "eccodes",
+    "geopandas",
+    "pandas",
+    "pyarrow",
+    "requests",
+    "zarr",
+}
+
+COMMANDS: List[List[str]] = [
+    ["--help"],
+    ["cds", "era5", "--help"],
+    ["cds", "era5", "--years", "2015-2022", "--plan"],
+    ["cds", "ecmwf", "--years", "2021-2022", "--plan"],
+    ["mars", "ETH", "--years", "2019-2022", "--plan"],
+    ["sync", "--help"],
+    # Rejected arguments
+    ["cds", "era5", "--years", "2022-2015"],
+]
+
+
+class Result(NamedTuple):
+    command: str
+    median_seconds: float
+    min_seconds: float
+    returncode: int
+
+
+def run_command(args: List[str], repeat: int = DEFAULT_REPEAT) -> Result:
+    """Runs a command 'repeat' times in a new process, timing each run"""
+    timings = []
+    returncode = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        returncode = subprocess.run(
+            [sys.executable, CLI_PATH, *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return Result(
+        " ".join(args), timings[len(timings) // 2], timings[0], returncode
+    )
+
+
+def imported_modules(args: List[str]) -> Set[str]:
+    """Returns the modules a command imports, as reported by -X importtime"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", CLI_PATH, *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return {
+        line.rsplit("|", 1)[-1].strip()
+        for line in process.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+
+
+def format_results(results: List[Result], budget: float) -> str:
+    lines = [f"{'command':<48} {'median':>8} {'min':>8} {'status':>6}"]
+    for result in results:
+        over = " over budget" if result.median_seconds > budget else ""
+        lines.append(
+            f"{result.command:<48} {result.median_seconds:>7.3f}s "
+            f"{result.min_seconds:>7.3f}s {result.returncode:>6}{over}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", default=DEFAULT_REPEAT, type=int)
+    parser.add_argument(
+        "--budget",
+        help="Median seconds allowed per command",
+        default=DEFAULT_BUDGET,
+        type=float,
+    )
+    args = parser.parse_args(argv)
+
+    results = [run_command(command, args.repeat) for command in COMMANDS]
+    print(format_results(results, args.budget))
+
+    failed = False
+    for command in COMMANDS:
+        heavy = sorted(HEAVY_MODULES & imported_modules(command))
+        if heavy:
+            failed = True
+            print(f"{' '.join(command)} imports {', '.join(heavy)}")
+    failed |= any(r.median_seconds > args.budget for r in results)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,28 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 import xarray as xr
 
+# Extensions of netCDF files, the retrieval writes '.netcdf' files
+NETCDF_EXTENSIONS = (".nc", ".netcdf")
+
 
 def _load_climate_data(input_file_path, bbox=None, filter_value=None):
     """
         Loads climate data from an input file
         and returns it on a xarray format.
-        For the moment only grib files are accepted,
-        but this function can be adapted to cover other file formats.
+        For the moment only grib and netcdf files are accepted,
+        but _open_climate_data can be adapted to cover other file formats.
 
     Parameters
     ----------
-        input_file_path: str, Path to the climate data to be loaded
+        input_file_path: str, Path to the climate data to be loaded,
+        or URL of a blob, read through the local block cache
         bbox: float list,
         Coordinates of the bounding box containing the zone of interest
         filter_value: int, When loading ECMWF data,
@@ -25,13 +34,71 @@ def _load_climate_data(input_file_path, bbox=None, filter_value=None):
 
     """
 
-    # Load climate data (grib or netcdf) into pandas dataframe.
+    with _open_climate_data(input_file_path, filter_value) as (
+        input_xr,
+        selected,
+    ):
+        return _select_climate_data(
+            input_xr, bbox, None if selected else filter_value
+        ).load()
+
+
+@contextmanager
+def _open_climate_data(input_file_path, filter_value=None):
+    """
+        Opens climate data lazily, only the values selected are read
+        when used, and closes it on exit. Opening a file once to select
+        each ensemble model number in turn avoids reading it again.
+
+    Parameters
+    ----------
+        input_file_path: str, Path to the climate data to be opened,
+        or URL of a blob, read through the local block cache
+        filter_value: int, When loading ECMWF data,
+        ensemble model number which may be the only one opened
+
+        Yields
+    -------
+        Dataset, Tuple of a lazy xarray with the data of the file,
+        and whether it is already filtered on the ensemble model number
+
+    """
+    from src.data_retrieval.azure_blob_utils import is_blob_url
+
+    if is_blob_url(input_file_path):
+        with _open_blob_climate_data(input_file_path, filter_value) as opened:
+            yield opened
+        return
+
     # Change this function if another data format is used
     if input_file_path.endswith(".grib"):
-        input_xr = xr.open_dataset(input_file_path, engine="cfgrib")
-    elif input_file_path.endswith(".nc"):
-        input_xr = xr.open_dataset(input_file_path)
+        engine = "cfgrib"
+    elif input_file_path.endswith(NETCDF_EXTENSIONS):
+        engine = None
+    else:
+        raise ValueError(f"Unsupported climate data file {input_file_path}")
+    with xr.open_dataset(input_file_path, engine=engine) as input_xr:
+        yield input_xr, False
+
+
+def _select_climate_data(input_xr, bbox=None, filter_value=None):
+    """
+        Selects an ensemble model number and the grid points of a zone
+        of climate data, lazily if it is opened lazily.
 
+    Parameters
+    ----------
+        input_xr: Dataset, A xarray with climate data
+        bbox: float list,
+        Coordinates of the bounding box containing the zone of interest
+        filter_value: int, When loading ECMWF data,
+        value used to filter ensemble model number
+
+        Returns
+    -------
+        Dataset, A xarray with the selected data
+
+    """
     # Filter only one ensemble model number when loading ECMWF
     if filter_value is not None:
         input_xr = input_xr.sel(number=filter_value)
@@ -56,6 +123,80 @@ def _load_climate_data(input_file_path, bbox=None, filter_value=None):
     return input_xr
 
 
+@contextmanager
+def _open_blob_climate_data(blob_url, filter_value=None):
+    """
+        Opens climate data from a blob lazily, fetching only the blocks
+        read. A netcdf blob is read in place, with h5netcdf as it reads
+        netCDF4 files from file objects. A grib file is copied to a
+        temporary file for cfgrib, which is removed on exit, with only
+        the messages of the ensemble model number when one is given
+        and the sidecar index is next to the file.
+
+    Parameters
+    ----------
+        blob_url: str, URL of the climate data blob to be opened
+        filter_value: int, When loading ECMWF data,
+        ensemble model number which may be the only one copied
+
+        Yields
+    -------
+        Dataset, Tuple of a lazy xarray with the data contained in the
+        blob, and whether it is already filtered on the ensemble model
+        number
+
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    from src.data_retrieval.azure_blob_utils import (
+        get_blob_url_with_suffix,
+        open_blob,
+    )
+    from src.data_retrieval.cds.index import (
+        INDEX_SUFFIX,
+        parse_grib_index,
+        read_messages,
+        select_messages,
+    )
+
+    blob_path = blob_url.split("?", 1)[0]
+    if blob_path.endswith(NETCDF_EXTENSIONS):
+        with open_blob(blob_url) as f, xr.open_dataset(
+            f, engine="h5netcdf"
+        ) as input_xr:
+            yield input_xr, False
+        return
+
+    entries = None
+    if filter_value is not None:
+        # The index only helps to read the messages of one model
+        try:
+            with open_blob(
+                get_blob_url_with_suffix(blob_url, INDEX_SUFFIX)
+            ) as f:
+                entries = parse_grib_index(
+                    f.read().decode("utf-8").splitlines()
+                )
+        except ResourceNotFoundError:
+            # Without an index, the whole file is read through the cache
+            print(f"No index of {blob_path}, reading all its messages")
+    if entries is not None:
+        entries = select_messages(entries, number=filter_value)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        grib_path = os.path.join(temp_dir, "data.grib")
+        with open_blob(blob_url) as source, open(grib_path, "wb") as target:
+            if entries is None:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            else:
+                for message in read_messages(source, entries):
+                    target.write(message)
+        with xr.open_dataset(
+            grib_path, engine="cfgrib", backend_kwargs={"indexpath": ""}
+        ) as input_xr:
+            yield input_xr, entries is not None
+
+
 def _create_reference_grid(input_df, admin_df, admin_code_label):
     """
         Create a reference lat/lon grid based on the ECMWF grid.
@@ -232,104 +373,112 @@ def pre_process_ecmwf_data(
     admin_df = gpd.read_file(admin_boundary_file_path)
     bbox = admin_df.geometry.unary_union.bounds
 
-    # Load each ensemble model separately
-    # for batch_number in range(0,51):
-    for batch_number in range(0, 51):
-
-        # Prints out progress
-        if batch_number % 10 == 0:
-            print(str(batch_number) + "/50")
-
-        # Load ECMWF grib file (for one model at a time)
-        input_xr = _load_climate_data(input_file_path, bbox, batch_number)
-        # Converts ECMWF dataset into a dataframe
-        df = input_xr.to_dataframe().dropna().reset_index()
-
-        # Each data source uses a different unit
-        # (meters/day for ERA5 and meters/second for ECMWF).
-        # Converting both into mm/day here
-        df["tp_mm_day"] = df["tprate"] * 1000 * 60 * 60 * 24
-
-        # Compute lead time in months for ECMWF
-        df["lead_time"] = 0
-        for lead_days in df["step"].unique():
-            lead_months = round(
-                float(str(lead_days).split(" ")[0]) / 30
-            )  # converting lead time in days into months
-            df.loc[df["step"] == lead_days, "lead_time"] = lead_months
-
-        # Correct valid time convention -
-        # ECMWF prediction month ends on
-        # the valid_time date so there is a 1-month shift
-        df["valid_time_year"] = df["valid_time"].apply(lambda x: x.year)
-        df["valid_time_month"] = df["valid_time"].apply(lambda x: x.month - 1)
-        df.loc[df["valid_time_month"] == 0, "valid_time_year"] = (
-            df.loc[df["valid_time_month"] == 0, "valid_time_year"] - 1
-        )
-        df.loc[df["valid_time_month"] == 0, "valid_time_month"] = 12
-
-        # link to reference grid and retrieve pixel hash code and admin1 pcode
-        df["pixel_geom_id"] = (
-            df["latitude"].astype("str") + "-" + df["longitude"].astype("str")
-        )
-        df["pixel_geom_id"] = df["pixel_geom_id"].apply(lambda x: hash(x))
-        lat_lon_df = df[["latitude", "longitude", "pixel_geom_id"]].copy()
-        lat_lon_df = lat_lon_df.drop_duplicates()
-
-        # Computes a reference grid by
-        # linking grid points to administrative boundaries.
-        # Only done once as all the ensemble models use the same spatial grid
-        if batch_number == 0:
-            grid_df = _create_reference_grid(
-                lat_lon_df, admin_df, admin_code_label
+    # Open the ECMWF grib file once, its models are read one at a time
+    with _open_climate_data(input_file_path) as (ecmwf_xr, _):
+        # Load each ensemble model separately
+        for batch_number in range(0, 51):
+
+            # Prints out progress
+            if batch_number % 10 == 0:
+                print(str(batch_number) + "/50")
+
+            # Load ECMWF grib file (for one model at a time)
+            input_xr = _select_climate_data(ecmwf_xr, bbox, batch_number)
+            # Converts ECMWF dataset into a dataframe
+            df = input_xr.to_dataframe().dropna().reset_index()
+
+            # Each data source uses a different unit
+            # (meters/day for ERA5 and meters/second for ECMWF).
+            # Converting both into mm/day here
+            df["tp_mm_day"] = df["tprate"] * 1000 * 60 * 60 * 24
+
+            # Compute lead time in months for ECMWF
+            df["lead_time"] = 0
+            for lead_days in df["step"].unique():
+                lead_months = round(
+                    float(str(lead_days).split(" ")[0]) / 30
+                )  # converting lead time in days into months
+                df.loc[df["step"] == lead_days, "lead_time"] = lead_months
+
+            # Correct valid time convention -
+            # ECMWF prediction month ends on
+            # the valid_time date so there is a 1-month shift
+            df["valid_time_year"] = df["valid_time"].apply(lambda x: x.year)
+            df["valid_time_month"] = df["valid_time"].apply(
+                lambda x: x.month - 1
+            )
+            df.loc[df["valid_time_month"] == 0, "valid_time_year"] = (
+                df.loc[df["valid_time_month"] == 0, "valid_time_year"] - 1
+            )
+            df.loc[df["valid_time_month"] == 0, "valid_time_month"] = 12
+
+            # link to reference grid
+            # and retrieve pixel hash code and admin1 pcode
+            df["pixel_geom_id"] = (
+                df["latitude"].astype("str")
+                + "-"
+                + df["longitude"].astype("str")
+            )
+            df["pixel_geom_id"] = df["pixel_geom_id"].apply(lambda x: hash(x))
+            lat_lon_df = df[["latitude", "longitude", "pixel_geom_id"]].copy()
+            lat_lon_df = lat_lon_df.drop_duplicates()
+
+            # Computes a reference grid by
+            # linking grid points to administrative boundaries.
+            # Only done once as all the ensemble models
+            # use the same spatial grid
+            if batch_number == 0:
+                grid_df = _create_reference_grid(
+                    lat_lon_df, admin_df, admin_code_label
+                )
+
+            # Link_df is a MxN link table between grid points
+            # and administrative boundaries.
+            # The groupby allows to drop grid points duplicate
+            # in the first case
+            # or aggregate into admin boundaries in the second one
+
+            link_df = pd.merge(
+                df, grid_df, on="pixel_geom_id", suffixes=("", "_bis")
             )
 
-        # Link_df is a MxN link table between grid points
-        # and administrative boundaries.
-        # The groupby allows to drop grid points duplicate in the first case
-        # or aggregate into admin boundaries in the second one
-
-        link_df = pd.merge(
-            df, grid_df, on="pixel_geom_id", suffixes=("", "_bis")
-        )
-
-        batch_data_grid_df = (
-            link_df.groupby(
-                [
-                    "pixel_geom_id",
-                    "latitude",
-                    "longitude",
-                    "number",
-                    "valid_time_year",
-                    "valid_time_month",
-                    "lead_time",
-                ]
-            )["tp_mm_day"]
-            .mean()
-            .reset_index()
-        )
+            batch_data_grid_df = (
+                link_df.groupby(
+                    [
+                        "pixel_geom_id",
+                        "latitude",
+                        "longitude",
+                        "number",
+                        "valid_time_year",
+                        "valid_time_month",
+                        "lead_time",
+                    ]
+                )["tp_mm_day"]
+                .mean()
+                .reset_index()
+            )
 
-        batch_data_adm_df = (
-            link_df.groupby(
-                [
-                    "adm_pcode",
-                    "number",
-                    "valid_time_year",
-                    "valid_time_month",
-                    "lead_time",
-                ]
-            )["tp_mm_day"]
-            .mean()
-            .reset_index()
-        )
+            batch_data_adm_df = (
+                link_df.groupby(
+                    [
+                        "adm_pcode",
+                        "number",
+                        "valid_time_year",
+                        "valid_time_month",
+                        "lead_time",
+                    ]
+                )["tp_mm_day"]
+                .mean()
+                .reset_index()
+            )
 
-        # Concatenate all ensemble model into a single DataFrame
-        if batch_number == 0:
-            data_grid_df = batch_data_grid_df
-            data_adm_df = batch_data_adm_df
-        else:
-            data_grid_df = pd.concat([data_grid_df, batch_data_grid_df])
-            data_adm_df = pd.concat([data_adm_df, batch_data_adm_df])
+            # Concatenate all ensemble model into a single DataFrame
+            if batch_number == 0:
+                data_grid_df = batch_data_grid_df
+                data_adm_df = batch_data_adm_df
+            else:
+                data_grid_df = pd.concat([data_grid_df, batch_data_grid_df])
+                data_adm_df = pd.concat([data_adm_df, batch_data_adm_df])
 
     data_grid_df.reset_index(inplace=True, drop=True)
     data_adm_df.reset_index(inplace=True, drop=True)
@@ -1,14 +1,102 @@
 import argparse
+import json
 import os
-from typing import Optional
+import posixpath
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, as_completed
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from azure_blob_utils import load_env_vars, upload_stream
-from cds.ecmwf import download_ecmwf_cds
-from cds.era5 import download_era5_cds
-from cds.mars import download_ecmwf_mars, get_country_bbox_df
-from util import get_logger, setup_output_path
+from azure_blob_utils import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_BULK_WORKERS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_READ_TIMEOUT,
+    configure_blob_transfers,
+    download_files,
+    get_blob_properties,
+    load_env_vars,
+    read_blob_bytes,
+    sync_directory,
+    upload_file_in_blocks,
+    upload_files,
+    upload_stream,
+)
+from cds.areas import (
+    DEFAULT_AREA_BUFFER,
+    DEFAULT_MAX_OVERHEAD,
+    bbox_center,
+    bbox_contains_point,
+    get_boundary_bbox,
+    group_bboxes,
+    parse_bbox,
+    snap_bbox,
+    union_bbox,
+)
+from cds.cache import DEFAULT_MAX_BYTES, configure_cache
+from cds.common import format_span
+from cds.ecmwf import get_ecmwf_cds_file_name
+from cds.index import (
+    build_grib_index,
+    configure_indexing,
+    get_index_path,
+    is_indexing_enabled,
+)
+from cds.jobs import DEFAULT_MAX_ACTIVE_JOBS, CdsJobRunner
+from cds.mars import DEFAULT_GRID
+from cds.planner import (
+    ECMWF_CDS_GRID,
+    ERA5_CDS_GRID,
+    PlannedRequest,
+    download_planned_request,
+    format_plan,
+    plan_ecmwf_cds,
+    plan_ecmwf_mars,
+    plan_era5_cds,
+)
+from cds.repack import configure_repacking, is_repacking_enabled, repack_grib
+from cds.retry import DEFAULT_RETRIES, configure_retries
+from cds.scheduler import (
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_SERVICE_LIMITS,
+    PRIORITIES,
+    JobQueue,
+    format_jobs,
+    get_queue_db,
+    run_scheduler,
+)
+from cds.telemetry import (
+    configure_telemetry,
+    format_telemetry_summary,
+    read_telemetry,
+    record_span,
+    telemetry_context,
+)
+from cds.verify import configure_verification
+from manifest import MANIFEST_FILE_NAME, Manifest, file_md5
+from util import (
+    TaskOutcome,
+    get_logger,
+    parse_years,
+    run_pipeline,
+    setup_output_path,
+)
 
 logger = get_logger(__name__)
+# Partitions which failed in this run, which then exits with status 1
+_failed_partitions: List[str] = []
 
 parser = argparse.ArgumentParser(
     description="Download data from ECMWF MARS and Copernicus CDS"
@@ -17,8 +105,199 @@ subparsers = parser.add_subparsers(
     dest="command", required=True, help="Data stores"
 )
 
-parser_cds = subparsers.add_parser("cds", help="Copernicus CDS")
-parser_mars = subparsers.add_parser("mars", help="ECMWF MARS")
+# Options shared by all data stores
+parser_common = argparse.ArgumentParser(add_help=False)
+parser_common.add_argument(
+    "--cache-dir",
+    help="Directory of the request cache, repeated requests are served "
+    "from it instead of the data store (default: $DATA_RETRIEVAL_CACHE_DIR)",
+    type=str,
+)
+parser_common.add_argument(
+    "--cache-max-gb",
+    help="Size limit of the request cache in GB",
+    default=DEFAULT_MAX_BYTES / 1024**3,
+    type=float,
+)
+parser_common.add_argument(
+    "--retries",
+    help="Retries of a failed or incomplete request, with backoff",
+    default=DEFAULT_RETRIES,
+    type=int,
+)
+parser_common.add_argument(
+    "--no-verify",
+    help="Do not count the messages of retrieved GRIB files",
+    action="store_true",
+)
+parser_common.add_argument(
+    "--no-index",
+    help="Do not write a sidecar index of the messages of GRIB files",
+    action="store_true",
+)
+parser_common.add_argument(
+    "--repack",
+    help="Repack GRIB files losslessly before storing them, GRIB 2 "
+    "messages with CCSDS and GRIB 1 messages with second-order packing, "
+    "recording the checksum of the original. Off by default, as it trades "
+    "decoding speed for size: files are about half the size, but decode "
+    "about 1.8 times slower. For ECMWF seasonal forecasts which are read "
+    "often, use --to-zarr instead",
+    action="store_true",
+)
+parser_common.add_argument(
+    "--blob-concurrency",
+    help="Parallel connections used by each blob upload",
+    default=DEFAULT_MAX_CONCURRENCY,
+    type=int,
+)
+parser_common.add_argument(
+    "--blob-block-mb",
+    help="Size of the blocks of blob uploads in MB",
+    default=DEFAULT_BLOCK_SIZE / 1024**2,
+    type=float,
+)
+parser_common.add_argument(
+    "--blob-timeout",
+    help="Read timeout of blob transfers in seconds",
+    default=DEFAULT_READ_TIMEOUT,
+    type=int,
+)
+parser_common.add_argument(
+    "--telemetry",
+    help="Append a JSON line per request and blob transfer to this file "
+    "(default: $DATA_RETRIEVAL_TELEMETRY_FILE)",
+    type=str,
+)
+parser_common.add_argument(
+    "--plan",
+    help="Print the planned requests and their estimated volume "
+    "without retrieving anything",
+    action="store_true",
+)
+parser_common.add_argument(
+    "--target-mb",
+    help="Split or merge requests to about this estimated size in MB "
+    "(default: one request per file as listed in the docs)",
+    type=float,
+)
+parser_common.add_argument(
+    "--years",
+    help="Years to retrieve, i.e. 2023-2024 or 1981-1990,2023 "
+    "(default: the full period of the data set)",
+    type=parse_years,
+)
+parser_common.add_argument(
+    "--enqueue",
+    help="Add the command to the job queue, run by 'scheduler run' "
+    "within the limits of each service, instead of running it now",
+    action="store_true",
+)
+parser_common.add_argument(
+    "--priority",
+    help="Priority of the command in the job queue",
+    choices=list(PRIORITIES),
+    default="operational",
+)
+parser_common.add_argument(
+    "--queue-db",
+    help="Database of the job queue (default: $DATA_RETRIEVAL_QUEUE_DB "
+    "or ~/.data_retrieval/jobs.sqlite)",
+    type=str,
+)
+
+parser_cds = subparsers.add_parser(
+    "cds", help="Copernicus CDS", parents=[parser_common]
+)
+parser_mars = subparsers.add_parser(
+    "mars", help="ECMWF MARS", parents=[parser_common]
+)
+parser_telemetry = subparsers.add_parser(
+    "telemetry", help="Summarise the telemetry of retrieval runs"
+)
+
+parser_scheduler = subparsers.add_parser(
+    "scheduler", help="Run or list the commands of the job queue"
+)
+parser_sync = subparsers.add_parser(
+    "sync",
+    help="Transfer the changed files between a directory and the container",
+)
+
+parser_telemetry.add_argument(
+    "file", help="Telemetry file written with --telemetry", type=str
+)
+parser_telemetry.add_argument(
+    "--run", help="Only summarise the run with this id", type=str
+)
+parser_telemetry.add_argument(
+    "--top",
+    help="Number of slowest requests and transfers to list",
+    default=5,
+    type=int,
+)
+
+parser_scheduler.add_argument(
+    "action",
+    choices=["run", "status"],
+    help="Run the queued commands, or list the jobs of the queue",
+)
+parser_scheduler.add_argument(
+    "--queue-db",
+    help="Database of the job queue (default: $DATA_RETRIEVAL_QUEUE_DB "
+    "or ~/.data_retrieval/jobs.sqlite)",
+    type=str,
+)
+parser_scheduler.add_argument(
+    "--cds-jobs",
+    help="Requests kept active on the CDS by all commands together",
+    default=DEFAULT_SERVICE_LIMITS["cds"],
+    type=int,
+)
+parser_scheduler.add_argument(
+    "--mars-jobs",
+    help="Requests kept active on MARS by all commands together",
+    default=DEFAULT_SERVICE_LIMITS["mars"],
+    type=int,
+)
+parser_scheduler.add_argument(
+    "--poll-interval",
+    help="Seconds between checks of the queue and of the running commands",
+    default=DEFAULT_POLL_INTERVAL,
+    type=float,
+)
+parser_scheduler.add_argument(
+    "--until-empty",
+    help="Stop once no job is queued or running, i.e. from cron",
+    action="store_true",
+)
+parser_scheduler.add_argument(
+    "--all",
+    help="List the finished jobs too",
+    action="store_true",
+)
+
+parser_sync.add_argument("local", help="Local directory", type=str)
+parser_sync.add_argument(
+    "prefix", help="Blob path prefix in the container", type=str
+)
+parser_sync.add_argument(
+    "--direction",
+    choices=["up", "down", "both"],
+    default="both",
+    help="Upload, download, or both, the most recent copy winning",
+)
+parser_sync.add_argument(
+    "--workers",
+    help="Files transferred at once",
+    default=DEFAULT_BULK_WORKERS,
+    type=int,
+)
+parser_sync.add_argument(
+    "--dry-run",
+    help="Only list the files which would be transferred",
+    action="store_true",
+)
 
 parser_cds.add_argument("type", choices=["ecmwf", "era5"], help="Data types")
 parser_cds.add_argument(
@@ -36,10 +315,77 @@ parser_cds.add_argument(
     help="Flag to upload data to cloud instead of saving locally",
     action="store_true",
 )
+parser_cds.add_argument(
+    "--workers",
+    help="Number of requests to keep in flight at once",
+    default=1,
+    type=int,
+)
+parser_cds.add_argument(
+    "--max-jobs",
+    help="Number of CDS jobs to keep queued or running on the server at "
+    "once, all requests are submitted up front and downloaded on "
+    "--workers threads as soon as they complete",
+    default=DEFAULT_MAX_ACTIVE_JOBS,
+    type=int,
+)
+parser_cds.add_argument(
+    "--upload-workers",
+    help="Number of concurrent uploads when running with --upload",
+    default=1,
+    type=int,
+)
+parser_cds.add_argument(
+    "--to-zarr",
+    help="Also convert the retrieved GRIB files to a chunked Zarr store "
+    "next to them (ECMWF seasonal forecast only)",
+    action="store_true",
+)
+parser_cds.add_argument(
+    "--iso",
+    nargs="+",
+    help="Only retrieve the area around these countries, "
+    "see docs for the list of supported countries",
+    default=[],
+    type=str,
+)
+parser_cds.add_argument(
+    "--region",
+    help="Only retrieve the area around this N/W/S/E bounding box",
+    type=str,
+)
+parser_cds.add_argument(
+    "--boundary",
+    help="Only retrieve the area around the shapes of this boundary file, "
+    "i.e. a Shapefile or GeoJSON of admin areas",
+    type=str,
+)
+parser_cds.add_argument(
+    "--area-buffer",
+    help="Degrees retrieved around the countries, region or boundaries, "
+    "the area is then widened to the grid of the data set",
+    default=DEFAULT_AREA_BUFFER,
+    type=float,
+)
 
 parser_mars.add_argument(
     "iso",
-    help="Country ISO code. See docs for the list of supported countries",
+    nargs="*",
+    help="Country ISO code, or several for a batch. "
+    "See docs for the list of supported countries",
+)
+parser_mars.add_argument(
+    "--region",
+    help="Retrieve every country whose bounding box centre lies within "
+    "this N/W/S/E area, as a batch",
+    type=str,
+)
+parser_mars.add_argument(
+    "--max-overhead",
+    help="Largest share of extra grid points accepted when merging "
+    "country areas of a batch into a single request",
+    default=DEFAULT_MAX_OVERHEAD,
+    type=float,
 )
 parser_mars.add_argument(
     "--local", help="Local directory path to save files", type=str
@@ -49,88 +395,99 @@ parser_mars.add_argument(
     help="Flag to upload data to cloud instead of saving locally",
     action="store_true",
 )
+parser_mars.add_argument(
+    "--workers",
+    help="Number of MARS requests to keep in flight at once",
+    default=1,
+    type=int,
+)
+parser_mars.add_argument(
+    "--upload-workers",
+    help="Number of concurrent uploads when running with --upload",
+    default=1,
+    type=int,
+)
+parser_mars.add_argument(
+    "--to-zarr",
+    help="Also convert the retrieved GRIB files to a chunked Zarr store "
+    "next to them (single country only)",
+    action="store_true",
+)
 
 
 def get_cds_ecmwf(
     local_path: Optional[str] = None,
     upload: bool = False,
     format: str = "grib",
+    workers: int = 1,
+    upload_workers: int = 1,
+    years: Optional[List[int]] = None,
+    target_bytes: Optional[int] = None,
+    plan_only: bool = False,
+    max_jobs: int = DEFAULT_MAX_ACTIVE_JOBS,
+    to_zarr: bool = False,
+    area: Optional[str] = None,
+    area_name: Optional[str] = None,
 ):
+    if to_zarr and format != "grib":
+        logger.error("Only GRIB files can be converted to a Zarr store.")
+        return
     logger.info(f"Downloading ECMWF data in {format} format...")
-    available_years = list(range(1981, 2024))
+    available_years = years or list(range(1981, 2024))
     months = list(range(1, 13))
     leadtime_months = list(range(1, 7))
 
+    # A single GRIB file, or one netCDF file per year and leadtime month
+    requests = plan_ecmwf_cds(
+        available_years,
+        months,
+        leadtime_months,
+        format,
+        target_bytes,
+        per_partition=format != "grib",
+        area=area,
+    )
+
+    def file_name_for(request: PlannedRequest) -> str:
+        return get_ecmwf_cds_file_name(
+            request.years, request.leadtime_months, format, area_name
+        )
+
+    zarr_store_name = (
+        f"ecmwf-monthly-seasonalforecast{f'-{area_name}' if area_name else ''}.zarr"  # noqa: E501
+        if to_zarr
+        else None
+    )
+
+    if plan_only:
+        print(format_plan(requests, [file_name_for(r) for r in requests]))
+        return
+
     # Default path if no local_path is provided and not uploading
     if not local_path and not upload:
         local_path = os.path.expanduser("~/Downloads/ecmwf_global_forecast")
 
     if local_path and not upload:
-        setup_output_path(local_path)
-        if format == "grib":
-            file_name = "ecmwf-monthly-seasonalforecast-1981-2023.grib"
-            download_ecmwf_cds(
-                available_years,
-                months,
-                leadtime_months,
-                local_path,
-                format,
-                file_name,
-            )
-            file_path = os.path.join(local_path, file_name)
-            logger.info(f"Data downloaded and saved to {file_path}")
-        else:  # netcdf format
-            for year in available_years:
-                for leadtime_month in leadtime_months:
-                    file_name = f"ecmwf-global-forecast-{year}-lt{leadtime_month}.{format}"  # noqa: E501
-                    download_ecmwf_cds(
-                        [year],
-                        months,
-                        [leadtime_month],
-                        local_path,
-                        format,
-                        file_name,
-                    )
-                    file_path = os.path.join(local_path, file_name)
-                    logger.info(f"Data downloaded and saved to {file_path}")
+        retrieve_requests(
+            requests,
+            file_name_for,
+            _describe_request(format),
+            local_path=local_path,
+            workers=workers,
+            max_jobs=max_jobs,
+            zarr_store_name=zarr_store_name,
+        )
     elif upload and not local_path:
-        sas_token, container_name, storage_account = load_env_vars()
-        if format == "grib":
-            file_name = "ecmwf-monthly-seasonalforecast-1981-2023.grib"
-            data_stream = download_ecmwf_cds(
-                available_years,
-                months,
-                leadtime_months,
-                format=format,
-            )
-            blob_path = f"/raw/glb/ecmwf/{file_name}"
-            upload_stream(
-                sas_token,
-                container_name,
-                storage_account,
-                data_stream,
-                blob_path,
-            )
-            logger.info(f"Data uploaded to {blob_path}")
-        else:  # netcdf format
-            for year in available_years:
-                for leadtime_month in leadtime_months:
-                    file_name = f"ecmwf-monthly-seasonalforecast-{year}-lt{leadtime_month}.{format}"  # noqa: E501
-                    data_stream = download_ecmwf_cds(
-                        [year],
-                        months,
-                        [leadtime_month],
-                        format=format,
-                    )
-                    blob_path = f"/raw/glb/ecmwf/{file_name}"
-                    upload_stream(
-                        sas_token,
-                        container_name,
-                        storage_account,
-                        data_stream,
-                        blob_path,
-                    )
-                    logger.info(f"Data uploaded to {blob_path}")
+        retrieve_requests(
+            requests,
+            file_name_for,
+            _describe_request(format),
+            blob_dir="/raw/glb/ecmwf",
+            workers=workers,
+            max_jobs=max_jobs,
+            upload_workers=upload_workers,
+            zarr_store_name=zarr_store_name,
+        )
     else:
         logger.error(
             "No valid operation specified. Please provide a local path or set upload to True."  # noqa: E501
@@ -141,17 +498,34 @@ def get_cds_era5(
     local_path: Optional[str] = None,
     upload: bool = False,
     file_format: str = "grib",
+    years: Optional[List[int]] = None,
+    workers: int = 1,
+    upload_workers: int = 1,
+    target_bytes: Optional[int] = None,
+    plan_only: bool = False,
+    max_jobs: int = DEFAULT_MAX_ACTIVE_JOBS,
+    area: Optional[str] = None,
+    area_name: Optional[str] = None,
 ):
     logger.info(
         "Downloading Copernicus CDS data of ERA5 total precipitation.."
     )
-    file_name = (
-        f"era5_total_precipitation_global_1981_2023_all_months.{file_format}"
-    )
 
-    # Define the years and months for the single request
-    years = list(range(1981, 2024))
+    # Define the years and months, a single request unless it is too large
+    years = years or list(range(1981, 2024))
     months = list(range(1, 13))
+    requests = plan_era5_cds(years, months, file_format, target_bytes, area)
+
+    def file_name_for(request: PlannedRequest) -> str:
+        first, last = request.years[0], request.years[-1]
+        if upload:
+            area_prefix = f"{area_name}-" if area_name else ""
+            return f"era5-total-precipitation-{area_prefix}{first}-{last}.{file_format}"  # noqa: E501
+        return f"era5_total_precipitation_{area_name or 'global'}_{first}_{last}_all_months.{file_format}"  # noqa: E501
+
+    if plan_only:
+        print(format_plan(requests, [file_name_for(r) for r in requests]))
+        return
 
     # Default path if no local_path is provided and not uploading
     if not local_path and not upload:
@@ -159,17 +533,24 @@ def get_cds_era5(
 
     if local_path and not upload:
         # Download data to a local path
-        setup_output_path(local_path)
-        download_era5_cds(years, months, file_name, download_path=local_path)
-    elif upload and not local_path:
-        sas_token, container_name, storage_account = load_env_vars()
-        # Download data into memory and upload to cloud
-        data_stream = download_era5_cds(years, months, file_name)
-        blob_path = (
-            f"/raw/glb/era5/era5-total-precipitation-1981-2023.{file_format}"
+        retrieve_requests(
+            requests,
+            file_name_for,
+            _describe_request(file_format),
+            local_path=local_path,
+            workers=workers,
+            max_jobs=max_jobs,
         )
-        upload_stream(
-            sas_token, container_name, storage_account, data_stream, blob_path
+    elif upload and not local_path:
+        # Download data into a staging directory and stream it to cloud
+        retrieve_requests(
+            requests,
+            file_name_for,
+            _describe_request(file_format),
+            blob_dir="/raw/glb/era5",
+            workers=workers,
+            max_jobs=max_jobs,
+            upload_workers=upload_workers,
         )
     else:
         logger.error(
@@ -177,103 +558,942 @@ def get_cds_era5(
         )
 
 
-def upload_to_cloud(
-    data_streams,
-    sas_token,
-    container_name,
-    storage_account,
-    country_name,
-    years,
-):
-    for year, data_stream in zip(years, data_streams):
+def get_mars_blob_dir(country_name: str) -> str:
+    return f"/raw/{country_name}/mars"
 
-        filename = (
-            f"{country_name.lower().replace(' ', '_')}_forecast_{year}.grib"
-        )
-        blob_path = f"/raw/{country_name}/mars/{filename}"
 
-        upload_stream(
-            sas_token, container_name, storage_account, data_stream, blob_path
-        )
+def get_mars_blob_path(country_name: str, year: Union[int, str]) -> str:
+    filename = f"{country_name.lower().replace(' ', '_')}_forecast_{year}.grib"
+    return f"{get_mars_blob_dir(country_name)}/{filename}"
+
+
+def get_mars_file_name(
+    country_name: str, years: List[int], upload: bool = False
+) -> str:
+    years_span = format_span(years)
+    if upload:
+        return posixpath.basename(get_mars_blob_path(country_name, years_span))
+    return f"{country_name.replace(' ', '_').lower()}_ecmwf_hres_seas5_{years_span}.grib"  # noqa: E501
 
 
-def get_mars(iso: str, local_path: Optional[str] = None, upload: bool = False):
+def get_mars(
+    iso: str,
+    local_path: Optional[str] = None,
+    upload: bool = False,
+    workers: int = 1,
+    upload_workers: int = 1,
+    years: Optional[List[int]] = None,
+    target_bytes: Optional[int] = None,
+    plan_only: bool = False,
+    to_zarr: bool = False,
+):
     logger.info(f"Retrieving data for ISO code: {iso}")
-    static_df = get_country_bbox_df()
-    country_df = static_df[static_df["iso"].isin([iso.upper()])]
+    from cds.countries import get_country_registry
+
+    country = get_country_registry().get(iso)
 
-    if country_df.empty:
+    if country is None:
         logger.error(
             f"{iso} is not a valid ISO code. Please refer to the supported countries list."  # noqa: E501
         )
         return
 
-    if len(country_df) > 1:
-        logger.error("Internal error: multiple entries for the same ISO code!")
-        return
-
-    country_name = country_df.iloc[0]["name_en"]
-    country_bbox = country_df.iloc[0]["bbox"]
+    country_name = country.name
+    country_bbox = country.bbox
     logger.info(f"Downloading ECMWF MARS data for {country_name}...")
 
+    # Defining the period of years to download 1981 to 2023 or 1982 to test
+    years = years or list(range(1981, 2023))
+    # One request per year unless a target size is given
+    requests = plan_ecmwf_mars(years, country_bbox, target_bytes)
+
+    def file_name_for(request: PlannedRequest) -> str:
+        return get_mars_file_name(country_name, request.years, upload)
+
+    if plan_only:
+        print(format_plan(requests, [file_name_for(r) for r in requests]))
+        return
+
     # Default path if no local_path is provided and not uploading
     if not local_path and not upload:
         local_path = os.path.expanduser(
             f"~/Downloads/mars_{country_name.replace(' ', '_').lower()}_forecast"  # noqa: E501
         )
 
-    # Defining the period of years to download 1981 to 2023 or 1982 to test
-    years = list(range(1981, 2023))
+    if upload and local_path:
+        logger.error(
+            "Invalid configuration. Use either --local [path], --upload, or none to use the default path."  # noqa: E501
+        )
+        return
 
-    if local_path and not upload:
-        setup_output_path(local_path)
-        for year in years:
-            file_name = f"{country_name.replace(' ', '_').lower()}_ecmwf_hres_seas5_{year}.grib"  # noqa: E501
-            download_ecmwf_mars(
-                year,
-                country_bbox,
-                download_path=local_path,
-                file_name=file_name,
+    retrieve_requests(
+        requests,
+        file_name_for,
+        _describe_request("grib", iso=iso.upper()),
+        local_path=None if upload else local_path,
+        blob_dir=get_mars_blob_dir(country_name) if upload else None,
+        workers=workers,
+        upload_workers=upload_workers,
+        zarr_store_name=(
+            f"{country_name.replace(' ', '_').lower()}_ecmwf_hres_seas5.zarr"
+            if to_zarr
+            else None
+        ),
+    )
+
+
+def get_mars_batch(
+    isos: List[str],
+    region: Optional[str] = None,
+    local_path: Optional[str] = None,
+    upload: bool = False,
+    workers: int = 1,
+    upload_workers: int = 1,
+    years: Optional[List[int]] = None,
+    target_bytes: Optional[int] = None,
+    plan_only: bool = False,
+    max_overhead: float = DEFAULT_MAX_OVERHEAD,
+):
+    from cds.countries import get_country_registry
+    from cds.subset import subset_grib
+
+    registry = get_country_registry()
+    selected = {iso.upper() for iso in isos if iso in registry}
+    if region:
+        selected.update(
+            country.iso
+            for country in registry.countries_intersecting(region)
+            if bbox_contains_point(region, *bbox_center(country.bbox))
+        )
+
+    unknown = sorted(set(iso.upper() for iso in isos) - selected)
+    if unknown:
+        logger.error(
+            f"{', '.join(unknown)} are not valid ISO codes. Please refer to the supported countries list."  # noqa: E501
+        )
+        return
+    if not selected:
+        logger.error(f"No supported country lies within the region {region}")
+        return
+
+    countries = [registry.get(iso) for iso in sorted(selected)]
+    names = {country.iso: country.name for country in countries}
+    bboxes = {country.iso: country.bbox for country in countries}
+    # Nearby countries share a single request over the union of their areas
+    groups = group_bboxes(bboxes, DEFAULT_GRID, max_overhead)
+
+    years = years or list(range(1981, 2023))
+    partitions = [
+        (group, request)
+        for group in groups
+        for request in plan_ecmwf_mars(
+            years, registry.union_bbox(group), target_bytes
+        )
+    ]
+
+    def file_name_for(iso: str, request: PlannedRequest) -> str:
+        return get_mars_file_name(names[iso], request.years, upload)
+
+    if plan_only:
+        for group in groups:
+            logger.info(
+                f"{registry.union_bbox(group)}: " f"{', '.join(group)}"
             )
-    elif upload and not local_path:
-        sas_token, container_name, storage_account = load_env_vars()
-        # List to hold data streams if uploading
-        data_streams = []
-        for year in years:
-            data_stream = download_ecmwf_mars(year, country_bbox)
-            data_streams.append(data_stream)
-
-        upload_to_cloud(
-            data_streams,
-            sas_token,
-            container_name,
-            storage_account,
-            country_name,
-            years,
-        )
-        return data_streams
-    else:
+        print(
+            format_plan(
+                [request for _, request in partitions],
+                [
+                    f"{'+'.join(group)} {format_span(request.years)}"
+                    for group, request in partitions
+                ],
+            )
+        )
+        return
+
+    if upload and local_path:
         logger.error(
             "Invalid configuration. Use either --local [path], --upload, or none to use the default path."  # noqa: E501
         )
+        return
+    if not local_path and not upload:
+        local_path = os.path.expanduser("~/Downloads/mars_batch_forecast")
+    logger.info(
+        f"Downloading ECMWF MARS data for {len(bboxes)} countries "
+        f"in {len(groups)} areas..."
+    )
+
+    if upload:
+        stores = {
+            iso: BlobStore(get_mars_blob_dir(names[iso])) for iso in bboxes
+        }
+    else:
+        local_store = LocalStore(local_path)
+        stores = {iso: local_store for iso in bboxes}
+
+    def outputs_for(partition) -> List[PartitionOutput]:
+        group, request = partition
+        return [
+            PartitionOutput(
+                stores[iso],
+                file_name_for(iso, request),
+                _describe_request("grib", iso=iso)(request),
+            )
+            for iso in group
+        ]
+
+    def download(partition, staging_path: str) -> Dict[str, str]:
+        group, request = partition
+        staged_paths = {
+            file_name_for(iso, request): os.path.join(
+                staging_path, file_name_for(iso, request)
+            )
+            for iso in group
+        }
+        if len(group) == 1:
+            download_planned_request(request, *staged_paths.values())
+            return staged_paths
+
+        # Cut every country out of the union area locally
+        union_path = os.path.join(
+            staging_path, f"{'-'.join(group)}-{format_span(request.years)}"
+        )
+        download_planned_request(request, union_path)
+        try:
+            subset_grib(
+                union_path,
+                {
+                    staged_paths[file_name_for(iso, request)]: bboxes[iso]
+                    for iso in group
+                },
+            )
+        finally:
+            os.remove(union_path)
+        return staged_paths
+
+    retrieve_partitions(
+        partitions,
+        download,
+        outputs_for,
+        workers,
+        upload_workers,
+        staging_dir=local_path,
+    )
+
+
+def get_cds_area(
+    isos: List[str],
+    region: Optional[str],
+    boundary: Optional[str],
+    grid: str,
+    buffer: float = DEFAULT_AREA_BUFFER,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Returns the 'N/W/S/E' area enclosing the given countries, region and
+    boundary file, buffered and snapped to the grid of a data set,
+    and the name of the retrieved files of this area, i.e. 'eth-ken'.
+    Returns None twice to retrieve the whole globe.
+    """
+    bboxes = []
+    names = []
+    if isos:
+        from cds.countries import get_country_registry
+
+        registry = get_country_registry()
+        unknown = sorted(iso.upper() for iso in isos if iso not in registry)
+        if unknown:
+            raise ValueError(
+                f"{', '.join(unknown)} are not valid ISO codes. "
+                f"Please refer to the supported countries list."
+            )
+        bboxes.append(registry.union_bbox(isos))
+        names.extend(sorted({iso.lower() for iso in isos}))
+    if region:
+        parse_bbox(region)
+        bboxes.append(region)
+        names.append(region.replace("/", "_"))
+    if boundary:
+        bboxes.append(get_boundary_bbox(boundary))
+        names.append(os.path.splitext(os.path.basename(boundary))[0].lower())
+    if not bboxes:
+        return None, None
+    area = snap_bbox(union_bbox(bboxes), grid, buffer)
+    return area, "-".join(name.replace(" ", "_") for name in names)
+
+
+def _describe_request(
+    format: str, iso: Optional[str] = None
+) -> Callable[[PlannedRequest], Dict[str, Any]]:
+    """Returns the manifest fields of the partition of a planned request"""
+
+    def describe(request: PlannedRequest) -> Dict[str, Any]:
+        return {
+            "dataset": request.name,
+            "year": (
+                request.years[0] if len(request.years) == 1 else request.years
+            ),
+            "leadtime": (
+                request.leadtime_months[0]
+                if len(request.leadtime_months) == 1
+                else request.leadtime_months or None
+            ),
+            "iso": iso,
+            "format": format,
+        }
+
+    return describe
+
+
+class LocalStore:
+    """Local output directory whose files are recorded in a manifest"""
+
+    def __init__(self, path: str):
+        setup_output_path(path)
+        self.path = path
+        self.manifest_path = os.path.join(path, MANIFEST_FILE_NAME)
+        self.manifest = Manifest.load(self.manifest_path)
+        self._lock = threading.Lock()
+
+    def is_complete(self, file_name: str) -> bool:
+        return self.manifest.is_complete_local(
+            file_name, os.path.join(self.path, file_name)
+        )
+
+    def put(
+        self, file_name: str, file_path: str, partition: Dict[str, Any]
+    ) -> str:
+        target_path = os.path.join(self.path, file_name)
+        self.manifest.record_file(file_name, file_path, **partition)
+        shutil.move(file_path, target_path)
+        with self._lock:
+            self.manifest.save(self.manifest_path)
+        return target_path
+
+
+class BlobStore:
+    """Blob folder whose uploaded files are recorded in a manifest"""
+
+    def __init__(self, blob_dir: str):
+        self.credentials = load_env_vars()
+        self.blob_dir = blob_dir
+        self.manifest_blob_path = posixpath.join(blob_dir, MANIFEST_FILE_NAME)
+        with record_span(
+            "blob_download",
+            partition=MANIFEST_FILE_NAME,
+            blob=self.manifest_blob_path,
+        ) as record:
+            content = read_blob_bytes(
+                *self.credentials, self.manifest_blob_path
+            )
+            record["bytes"] = len(content) if content else 0
+        self.manifest = Manifest.from_json(content) if content else Manifest()
+        self._lock = threading.Lock()
+
+    def is_complete(self, file_name: str) -> bool:
+        if file_name not in self.manifest.entries:
+            return False
+        properties = get_blob_properties(
+            *self.credentials, posixpath.join(self.blob_dir, file_name)
+        )
+        if properties is None:
+            return False
+        return self.manifest.is_complete(
+            file_name, properties.size, properties.etag
+        )
+
+    def put(
+        self, file_name: str, file_path: str, partition: Dict[str, Any]
+    ) -> str:
+        blob_path = posixpath.join(self.blob_dir, file_name)
+        try:
+            md5 = file_md5(file_path)
+            with record_span(
+                "blob_upload", partition=file_name, blob=blob_path
+            ) as record:
+                record["bytes"] = os.path.getsize(file_path)
+                etag = upload_file_in_blocks(
+                    *self.credentials, file_path, blob_path
+                )
+            self.manifest.record(
+                file_name,
+                size=os.path.getsize(file_path),
+                md5=md5,
+                etag=etag,
+                **partition,
+            )
+        finally:
+            os.remove(file_path)
+        with self._lock, record_span(
+            "blob_upload",
+            partition=MANIFEST_FILE_NAME,
+            blob=self.manifest_blob_path,
+        ) as record:
+            content = self.manifest.to_json().encode("utf-8")
+            record["bytes"] = len(content)
+            upload_stream(*self.credentials, content, self.manifest_blob_path)
+        return blob_path
+
+
+class PartitionOutput(NamedTuple):
+    """A file produced by a partition, with its store and manifest fields"""
+
+    store: Union[LocalStore, BlobStore]
+    file_name: str
+    partition: Dict[str, Any]
+
+
+class ZarrOutput:
+    """
+    Zarr store the retrieved GRIB files are converted to as they arrive,
+    in 'local_path', or staged locally and mirrored to 'blob_dir'
+    """
+
+    def __init__(
+        self,
+        store_name: str,
+        years: List[int],
+        leadtime_months: List[int],
+        local_path: Optional[str] = None,
+        blob_dir: Optional[str] = None,
+    ):
+        self.blob_dir = blob_dir
+        self._staging: Optional[tempfile.TemporaryDirectory] = None
+        if blob_dir:
+            self.credentials = load_env_vars()
+            self.blob_path = posixpath.join(blob_dir, store_name)
+            self._staging = tempfile.TemporaryDirectory(prefix=".zarr-")
+            path = os.path.join(self._staging.name, store_name)
+            self._download_metadata(path)
+        else:
+            setup_output_path(local_path)
+            path = os.path.join(local_path, store_name)
+        from cds.zarr_store import ZarrStore
+
+        self.store = ZarrStore(path, years, leadtime_months)
+
+    def add(self, file_path: str, index_path: Optional[str] = None):
+        written = self.store.add_grib(file_path, index_path)
+        if self.blob_dir:
+            self._upload(written)
+
+    def close(self):
+        """Consolidates the metadata, uploading it with the coordinates"""
+        try:
+            metadata = self.store.consolidate()
+            if self.blob_dir:
+                self._upload(metadata)
+            location = self.blob_path if self.blob_dir else self.store.path
+            logger.info(f"Zarr store updated: {location}")
+        finally:
+            if self._staging:
+                self._staging.cleanup()
+
+    def _download_metadata(self, path: str):
+        """Stages the metadata and coordinates of an existing store"""
+        content = read_blob_bytes(
+            *self.credentials, posixpath.join(self.blob_path, ".zmetadata")
+        )
+        if not content:
+            return
+        for key, value in json.loads(content)["metadata"].items():
+            file_path = os.path.join(path, key)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as f:
+                json.dump(value, f)
+        coordinates = [
+            key.split("/")[0]
+            for key, value in json.loads(content)["metadata"].items()
+            if key.endswith("/.zarray") and len(value["shape"]) == 1
+        ]
+        errors = download_files(
+            *self.credentials,
+            [
+                (
+                    posixpath.join(self.blob_path, name, "0"),
+                    os.path.join(path, name, "0"),
+                )
+                for name in coordinates
+            ],
+        )
+        if errors:
+            raise RuntimeError(
+                f"Failed to download the coordinates of {self.blob_path}: "
+                f"{', '.join(errors)}"
+            )
+
+    def _upload(self, relative_paths: List[str]):
+        errors = upload_files(
+            *self.credentials,
+            [
+                (
+                    os.path.join(self.store.path, relative_path),
+                    posixpath.join(
+                        self.blob_path, relative_path.replace(os.sep, "/")
+                    ),
+                )
+                for relative_path in relative_paths
+            ],
+        )
+        if errors:
+            raise RuntimeError(
+                f"Failed to upload to {self.blob_path}: {', '.join(errors)}"
+            )
+
+
+def repack_file(file_path: str) -> Dict[str, Any]:
+    """
+    Repacks a retrieved GRIB file in place, see repack_grib, and returns
+    the size and checksum of the original for its manifest entry.
+    """
+    with record_span("repack", file=os.path.basename(file_path)) as record:
+        result = repack_grib(file_path)
+        record["bytes"] = result.source_size
+    logger.info(
+        f"Repacked {result.repacked} of {result.messages} messages of "
+        f"{os.path.basename(file_path)}, {result.source_size} to "
+        f"{result.size} bytes"
+    )
+    return {"source_size": result.source_size, "source_md5": result.source_md5}
+
+
+def retrieve_partitions(
+    partitions: List[Any],
+    download: Callable[[Any, str], Dict[str, str]],
+    outputs_for: Callable[[Any], List[PartitionOutput]],
+    workers: int = 1,
+    upload_workers: int = 1,
+    staging_dir: Optional[str] = None,
+    submit: Optional[Callable[[Any], Future]] = None,
+    zarr_output: Optional[ZarrOutput] = None,
+) -> List[Any]:
+    """
+    Retrieves every partition with an output not yet recorded as complete
+    in the manifest of its store, and records each output as soon as
+    it is stored. 'download' is called with the partition and a staging
+    directory and returns the staged path of each output file name.
+    Staged files are handed straight to 'upload_workers' threads which
+    move or upload them to their store. GRIB files are repacked when
+    enabled, see repack_file, then stored along with a sidecar index of
+    their messages, built once they are downloaded, and converted to
+    'zarr_output' when given.
+    With 'submit', the jobs of all partitions are submitted up front and
+    partitions are downloaded in the order their job future completes.
+    """
+    pending = [
+        partition
+        for partition in partitions
+        if not all(
+            output.store.is_complete(output.file_name)
+            for output in outputs_for(partition)
+        )
+    ]
+    if len(pending) < len(partitions):
+        logger.info(
+            f"Skipping {len(partitions) - len(pending)} of {len(partitions)} "
+            f"partitions already recorded in the manifest"
+        )
+
+    def label(partition) -> str:
+        return ", ".join(o.file_name for o in outputs_for(partition))
+
+    # Size and checksum of the repacked files as retrieved, by file name
+    sources: Dict[str, Dict[str, Any]] = {}
+
+    def download_partition(partition, staging_path: str):
+        with telemetry_context(partition=label(partition)):
+            staged_paths = download(partition, staging_path)
+            if is_repacking_enabled():
+                for output in outputs_for(partition):
+                    if output.file_name.endswith(".grib"):
+                        sources[output.file_name] = repack_file(
+                            staged_paths[output.file_name]
+                        )
+            if is_indexing_enabled():
+                for output in outputs_for(partition):
+                    if output.file_name.endswith(".grib"):
+                        staged_paths[get_index_path(output.file_name)] = (
+                            build_grib_index(staged_paths[output.file_name])
+                        )
+            if zarr_output:
+                for output in outputs_for(partition):
+                    if output.file_name.endswith(".grib"):
+                        zarr_output.add(
+                            staged_paths[output.file_name],
+                            staged_paths.get(get_index_path(output.file_name)),
+                        )
+            return staged_paths
+
+    def store_partition(partition, staged_paths: Dict[str, str]):
+        with telemetry_context(partition=label(partition)):
+            stored = []
+            for output in outputs_for(partition):
+                # The index is stored first, so every file recorded
+                # as complete in the manifest has its index
+                index_name = get_index_path(output.file_name)
+                if index_name in staged_paths:
+                    output.store.put(
+                        index_name,
+                        staged_paths[index_name],
+                        {**output.partition, "format": "index"},
+                    )
+                stored.append(
+                    output.store.put(
+                        output.file_name,
+                        staged_paths[output.file_name],
+                        {
+                            **output.partition,
+                            **sources.pop(output.file_name, {}),
+                        },
+                    )
+                )
+            return stored
+
+    items: Iterable[Any] = pending
+    if submit:
+        jobs = {submit(partition): partition for partition in pending}
+        items = (jobs[job] for job in as_completed(jobs))
+
+    # Local files are staged next to their final location and moved
+    # in place once complete, uploads are staged in a temporary directory
+    with tempfile.TemporaryDirectory(
+        dir=staging_dir, prefix=".staging-"
+    ) as staging_path:
+        return _report_outcomes(
+            run_pipeline(
+                lambda partition: download_partition(partition, staging_path),
+                store_partition,
+                items,
+                workers,
+                upload_workers,
+            ),
+            len(pending),
+            label,
+        )
+
+
+def retrieve_requests(
+    requests: List[PlannedRequest],
+    file_name_for: Callable[[PlannedRequest], str],
+    describe: Callable[[PlannedRequest], Dict[str, Any]],
+    local_path: Optional[str] = None,
+    blob_dir: Optional[str] = None,
+    workers: int = 1,
+    upload_workers: int = 1,
+    max_jobs: Optional[int] = None,
+    zarr_store_name: Optional[str] = None,
+) -> List[Any]:
+    """
+    Retrieves planned requests, each into its own file, to 'local_path'
+    or to 'blob_dir' in the container, skipping the ones already
+    recorded in the manifest.
+    With 'zarr_store_name', GRIB files are also converted to the Zarr
+    store of this name next to them.
+    With 'max_jobs', CDS requests are all submitted up front and kept
+    queued on the server up to this many at once, then downloaded
+    on 'workers' threads as soon as each one completes.
+    """
+    store = LocalStore(local_path) if local_path else BlobStore(blob_dir)
+    zarr_output = (
+        ZarrOutput(
+            zarr_store_name,
+            sorted({year for r in requests for year in r.years}),
+            sorted({month for r in requests for month in r.leadtime_months}),
+            local_path,
+            blob_dir,
+        )
+        if zarr_store_name
+        else None
+    )
+    runner = (
+        CdsJobRunner(max_jobs)
+        if max_jobs and any(r.service == "cds" for r in requests)
+        else None
+    )
+
+    def download(request: PlannedRequest, staging_path: str):
+        file_name = file_name_for(request)
+        file_path = os.path.join(staging_path, file_name)
+        download_planned_request(request, file_path, runner)
+        return {file_name: file_path}
+
+    try:
+        return retrieve_partitions(
+            requests,
+            download,
+            lambda request: [
+                PartitionOutput(
+                    store, file_name_for(request), describe(request)
+                )
+            ],
+            workers,
+            upload_workers,
+            staging_dir=local_path,
+            submit=(
+                (lambda request: runner.submit(request.name, request.metadata))
+                if runner
+                else None
+            ),
+            zarr_output=zarr_output,
+        )
+    finally:
+        if runner:
+            runner.close()
+        if zarr_output:
+            zarr_output.close()
+
+
+def _report_outcomes(
+    outcomes: Iterable[TaskOutcome],
+    total: int,
+    label: Callable[[Any], str] = str,
+) -> List[Any]:
+    """
+    Logs the outcome of every partition as it arrives, followed by
+    a summary of the failed ones, and returns the successful results.
+    """
+    results = []
+    failed = []
+    for outcome in outcomes:
+        if outcome.ok:
+            results.append(outcome.result)
+            logger.info(f"{label(outcome.item)}: saved to {outcome.result}")
+        else:
+            failed.append(label(outcome.item))
+            logger.error(
+                f"{label(outcome.item)}: failed with {outcome.error!r}"
+            )
+
+    if failed:
+        _failed_partitions.extend(failed)
+        logger.error(
+            f"{len(failed)} of {total} partitions failed: "
+            f"{', '.join(sorted(failed))}"
+        )
+    else:
+        logger.info(f"All {total} partitions retrieved successfully")
+    return results
+
+
+def enqueue_command(
+    argv: List[str],
+    service: str,
+    slots: int,
+    priority: str,
+    queue_db: Optional[str] = None,
+) -> int:
+    """Adds a retrieval command to the job queue instead of running it"""
+    queue = JobQueue(queue_db or get_queue_db())
+    job_id = queue.enqueue(
+        service,
+        [arg for arg in argv if arg != "--enqueue"],
+        priority,
+        slots,
+    )
+    logger.info(f"Queued job {job_id} in {queue.db_path}")
+    return job_id
+
+
+def run_job_queue(
+    queue_db: Optional[str],
+    limits: Dict[str, int],
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    until_empty: bool = False,
+):
+    queue = JobQueue(queue_db or get_queue_db())
+    logger.info(f"Running the jobs of {queue.db_path} within {limits}")
+    run_scheduler(
+        queue,
+        [sys.executable, os.path.dirname(os.path.abspath(__file__))],
+        limits,
+        poll_interval,
+        until_empty,
+    )
+
+
+def sync_local_directory(
+    local_dir: str,
+    prefix: str,
+    direction: str = "both",
+    workers: int = DEFAULT_BULK_WORKERS,
+    dry_run: bool = False,
+) -> bool:
+    """
+    Syncs a directory with a prefix of the container of the environment,
+    see sync_directory, and returns whether every transfer succeeded.
+    """
+    plan, errors = sync_directory(
+        *load_env_vars(), local_dir, prefix, direction, workers, dry_run
+    )
+    if dry_run:
+        for local_file_path, blob_path in plan.uploads:
+            print(f"upload {local_file_path} -> {blob_path}")
+        for blob_path, local_file_path in plan.downloads:
+            print(f"download {blob_path} -> {local_file_path}")
+    for blob_path, error in sorted(errors.items()):
+        logger.error(f"Failed to sync {blob_path}: {error}")
+    return not errors
+
+
+def summarize_telemetry_file(
+    file_path: str, run: Optional[str] = None, top: int = 5
+):
+    records = read_telemetry(file_path)
+    if run:
+        records = [record for record in records if record["run"] == run]
+    if not records:
+        logger.error(f"No telemetry records found in {file_path}")
+        return
+    print(format_telemetry_summary(records, top))
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
 
+    if args.command == "telemetry":
+        summarize_telemetry_file(args.file, args.run, args.top)
+        raise SystemExit()
+
+    if args.command == "scheduler":
+        if args.action == "run":
+            run_job_queue(
+                args.queue_db,
+                {"cds": args.cds_jobs, "mars": args.mars_jobs},
+                args.poll_interval,
+                args.until_empty,
+            )
+        else:
+            queue = JobQueue(args.queue_db or get_queue_db())
+            print(
+                format_jobs(
+                    queue.jobs(None if args.all else ["queued", "running"])
+                )
+            )
+        raise SystemExit()
+
+    if args.command == "sync":
+        success = sync_local_directory(
+            args.local, args.prefix, args.direction, args.workers, args.dry_run
+        )
+        raise SystemExit(0 if success else 1)
+
+    if args.to_zarr:
+        # Checked before any request, as the first store is only written
+        # once a partition is retrieved
+        from cds.zarr_store import get_zarr_support_error
+
+        zarr_error = get_zarr_support_error()
+        if zarr_error:
+            (parser_cds if args.command == "cds" else parser_mars).error(
+                f"--to-zarr cannot be used: {zarr_error}"
+            )
+
+    if args.enqueue:
+        if args.command == "mars" and not (args.iso or args.region):
+            parser_mars.error("either an ISO code or --region is required")
+        enqueue_command(
+            sys.argv[1:],
+            args.command,
+            args.max_jobs if args.command == "cds" else args.workers,
+            args.priority,
+            args.queue_db,
+        )
+        raise SystemExit()
+
+    target_bytes = int(args.target_mb * 1024**2) if args.target_mb else None
+    if args.telemetry:
+        configure_telemetry(args.telemetry)
+    configure_retries(args.retries)
+    configure_verification(not args.no_verify)
+    configure_indexing(not args.no_index)
+    configure_repacking(args.repack)
+    if args.cache_dir:
+        configure_cache(args.cache_dir, int(args.cache_max_gb * 1024**3))
+    # One pooled connection per block in flight, plus the manifest
+    configure_blob_transfers(
+        max_concurrency=args.blob_concurrency,
+        block_size=int(args.blob_block_mb * 1024**2),
+        read_timeout=args.blob_timeout,
+        pool_size=args.upload_workers * args.blob_concurrency + 1,
+    )
+
     if args.command == "cds":
+        try:
+            area, area_name = get_cds_area(
+                args.iso,
+                args.region,
+                args.boundary,
+                ECMWF_CDS_GRID if args.type == "ecmwf" else ERA5_CDS_GRID,
+                args.area_buffer,
+            )
+        except ValueError as error:
+            parser_cds.error(str(error))
+        if area:
+            logger.info(f"Retrieving the area {area} ({area_name})")
         if args.type == "ecmwf":
             get_cds_ecmwf(
                 local_path=args.local,
                 upload=args.upload,
                 format=args.format,
+                workers=args.workers,
+                upload_workers=args.upload_workers,
+                years=args.years,
+                target_bytes=target_bytes,
+                plan_only=args.plan,
+                max_jobs=args.max_jobs,
+                to_zarr=args.to_zarr,
+                area=area,
+                area_name=area_name,
             )
         elif args.type == "era5":
+            if args.to_zarr:
+                parser_cds.error(
+                    "--to-zarr is only supported for the ECMWF seasonal "
+                    "forecast"
+                )
             get_cds_era5(
                 local_path=args.local,
                 upload=args.upload,
                 file_format=args.format,
+                years=args.years,
+                workers=args.workers,
+                upload_workers=args.upload_workers,
+                target_bytes=target_bytes,
+                plan_only=args.plan,
+                max_jobs=args.max_jobs,
+                area=area,
+                area_name=area_name,
             )
 
+    elif args.command == "mars" and (len(args.iso) > 1 or args.region):
+        if args.to_zarr:
+            parser_mars.error("--to-zarr is only supported for one country")
+        get_mars_batch(
+            args.iso,
+            region=args.region,
+            local_path=args.local,
+            upload=args.upload,
+            workers=args.workers,
+            upload_workers=args.upload_workers,
+            years=args.years,
+            target_bytes=target_bytes,
+            plan_only=args.plan,
+            max_overhead=args.max_overhead,
+        )
+
+    elif args.command == "mars" and args.iso:
+        get_mars(
+            args.iso[0],
+            local_path=args.local,
+            upload=args.upload,
+            workers=args.workers,
+            upload_workers=args.upload_workers,
+            years=args.years,
+            target_bytes=target_bytes,
+            plan_only=args.plan,
+            to_zarr=args.to_zarr,
+        )
+
     elif args.command == "mars":
-        get_mars(args.iso, local_path=args.local, upload=args.upload)
+        parser_mars.error("either an ISO code or --region is required")
+
+    if _failed_partitions:
+        raise SystemExit(1)
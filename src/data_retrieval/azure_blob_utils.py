@@ -1,9 +1,161 @@
+import base64
+import contextvars
+import hashlib
+import io
+import json
 import os
-from io import BytesIO, StringIO
+import posixpath
+import tempfile
+import threading
+import urllib.parse
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import contextmanager
+from io import BytesIO
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import geopandas as gpd
-import pandas as pd
-from azure.storage.blob import BlobClient
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Run as the command line, the modules of data_retrieval are top-level
+if __package__:
+    from .cds.file_cache import FileCache, copy_from_cache
+    from .cds.telemetry import record_span, update_span
+else:
+    from cds.file_cache import FileCache, copy_from_cache
+    from cds.telemetry import record_span, update_span
+
+# The Azure SDK, requests and the DataFrame libraries are imported
+# where they are used, so that importing this module stays fast
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+    from azure.storage.blob import BlobClient, ContainerClient
+
+# Size of a single staged block, peak memory is about
+# block size x number of blocks in flight
+DEFAULT_BLOCK_SIZE: int = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY: int = 4
+DEFAULT_CONNECTION_TIMEOUT: int = 20
+DEFAULT_READ_TIMEOUT: int = 120
+# Number of blobs moved at once by the bulk functions
+DEFAULT_BULK_WORKERS: int = 8
+# Maximum number of committed blocks allowed by Azure for a block blob
+MAX_BLOCK_COUNT: int = 50_000
+# Suffixes of a download in progress and of its completed ranges
+PARTIAL_SUFFIX: str = ".part"
+PROGRESS_SUFFIX: str = ".json"
+# Local cache of blob contents, see configure_blob_cache
+BLOB_CACHE_DIR_ENV: str = "DATA_RETRIEVAL_BLOB_CACHE_DIR"
+BLOB_CACHE_MAX_BYTES_ENV: str = "DATA_RETRIEVAL_BLOB_CACHE_MAX_BYTES"
+DEFAULT_BLOB_CACHE_MAX_BYTES: int = 10 * 1024**3
+# Block cache of ranged blob reads, see configure_block_cache
+BLOCK_CACHE_DIR_ENV: str = "DATA_RETRIEVAL_BLOCK_CACHE_DIR"
+BLOCK_CACHE_MAX_BYTES_ENV: str = "DATA_RETRIEVAL_BLOCK_CACHE_MAX_BYTES"
+DEFAULT_BLOCK_CACHE_MAX_BYTES: int = 20 * 1024**3
+DEFAULT_CACHE_BLOCK_SIZE: int = 4 * 1024 * 1024
+# Size of the ranges requested when streaming a blob sequentially
+DEFAULT_READ_SIZE: int = 4 * 1024 * 1024
+# Checksums of the files of a synced directory, see sync_directory
+SYNC_STATE_FILE_NAME: str = ".blob_sync.json"
+SYNC_DIRECTIONS: Tuple[str, ...] = ("up", "down", "both")
+# Coordinate reference system of GeoParquet geometries without one
+GEOPARQUET_DEFAULT_CRS: str = "OGC:CRS84"
+
+
+class BlobTransferSettings(NamedTuple):
+    """Tuning of the shared container clients and of every transfer"""
+
+    # Parallel connections used by a single upload or download
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    # Size of the blocks staged on upload and of the ranges downloaded
+    block_size: int = DEFAULT_BLOCK_SIZE
+    connection_timeout: int = DEFAULT_CONNECTION_TIMEOUT
+    read_timeout: int = DEFAULT_READ_TIMEOUT
+    # Connections kept open to the storage account
+    pool_size: int = DEFAULT_BULK_WORKERS * DEFAULT_MAX_CONCURRENCY
+
+
+_settings = BlobTransferSettings()
+_container_clients: Dict[Tuple[str, str, str], "ContainerClient"] = {}
+_container_clients_lock = threading.Lock()
+
+
+def configure_blob_transfers(**settings) -> BlobTransferSettings:
+    """
+    Updates the settings of the shared container clients,
+    i.e. max_concurrency, block_size or read_timeout.
+    Clients created with the previous settings are dropped.
+    """
+    global _settings
+    with _container_clients_lock:
+        _settings = _settings._replace(**settings)
+        _container_clients.clear()
+    return _settings
+
+
+def get_container_client(
+    sas_token, container_name, storage_account
+) -> "ContainerClient":
+    """
+    Returns the container client shared by every call with the same
+    credentials, so that blob transfers reuse its pooled connections
+    instead of opening new ones each time.
+    """
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+    from azure.storage.blob import ContainerClient
+
+    key = (storage_account, container_name, sas_token)
+    with _container_clients_lock:
+        client = _container_clients.get(key)
+        if client is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=_settings.pool_size
+            )
+            session.mount("https://", adapter)
+            base_url = f"https://{storage_account}.blob.core.windows.net"
+            client = ContainerClient.from_container_url(
+                f"{base_url}/{container_name}?{sas_token}",
+                transport=RequestsTransport(
+                    session=session,
+                    connection_timeout=_settings.connection_timeout,
+                    read_timeout=_settings.read_timeout,
+                ),
+                max_block_size=_settings.block_size,
+                max_single_put_size=_settings.block_size,
+                max_chunk_get_size=_settings.block_size,
+                max_single_get_size=_settings.block_size,
+            )
+            _container_clients[key] = client
+        return client
+
+
+def get_blob_client(
+    sas_token, container_name, storage_account, blob_path
+) -> "BlobClient":
+    """Returns a client for a blob on the shared container client"""
+    return get_container_client(
+        sas_token, container_name, storage_account
+    ).get_blob_client(blob_path)
 
 
 def load_env_vars():
@@ -28,12 +180,13 @@ def upload_file(
     Uploads a single file from 'local_file_path'
     to 'blob_path' in Azure Blob Storage.
     """
-    base_url = f"https://{storage_account}.blob.core.windows.net"
-    sas_url = f"{base_url}/{container_name}/{blob_path}" f"?{sas_token}"
-
-    blob_client = BlobClient.from_blob_url(blob_url=sas_url)
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
     with open(local_file_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
+        blob_client.upload_blob(
+            data, overwrite=True, max_concurrency=_settings.max_concurrency
+        )
         print(f"Upload completed successfully for {blob_path}!")
 
 
@@ -43,54 +196,1066 @@ def upload_stream(
     """
     Uploads data from a BytesIO stream directly to Azure Blob Storage.
     """
-    base_url = f"https://{storage_account}.blob.core.windows.net"
-    sas_url = f"{base_url}/{container_name}/{blob_path}" f"?{sas_token}"
-
-    blob_client = BlobClient.from_blob_url(blob_url=sas_url)
-    blob_client.upload_blob(data_stream, overwrite=True)
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+    blob_client.upload_blob(
+        data_stream, overwrite=True, max_concurrency=_settings.max_concurrency
+    )
     print(f"Stream upload completed successfully for {blob_path}!")
 
 
+def upload_file_in_blocks(
+    sas_token,
+    container_name,
+    storage_account,
+    local_file_path,
+    blob_path,
+    block_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+):
+    """
+    Streams a local file to 'blob_path' in Azure Blob Storage
+    as fixed-size staged blocks, with up to 'max_concurrency'
+    blocks in flight, and commits the block list at the end.
+    Memory use depends on the block size, not on the file size.
+    The MD5 of the whole file is stored as the blob Content-MD5
+    and the ETag of the committed blob is returned.
+    """
+    from azure.storage.blob import BlobBlock, ContentSettings
+
+    block_size = block_size or _settings.block_size
+    max_concurrency = max_concurrency or _settings.max_concurrency
+    file_size = os.path.getsize(local_file_path)
+    block_count = -(-file_size // block_size)
+    if block_count > MAX_BLOCK_COUNT:
+        raise ValueError(
+            f"{local_file_path} needs {block_count} blocks of {block_size} "
+            f"bytes, more than the {MAX_BLOCK_COUNT} allowed per blob"
+        )
+
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+    block_ids = []
+    pending = set()
+    md5 = hashlib.md5()
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        with open(local_file_path, "rb") as data:
+            while True:
+                # Only read the next block once a slot is free
+                if len(pending) >= max_concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                chunk = data.read(block_size)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                block_id = base64.b64encode(
+                    f"{len(block_ids):08d}".encode()
+                ).decode()
+                block_ids.append(block_id)
+                pending.add(
+                    executor.submit(
+                        blob_client.stage_block,
+                        block_id,
+                        chunk,
+                        length=len(chunk),
+                    )
+                )
+        for future in pending:
+            future.result()
+
+    response = blob_client.commit_block_list(
+        [BlobBlock(block_id=block_id) for block_id in block_ids],
+        content_settings=ContentSettings(content_md5=bytearray(md5.digest())),
+    )
+    print(f"Block upload completed successfully for {blob_path}!")
+    return response.get("etag")
+
+
+def get_blob_properties(sas_token, container_name, storage_account, blob_path):
+    """
+    Returns the properties (size, ETag, Content-MD5, ...) of a blob
+    without downloading it, or None if the blob does not exist.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+    try:
+        return blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+
+
+def read_blob_bytes(sas_token, container_name, storage_account, blob_path):
+    """
+    Reads a small blob into memory, or returns None if it does not exist.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+    try:
+        return blob_client.download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+
+
 def download_file(
     sas_token, container_name, storage_account, blob_path, local_file_path
 ):
     """
-    Downloads a blob from Azure Blob Storage to a local file path.
+    Downloads a blob from Azure Blob Storage to a local file path,
+    in parallel byte ranges, see download_file_in_ranges.
+    With a blob cache configured, the file is copied from the cache,
+    which only downloads the blob if it changed since it was cached.
+    It is a copy rather than a link, so that changing the file does not
+    change the cached copy served to later reads.
+    The download is recorded as a 'blob_download' telemetry span.
     """
-    base_url = f"https://{storage_account}.blob.core.windows.net"
-    sas_url = f"{base_url}/{container_name}/{blob_path}" f"?{sas_token}"
+    _record_transfer(
+        "blob_download",
+        lambda blob_path, local_file_path: _download_file(
+            sas_token,
+            container_name,
+            storage_account,
+            blob_path,
+            local_file_path,
+        ),
+        blob_path,
+        local_file_path,
+    )
+
 
-    blob_client = BlobClient.from_blob_url(blob_url=sas_url)
-    download_stream = blob_client.download_blob()
-    content = download_stream.readall()
-    with open(local_file_path, "wb") as data:
-        data.write(content)
-        print(f"Download completed successfully for {blob_path}!")
+def _download_file(
+    sas_token, container_name, storage_account, blob_path, local_file_path
+):
+    cache = get_blob_cache()
+    if cache:
+        cache.fetch(
+            sas_token,
+            container_name,
+            storage_account,
+            blob_path,
+            copy_to=local_file_path,
+        )
+        return
+    download_file_in_ranges(
+        sas_token, container_name, storage_account, blob_path, local_file_path
+    )
+    print(f"Download completed successfully for {blob_path}!")
 
 
-def read_blob_to_dataframe(
-    sas_token, container_name, storage_account, blob_path
+def download_file_in_ranges(
+    sas_token,
+    container_name,
+    storage_account,
+    blob_path,
+    local_file_path,
+    range_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+) -> str:
+    """
+    Downloads a blob in fixed-size byte ranges, up to 'max_concurrency'
+    at once, written straight to their offset in a preallocated
+    '<local_file_path>.part' file, so memory use depends on the range
+    size, not on the blob size. The completed ranges are recorded next
+    to it once flushed to disk, and a download of the same blob which
+    was interrupted resumes with the missing ranges, unless the blob
+    changed since.
+    The file is checked against the Content-MD5 of the blob, or its
+    size without one, before it is moved to 'local_file_path'.
+    Returns the ETag of the blob.
+    """
+    from azure.core import MatchConditions
+
+    range_size = range_size or _settings.block_size
+    max_concurrency = max_concurrency or _settings.max_concurrency
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+    properties = blob_client.get_blob_properties()
+    size = properties.size
+    etag = properties.etag
+    part_path = f"{local_file_path}{PARTIAL_SUFFIX}"
+    progress_path = f"{part_path}{PROGRESS_SUFFIX}"
+
+    progress = _read_progress(progress_path)
+    state = {"etag": etag, "size": size, "range_size": range_size}
+    done = set(progress.get("done", []))
+    if any(progress.get(key) != value for key, value in state.items()) or (
+        not os.path.exists(part_path)
+    ):
+        # Nothing to resume, or the blob changed since
+        done = set()
+    if not done:
+        with open(part_path, "wb") as f:
+            _preallocate(f.fileno(), size)
+    remaining = [
+        offset
+        for offset in range(0, size, range_size)
+        if offset // range_size not in done
+    ]
+    if done:
+        print(
+            f"Resuming {blob_path}: {len(remaining)} of "
+            f"{-(-size // range_size)} ranges left"
+        )
+
+    lock = threading.Lock()
+    fd = os.open(part_path, os.O_WRONLY)
+    try:
+
+        def fetch(offset: int):
+            data = blob_client.download_blob(
+                offset=offset,
+                length=min(range_size, size - offset),
+                etag=etag,
+                match_condition=MatchConditions.IfNotModified,
+            ).readall()
+            os.pwrite(fd, data, offset)
+            # The range is only recorded once it is on disk, so that
+            # resuming after a crash does not trust ranges never written
+            _sync_data(fd)
+            with lock:
+                done.add(offset // range_size)
+                _write_progress(progress_path, {**state, "done": sorted(done)})
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for future in [executor.submit(fetch, o) for o in remaining]:
+                future.result()
+    finally:
+        os.close(fd)
+
+    content_md5 = properties.content_settings.content_md5
+    try:
+        if os.path.getsize(part_path) != size:
+            raise IOError(
+                f"{blob_path} downloaded to {os.path.getsize(part_path)} "
+                f"bytes, expected {size}"
+            )
+        if content_md5 and _file_md5(part_path) != bytes(content_md5):
+            raise IOError(f"{blob_path} does not match its Content-MD5")
+    except IOError:
+        # No range, and so no progress, is recorded for an empty blob
+        for path in (part_path, progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    os.replace(part_path, local_file_path)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return etag
+
+
+def _preallocate(fd: int, size: int):
+    """Reserves the disk space of a file, or at least sets its size"""
+    if size and hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, 0, size)
+    else:
+        os.truncate(fd, size)
+
+
+def _sync_data(fd: int):
+    """Flushes the written data of a file to disk"""
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def _read_progress(progress_path: str) -> Dict[str, Any]:
+    try:
+        with open(progress_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_progress(progress_path: str, progress: Dict[str, Any]):
+    with open(f"{progress_path}.tmp", "w") as f:
+        json.dump(progress, f)
+    os.replace(f"{progress_path}.tmp", progress_path)
+
+
+def _file_md5(file_path: str) -> bytes:
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_settings.block_size), b""):
+            md5.update(chunk)
+    return md5.digest()
+
+
+class BlobCache(FileCache):
+    """
+    On-disk cache of blob contents, keyed by storage account, container
+    and blob path, with a size-bounded least recently used eviction.
+    Every read revalidates the cached copy against the ETag of the blob,
+    a single properties request, and downloads the blob again only if
+    it changed.
+    """
+
+    def __init__(
+        self, cache_dir: str, max_bytes: int = DEFAULT_BLOB_CACHE_MAX_BYTES
+    ):
+        super().__init__(cache_dir, max_bytes)
+
+    def key_for(self, storage_account, container_name, blob_path) -> str:
+        return hashlib.sha256(
+            f"{storage_account}/{container_name}/{blob_path}".encode("utf-8")
+        ).hexdigest()
+
+    def path_for(self, storage_account, container_name, blob_path) -> str:
+        return self.entry_path(
+            self.key_for(storage_account, container_name, blob_path)
+        )
+
+    def fetch(
+        self,
+        sas_token,
+        container_name,
+        storage_account,
+        blob_path,
+        copy_to: Optional[str] = None,
+    ) -> str:
+        """
+        Returns the path of the cached copy of a blob, downloading it
+        first when it is not cached or its ETag changed, and copies it
+        to 'copy_to' when given, before another process can replace it.
+        """
+        with self.fetch_locked(
+            sas_token, container_name, storage_account, blob_path
+        ) as path:
+            if copy_to:
+                copy_from_cache(path, copy_to)
+        return path
+
+    @contextmanager
+    def fetch_locked(
+        self, sas_token, container_name, storage_account, blob_path
+    ) -> Iterator[str]:
+        """
+        Yields the path of the up to date cached copy of a blob, see
+        fetch, which stays locked until the block exits, so that it is
+        neither replaced nor evicted while it is read.
+        """
+        key = self.key_for(storage_account, container_name, blob_path)
+        path = self.entry_path(key)
+        with self.lock(key):
+            properties = get_blob_client(
+                sas_token, container_name, storage_account, blob_path
+            ).get_blob_properties()
+            cached = self.read_metadata(key)
+            if os.path.exists(path) and cached.get("etag") == properties.etag:
+                os.utime(path)
+                update_span(outcome="cached")
+                print(f"Using the cached copy of {blob_path}")
+                yield path
+                return
+
+            etag = download_file_in_ranges(
+                sas_token, container_name, storage_account, blob_path, path
+            )
+            self.write_metadata(
+                key,
+                {
+                    "blob_path": blob_path,
+                    "etag": etag,
+                    "last_modified": str(properties.last_modified),
+                },
+            )
+            yield path
+        self.evict(keep=key)
+
+
+_blob_cache: Optional[BlobCache] = None
+
+
+def configure_blob_cache(
+    cache_dir: Optional[str], max_bytes: int = DEFAULT_BLOB_CACHE_MAX_BYTES
+) -> Optional[BlobCache]:
+    """Sets (or with None disables) the local cache of blob reads"""
+    global _blob_cache
+    _blob_cache = BlobCache(cache_dir, max_bytes) if cache_dir else None
+    return _blob_cache
+
+
+def get_blob_cache() -> Optional[BlobCache]:
+    """
+    Returns the configured blob cache, falling back to the one
+    defined by the DATA_RETRIEVAL_BLOB_CACHE_DIR environment variable.
+    """
+    if _blob_cache is None and os.getenv(BLOB_CACHE_DIR_ENV):
+        configure_blob_cache(
+            os.getenv(BLOB_CACHE_DIR_ENV),
+            int(
+                os.getenv(
+                    BLOB_CACHE_MAX_BYTES_ENV, DEFAULT_BLOB_CACHE_MAX_BYTES
+                )
+            ),
+        )
+    return _blob_cache
+
+
+def upload_files(
+    sas_token,
+    container_name,
+    storage_account,
+    files: Iterable[Tuple[str, str]],
+    workers: int = DEFAULT_BULK_WORKERS,
+) -> Dict[str, BaseException]:
+    """
+    Uploads many (local file path, blob path) pairs in parallel,
+    'workers' files at once on the shared container client,
+    each recorded as a 'blob_upload' telemetry span.
+    Returns the error of every blob path which failed.
+    """
+    return _transfer_in_bulk(
+        "blob_upload",
+        lambda blob_path, local_file_path: upload_file_in_blocks(
+            sas_token,
+            container_name,
+            storage_account,
+            local_file_path,
+            blob_path,
+        ),
+        [(blob_path, local) for local, blob_path in files],
+        workers,
+    )
+
+
+def download_files(
+    sas_token,
+    container_name,
+    storage_account,
+    blobs: Iterable[Tuple[str, str]],
+    workers: int = DEFAULT_BULK_WORKERS,
+) -> Dict[str, BaseException]:
+    """
+    Downloads many (blob path, local file path) pairs in parallel,
+    'workers' blobs at once on the shared container client,
+    each recorded as a 'blob_download' telemetry span.
+    Returns the error of every blob path which failed.
+    """
+    return _transfer_in_bulk(
+        "blob_download",
+        lambda blob_path, local_file_path: _download_file(
+            sas_token,
+            container_name,
+            storage_account,
+            blob_path,
+            local_file_path,
+        ),
+        blobs,
+        workers,
+    )
+
+
+def _transfer_in_bulk(kind, transfer, transfers, workers):
+    """
+    Calls 'transfer' with every (blob path, local file path) pair, each
+    recorded as a telemetry span of 'kind' within the context of the
+    caller, and returns the error of every blob path which failed.
+    """
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                _record_transfer,
+                kind,
+                transfer,
+                blob_path,
+                local_file_path,
+            ): blob_path
+            for blob_path, local_file_path in transfers
+        }
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                errors[futures[future]] = future.exception()
+                print(f"Transfer failed for {futures[future]}!")
+    print(
+        f"Bulk transfer completed, {len(futures) - len(errors)} "
+        f"of {len(futures)} blobs succeeded"
+    )
+    return errors
+
+
+def _record_transfer(kind, transfer, blob_path, local_file_path):
+    with record_span(kind, blob=blob_path) as record:
+        transfer(blob_path, local_file_path)
+        record["bytes"] = os.path.getsize(local_file_path)
+
+
+class SyncPlan(NamedTuple):
+    """Transfers which bring a directory and a blob prefix in sync"""
+
+    # (local file path, blob path) pairs
+    uploads: List[Tuple[str, str]]
+    # (blob path, local file path) pairs
+    downloads: List[Tuple[str, str]]
+    unchanged: int
+
+
+def list_blobs(
+    sas_token, container_name, storage_account, prefix: str
+) -> Dict[str, Any]:
+    """Returns the properties of the blobs under a prefix, by blob path"""
+    container_client = get_container_client(
+        sas_token, container_name, storage_account
+    )
+    prefix = prefix.strip("/")
+    return {
+        blob.name: blob
+        for blob in container_client.list_blobs(
+            name_starts_with=f"{prefix}/" if prefix else None
+        )
+    }
+
+
+def plan_sync(
+    local_dir: str,
+    blobs: Dict[str, Any],
+    prefix: str,
+    direction: str = "both",
+) -> SyncPlan:
+    """
+    Compares the files of a directory with the blobs of a prefix, listed
+    with list_blobs, by size and then MD5, and returns the transfers
+    of the files which are missing or differ. A blob stored without MD5
+    matches a file of its size which was not modified after it.
+    Syncing both ways, the most recently modified copy of a file wins.
+    Files are not deleted. The MD5 of unchanged local files is kept in
+    SYNC_STATE_FILE_NAME, so only new or modified files are read again.
+    """
+    if direction not in SYNC_DIRECTIONS:
+        raise ValueError(f"Unknown sync direction {direction!r}")
+    prefix = prefix.strip("/")
+    state_path = os.path.join(local_dir, SYNC_STATE_FILE_NAME)
+    state = _read_progress(state_path)
+    new_state = {}
+
+    local_files = {}
+    for root, _, file_names in os.walk(local_dir):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(path, local_dir).replace(
+                os.sep, "/"
+            )
+            # Skips the state and the files of interrupted downloads
+            if relative_path != SYNC_STATE_FILE_NAME and not (
+                file_name.endswith(
+                    (PARTIAL_SUFFIX, PARTIAL_SUFFIX + PROGRESS_SUFFIX)
+                )
+            ):
+                local_files[relative_path] = path
+
+    def local_md5(relative_path: str, stat: os.stat_result) -> bytes:
+        key = [stat.st_size, stat.st_mtime_ns]
+        cached = state.get(relative_path)
+        if cached and cached[:2] == key:
+            md5 = bytes.fromhex(cached[2])
+        else:
+            md5 = _file_md5(local_files[relative_path])
+        new_state[relative_path] = key + [md5.hex()]
+        return md5
+
+    uploads, downloads, unchanged = [], [], 0
+    relative_blobs = {
+        posixpath.relpath(name, prefix) if prefix else name: blob
+        for name, blob in blobs.items()
+    }
+    for relative_path in sorted(set(local_files) | set(relative_blobs)):
+        path = local_files.get(relative_path)
+        blob = relative_blobs.get(relative_path)
+        blob_path = posixpath.join(prefix, relative_path)
+        if blob is None:
+            if direction != "down":
+                uploads.append((path, blob_path))
+            continue
+        if path is None:
+            if direction != "up":
+                downloads.append(
+                    (
+                        blob_path,
+                        os.path.join(local_dir, *relative_path.split("/")),
+                    )
+                )
+            continue
+
+        stat = os.stat(path)
+        content_md5 = blob.content_settings.content_md5
+        if stat.st_size != blob.size:
+            same = False
+        elif content_md5:
+            same = local_md5(relative_path, stat) == content_md5
+        else:
+            same = stat.st_mtime <= blob.last_modified.timestamp()
+        if same:
+            unchanged += 1
+        elif direction == "up" or (
+            direction == "both"
+            and stat.st_mtime >= blob.last_modified.timestamp()
+        ):
+            uploads.append((path, blob_path))
+        else:
+            downloads.append((blob_path, path))
+
+    if new_state != state:
+        _write_progress(state_path, new_state)
+    return SyncPlan(uploads, downloads, unchanged)
+
+
+def sync_directory(
+    sas_token,
+    container_name,
+    storage_account,
+    local_dir: str,
+    prefix: str,
+    direction: str = "both",
+    workers: int = DEFAULT_BULK_WORKERS,
+    dry_run: bool = False,
+) -> Tuple[SyncPlan, Dict[str, BaseException]]:
+    """
+    Transfers the files of a directory and the blobs of a prefix which
+    are missing or differ on the other side, see plan_sync, 'workers'
+    files at once. Uploads store the MD5 of every file with its blob,
+    and downloaded blobs stored without MD5 get the MD5 of their file.
+    Downloaded files take the modification time of their blob, so that
+    they are not uploaded back by the next sync.
+    Returns the plan and the error of every blob path which failed.
+    """
+    os.makedirs(local_dir, exist_ok=True)
+    blobs = list_blobs(sas_token, container_name, storage_account, prefix)
+    plan = plan_sync(local_dir, blobs, prefix, direction)
+    print(
+        f"{len(plan.uploads)} files to upload, {len(plan.downloads)} to "
+        f"download, {plan.unchanged} unchanged"
+    )
+    if dry_run:
+        return plan, {}
+
+    errors: Dict[str, BaseException] = {}
+    for _, local_file_path in plan.downloads:
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+    if plan.uploads:
+        errors.update(
+            upload_files(
+                sas_token,
+                container_name,
+                storage_account,
+                plan.uploads,
+                workers,
+            )
+        )
+    if plan.downloads:
+        errors.update(
+            download_files(
+                sas_token,
+                container_name,
+                storage_account,
+                plan.downloads,
+                workers,
+            )
+        )
+    for blob_path, local_file_path in plan.downloads:
+        if blob_path not in errors:
+            _complete_sync_download(
+                get_blob_client(
+                    sas_token, container_name, storage_account, blob_path
+                ),
+                blobs[blob_path],
+                local_file_path,
+            )
+    return plan, errors
+
+
+def _complete_sync_download(
+    blob_client: "BlobClient", blob: Any, local_file_path: str
 ):
+    from azure.core import MatchConditions
+    from azure.core.exceptions import HttpResponseError
+
+    modified = blob.last_modified.timestamp()
+    os.utime(local_file_path, (modified, modified))
+    if blob.content_settings.content_md5:
+        return
+    # The other content settings are kept, as they are all replaced
+    content_settings = blob.content_settings
+    content_settings.content_md5 = bytearray(_file_md5(local_file_path))
+    try:
+        blob_client.set_http_headers(
+            content_settings=content_settings,
+            etag=blob.etag,
+            match_condition=MatchConditions.IfNotModified,
+        )
+    except HttpResponseError as e:
+        # i.e. with a read-only SAS token, the blob is compared by size
+        # and modification time until it is uploaded again
+        print(f"Could not store the MD5 of {blob_client.blob_name}: {e}")
+
+
+class BlobReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over a blob which fetches only
+    the byte ranges that are read, each with an HTTP range request,
+    and counts the bytes transferred. The last range is kept, so that
+    reading the footer of a file again does not fetch it again.
+    With a block cache, reads go through its blocks instead.
+    """
+
+    def __init__(
+        self,
+        blob_client: "BlobClient",
+        size: Optional[int] = None,
+        block_cache: Optional["BlockCache"] = None,
+    ):
+        self.blob_client = blob_client
+        self.block_cache = block_cache
+        self.etag = None
+        if size is None or block_cache:
+            properties = blob_client.get_blob_properties()
+            size = properties.size
+            self.etag = properties.etag
+        self.size = size
+        self.position = 0
+        self.bytes_read = 0
+        self.requests = 0
+        self._last_range: Tuple[int, bytes] = (0, b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        if self.position < 0:
+            raise ValueError("Negative seek position")
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        start, cached = self._last_range
+        if self.block_cache:
+            data = self.block_cache.read(
+                self.blob_client, self.etag, self.size, self.position, length
+            )
+        elif start <= self.position and self.position + length <= start + len(
+            cached
+        ):
+            offset = self.position - start
+            data = cached[offset : offset + length]
+        else:
+            data = self.blob_client.download_blob(
+                offset=self.position, length=length
+            ).readall()
+            self._last_range = (self.position, data)
+            self.bytes_read += len(data)
+            self.requests += 1
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class BlockCache:
+    """
+    On-disk cache of the fixed-size blocks of blobs read by range,
+    shared by the processes of a host: every block is its own file,
+    written atomically, under a directory of the blob and its ETag.
+    Reads fetch the missing blocks only, consecutive ones with a single
+    range request, and the least recently used blocks are removed
+    above the size limit.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = DEFAULT_BLOCK_CACHE_MAX_BYTES,
+        block_size: int = DEFAULT_CACHE_BLOCK_SIZE,
+    ):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.bytes_fetched = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def read(
+        self,
+        blob_client: "BlobClient",
+        etag: str,
+        size: int,
+        offset: int,
+        length: int,
+    ) -> bytes:
+        """Reads 'length' bytes of a blob version from 'offset'"""
+        from azure.core import MatchConditions
+
+        blob_dir = os.path.join(
+            self.cache_dir,
+            hashlib.sha256(
+                f"{blob_client.account_name}/{blob_client.container_name}/"
+                f"{blob_client.blob_name}@{etag}".encode("utf-8")
+            ).hexdigest(),
+        )
+        first = offset // self.block_size
+        last = (offset + length - 1) // self.block_size
+        blocks: Dict[int, bytes] = {}
+        missing = []
+        for index in range(first, last + 1):
+            block_path = os.path.join(blob_dir, str(index))
+            try:
+                with open(block_path, "rb") as f:
+                    blocks[index] = f.read()
+                os.utime(block_path)
+            except FileNotFoundError:
+                missing.append(index)
+
+        fetched = False
+        for run in _consecutive_runs(missing):
+            start = run[0] * self.block_size
+            end = min(size, (run[-1] + 1) * self.block_size)
+            data = blob_client.download_blob(
+                offset=start,
+                length=end - start,
+                etag=etag,
+                match_condition=MatchConditions.IfNotModified,
+            ).readall()
+            with self._lock:
+                self.bytes_fetched += len(data)
+                self.requests += 1
+            os.makedirs(blob_dir, exist_ok=True)
+            for index in run:
+                block_start = (index - run[0]) * self.block_size
+                blocks[index] = data[
+                    block_start : block_start + self.block_size
+                ]
+                _write_atomically(
+                    os.path.join(blob_dir, str(index)), blocks[index]
+                )
+            fetched = True
+        if fetched:
+            self.evict()
+
+        data = b"".join(blocks[index] for index in range(first, last + 1))
+        start = offset - first * self.block_size
+        return data[start : start + length]
+
+    def evict(self):
+        """Removes the least recently used blocks above the size limit"""
+        entries = []
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _consecutive_runs(indexes: List[int]) -> List[List[int]]:
+    runs: List[List[int]] = []
+    for index in indexes:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+def _write_atomically(file_path: str, data: bytes):
+    partial_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}"
+    with open(partial_path, "wb") as f:
+        f.write(data)
+    os.replace(partial_path, file_path)
+
+
+_block_cache: Optional[BlockCache] = None
+
+
+def configure_block_cache(
+    cache_dir: Optional[str],
+    max_bytes: int = DEFAULT_BLOCK_CACHE_MAX_BYTES,
+    block_size: int = DEFAULT_CACHE_BLOCK_SIZE,
+) -> Optional[BlockCache]:
+    """Sets (or with None resets) the block cache of open_blob"""
+    global _block_cache
+    _block_cache = (
+        BlockCache(cache_dir, max_bytes, block_size) if cache_dir else None
+    )
+    return _block_cache
+
+
+def get_block_cache() -> BlockCache:
+    """
+    Returns the configured block cache, falling back to the one defined
+    by the DATA_RETRIEVAL_BLOCK_CACHE_DIR environment variable, or else
+    to one in the temporary directory, shared by the processes of a host.
+    """
+    if _block_cache is None:
+        configure_block_cache(
+            os.getenv(
+                BLOCK_CACHE_DIR_ENV,
+                os.path.join(tempfile.gettempdir(), "data_retrieval_blocks"),
+            ),
+            int(
+                os.getenv(
+                    BLOCK_CACHE_MAX_BYTES_ENV, DEFAULT_BLOCK_CACHE_MAX_BYTES
+                )
+            ),
+        )
+    return _block_cache
+
+
+def is_blob_url(path: str) -> bool:
+    """Tells blob URLs, see get_blob_client_from_url, from local paths"""
+    return path.startswith(("az://", "https://")) and (
+        path.startswith("az://") or ".blob.core.windows.net/" in path
+    )
+
+
+def get_blob_client_from_url(url: str) -> "BlobClient":
+    """
+    Returns the client of a blob given as
+    'https://<account>.blob.core.windows.net/<container>/<path>?<SAS>'
+    or as 'az://<container>/<path>', with the storage account and SAS
+    token of the environment, see load_env_vars.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    container_name, _, blob_path = parsed.path.lstrip("/").partition("/")
+    if parsed.scheme == "az":
+        container_name, blob_path = parsed.netloc, parsed.path.lstrip("/")
+        sas_token, _, storage_account = load_env_vars()
+    else:
+        storage_account = parsed.netloc.split(".")[0]
+        sas_token = parsed.query or load_env_vars()[0]
+    if not container_name or not blob_path:
+        raise ValueError(f"Invalid blob URL: {url}")
+    return get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+
+
+def get_blob_url_with_suffix(url: str, suffix: str) -> str:
+    """Returns the URL of a blob named after another, i.e. its index"""
+    parsed = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit(parsed._replace(path=parsed.path + suffix))
+
+
+def open_blob(url: str, block_cache: Optional[BlockCache] = None):
+    """
+    Opens a blob URL as a buffered, seekable binary file which only
+    fetches the blocks that are read, through the block cache.
+    """
+    block_cache = block_cache or get_block_cache()
+    reader = BlobReader(get_blob_client_from_url(url), block_cache=block_cache)
+    return io.BufferedReader(reader, buffer_size=block_cache.block_size)
+
+
+def read_blob_to_dataframe(
+    sas_token,
+    container_name,
+    storage_account,
+    blob_path,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List[Tuple[str, str, Any]]] = None,
+    chunksize: Optional[int] = None,
+) -> Union["pd.DataFrame", "gpd.GeoDataFrame", Iterable["pd.DataFrame"], None]:
     """
     Reads data from a blob at a specified path in
     Azure Blob Storage and returns it as a DataFrame.
-    This function supports reading CSV and geospatial
-    data formats such as SHP and GeoJSON.
+    This function supports reading CSV, Parquet and GeoParquet,
+    and geospatial data formats such as SHP and GeoJSON.
+    Parquet is read with range requests for the footer and for the
+    'columns' of the row groups whose statistics may match 'filters',
+    i.e. [("iso", "==", "ETH")], which are then applied to the rows.
+    CSV is streamed, and with 'chunksize' returned as an iterator of
+    DataFrames of this many rows.
+    With a blob cache configured, the blob is read from its cached copy,
+    see BlobCache.
     """
-    base_url = f"https://{storage_account}.blob.core.windows.net"
-    sas_url = f"{base_url}/{container_name}/{blob_path}" f"?{sas_token}"
+    import geopandas as gpd
+    import pandas as pd
+
+    blob_client = get_blob_client(
+        sas_token, container_name, storage_account, blob_path
+    )
+    file_format = blob_path.split(".")[-1].lower()
+    cache = get_blob_cache()
+    if cache and file_format in ["parquet", "geoparquet", "csv"]:
+        with cache.fetch_locked(
+            sas_token, container_name, storage_account, blob_path
+        ) as cached_path:
+            if file_format != "csv":
+                with open(cached_path, "rb") as f:
+                    return _read_parquet(f, columns, filters)
+            # With 'chunksize', the file is opened here and the chunks are
+            # read from it later, which still reads this copy on POSIX
+            # systems even once the entry is replaced or evicted
+            return pd.read_csv(
+                cached_path, usecols=columns, chunksize=chunksize
+            )
+    if file_format in ["parquet", "geoparquet"]:
+        reader = BlobReader(blob_client)
+        df = _read_parquet(reader, columns, filters)
+        print(
+            f"Read {reader.bytes_read} of {reader.size} bytes of "
+            f"{blob_path} in {reader.requests} requests"
+        )
+        return df
+    if file_format in ["csv"]:
+        stream = io.TextIOWrapper(
+            io.BufferedReader(
+                BlobReader(blob_client), buffer_size=DEFAULT_READ_SIZE
+            ),
+            encoding="utf-8",
+        )
+        return pd.read_csv(stream, usecols=columns, chunksize=chunksize)
 
-    blob_client = BlobClient.from_blob_url(blob_url=sas_url)
-    download_stream = blob_client.download_blob()
-    content = download_stream.readall()
+    if cache:
+        with cache.fetch_locked(
+            sas_token, container_name, storage_account, blob_path
+        ) as cached_path, open(cached_path, "rb") as f:
+            content = f.read()
+    else:
+        content = blob_client.download_blob(
+            max_concurrency=_settings.max_concurrency
+        ).readall()
     if not content:
         print(f"The blob at {blob_path} is empty or could not be read.")
         return
-    file_format = blob_path.split(".")[-1].lower()
-    if file_format in ["csv"]:
-        data_str = StringIO(content.decode("utf-8"))
-        df = pd.read_csv(data_str)
-    elif file_format in ["shp", "geojson"]:
+    if file_format in ["shp", "geojson"]:
         # Use GeoDataFrame for geospatial data
         data_bytes = BytesIO(content)
         df = gpd.read_file(
@@ -101,3 +1266,39 @@ def read_blob_to_dataframe(
         print(f"Unsupported file format: {file_format}")
         return None
     return df
+
+
+def _read_parquet(
+    source,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List[Tuple[str, str, Any]]] = None,
+) -> Union["pd.DataFrame", "gpd.GeoDataFrame"]:
+    """
+    Reads a Parquet file, as a GeoDataFrame if it has GeoParquet
+    metadata, skipping the row groups which cannot match 'filters'
+    """
+    import geopandas as gpd
+    import pyarrow.parquet as pq
+
+    geo = pq.read_schema(source).metadata or {}
+    geo = json.loads(geo[b"geo"]) if b"geo" in geo else None
+    if geo and columns and geo["primary_column"] not in columns:
+        columns = [*columns, geo["primary_column"]]
+
+    table = pq.read_table(source, columns=columns, filters=filters)
+    df = table.to_pandas()
+    if not geo:
+        return df
+
+    from pyproj import CRS
+
+    for name, column in geo["columns"].items():
+        if name not in df:
+            continue
+        # A missing CRS is the default one, an explicit null is unknown
+        crs = column.get("crs", GEOPARQUET_DEFAULT_CRS)
+        df[name] = gpd.GeoSeries.from_wkb(
+            df[name],
+            crs=CRS.from_json_dict(crs) if isinstance(crs, dict) else crs,
+        )
+    return gpd.GeoDataFrame(df, geometry=geo["primary_column"])
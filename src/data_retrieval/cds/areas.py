@@ -0,0 +1,140 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Bounds of an area as (north, west, south, east) in degrees
+Bounds = Tuple[float, float, float, float]
+
+# Degrees added around an area requested from the CDS, so that the grid
+# points just outside of it, used when interpolating, are retrieved too
+DEFAULT_AREA_BUFFER: float = 1.0
+
+# Largest increase of requested grid points, relative to the areas
+# requested one by one, accepted when merging areas into one request
+DEFAULT_MAX_OVERHEAD: float = 0.5
+
+
+def parse_bbox(bbox: str) -> Bounds:
+    """Parses an 'N/W/S/E' bounding box string into numeric bounds"""
+    try:
+        north, west, south, east = (float(edge) for edge in bbox.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid bounding box, expected N/W/S/E: {bbox!r}")
+    return north, west, south, east
+
+
+def format_bbox(bounds: Bounds) -> str:
+    return "/".join(f"{edge:g}" for edge in bounds)
+
+
+def union_bbox(bboxes: Iterable[str]) -> str:
+    """Returns the smallest 'N/W/S/E' bounding box containing all others"""
+    bounds = [parse_bbox(bbox) for bbox in bboxes]
+    return format_bbox(
+        (
+            max(north for north, _, _, _ in bounds),
+            min(west for _, west, _, _ in bounds),
+            min(south for _, _, south, _ in bounds),
+            max(east for _, _, _, east in bounds),
+        )
+    )
+
+
+def bbox_contains_point(bbox: str, lat: float, lon: float) -> bool:
+    north, west, south, east = parse_bbox(bbox)
+    return south <= lat <= north and west <= lon <= east
+
+
+def bbox_center(bbox: str) -> Tuple[float, float]:
+    north, west, south, east = parse_bbox(bbox)
+    return (north + south) / 2, (west + east) / 2
+
+
+def snap_bbox(
+    bbox: str, grid: str, buffer: float = DEFAULT_AREA_BUFFER
+) -> str:
+    """
+    Widens an 'N/W/S/E' area by 'buffer' degrees on every side and
+    outwards to the nearest points of a regular lat/lon 'grid', within
+    the globe, so that the requested area starts and ends on grid points.
+    """
+    lat_step, lon_step = (float(step) for step in grid.split("/"))
+    north, west, south, east = parse_bbox(bbox)
+
+    def snap(value: float, step: float, rounding) -> float:
+        # Rounded first so that values already on the grid stay there
+        return rounding(round(value / step, 6)) * step
+
+    return format_bbox(
+        (
+            min(90.0, snap(north + buffer, lat_step, math.ceil)),
+            max(-180.0, snap(west - buffer, lon_step, math.floor)),
+            max(-90.0, snap(south - buffer, lat_step, math.floor)),
+            min(180.0, snap(east + buffer, lon_step, math.ceil)),
+        )
+    )
+
+
+def get_boundary_bbox(file_path: str) -> str:
+    """
+    Returns the 'N/W/S/E' bounding box of the shapes of a boundary file,
+    i.e. a Shapefile or GeoJSON of admin areas, in degrees.
+    """
+    import geopandas as gpd
+
+    boundaries = gpd.read_file(file_path)
+    if boundaries.crs is not None:
+        boundaries = boundaries.to_crs("EPSG:4326")
+    west, south, east, north = boundaries.total_bounds
+    return format_bbox((north, west, south, east))
+
+
+def count_grid_points(area: Optional[str], grid: str) -> int:
+    """
+    Returns the number of points of a regular lat/lon 'grid'
+    (i.e. '0.4/0.4') within an 'N/W/S/E' area, or globally if None
+    """
+    lat_step, lon_step = (float(step) for step in grid.split("/"))
+    if area is None:
+        north, west, south, east = 90.0, 0.0, -90.0, 360.0 - lon_step
+    else:
+        north, west, south, east = parse_bbox(area)
+    # Small tolerance so that exact multiples of the step are included
+    lat_points = math.floor((north - south) / lat_step + 1e-6) + 1
+    lon_points = math.floor((east - west) / lon_step + 1e-6) + 1
+    return lat_points * lon_points
+
+
+def group_bboxes(
+    bboxes: Dict[str, str],
+    grid: str,
+    max_overhead: float = DEFAULT_MAX_OVERHEAD,
+) -> List[List[str]]:
+    """
+    Groups named bounding boxes into as few union areas as possible.
+    Groups are merged, closest first, as long as the union requests at
+    most 'max_overhead' more grid points than the areas one by one,
+    so overlapping and neighbouring areas end up in the same request.
+    """
+    groups: List[Tuple[List[str], int, str]] = [
+        ([name], count_grid_points(bbox, grid), bbox)
+        for name, bbox in bboxes.items()
+    ]
+    while len(groups) > 1:
+        best = None
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                separate_points = groups[i][1] + groups[j][1]
+                union = union_bbox([groups[i][2], groups[j][2]])
+                union_points = count_grid_points(union, grid)
+                if union_points > (1 + max_overhead) * separate_points:
+                    continue
+                extra_points = union_points - separate_points
+                if best is None or extra_points < best[0]:
+                    best = (extra_points, i, j, union)
+        if best is None:
+            break
+        _, i, j, union = best
+        merged = (groups[i][0] + groups[j][0], groups[i][1] + groups[j][1])
+        groups = [g for k, g in enumerate(groups) if k not in (i, j)]
+        groups.append((*merged, union))
+    return sorted(sorted(names) for names, _, _ in groups)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .file_cache import FileCache
+
+CACHE_DIR_ENV: str = "DATA_RETRIEVAL_CACHE_DIR"
+CACHE_MAX_BYTES_ENV: str = "DATA_RETRIEVAL_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES: int = 50 * 1024**3
+
+# Request keys which only tell the client where to write the result
+IGNORED_METADATA_KEYS = frozenset({"target"})
+
+
+def get_request_key(name: str, metadata: Dict[str, Any]) -> str:
+    """
+    Returns a stable hash of a retrieval request, two requests
+    with the same name and metadata always share the same key
+    regardless of the key order or of the requested target.
+    """
+    canonical = json.dumps(
+        {
+            "name": name,
+            "metadata": {
+                key: value
+                for key, value in metadata.items()
+                if key not in IGNORED_METADATA_KEYS
+            },
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class RequestCache(FileCache):
+    """
+    Content-addressed on-disk cache of retrieved files with
+    a size-bounded least recently used eviction policy.
+    Entries are written atomically and concurrent fetches of the same
+    key, from threads or from processes on the same host,
+    collapse into a single retrieval.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def path_for(self, key: str) -> str:
+        return self.entry_path(key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the path of a cached entry and marks it as recently used"""
+        return self.touch(key)
+
+    def fetch(self, key: str, retrieve: Callable[[str], Any]) -> str:
+        """
+        Returns the path of the cached entry for 'key', calling
+        'retrieve' with a temporary path to fill it on a cache miss.
+        """
+        with self.fetch_locked(key, retrieve) as path:
+            return path
+
+    @contextmanager
+    def fetch_locked(
+        self, key: str, retrieve: Callable[[str], Any]
+    ) -> Iterator[str]:
+        """
+        Yields the path of the cached entry for 'key', see fetch, which
+        stays locked until the block exits, so that it can be copied or
+        read before it is evicted.
+        """
+        with self.lock(key):
+            cached = self.get(key)
+            if cached:
+                yield cached
+                return
+
+            path = self.path_for(key)
+            partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            try:
+                retrieve(partial_path)
+                os.replace(partial_path, path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            yield path
+
+        self.evict(keep=key)
+
+
+_default_cache: Optional[RequestCache] = None
+
+
+def configure_cache(
+    cache_dir: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES
+) -> Optional[RequestCache]:
+    """Sets (or with None disables) the cache used by retrieval functions"""
+    global _default_cache
+    _default_cache = RequestCache(cache_dir, max_bytes) if cache_dir else None
+    return _default_cache
+
+
+def get_default_cache() -> Optional[RequestCache]:
+    """
+    Returns the configured cache, falling back to the one
+    defined by the DATA_RETRIEVAL_CACHE_DIR environment variable.
+    """
+    if _default_cache is None and os.getenv(CACHE_DIR_ENV):
+        configure_cache(
+            os.getenv(CACHE_DIR_ENV),
+            int(os.getenv(CACHE_MAX_BYTES_ENV, DEFAULT_MAX_BYTES)),
+        )
+    return _default_cache
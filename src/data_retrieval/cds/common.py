@@ -1,74 +1,177 @@
 import os
 import tempfile
 from io import BytesIO
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-import cdsapi
-import pandas as pd
-from ecmwfapi import ECMWFService
+from .cache import get_default_cache, get_request_key
+from .file_cache import copy_from_cache
+from .jobs import CdsJobRunner
+from .retry import retry_call
+from .telemetry import mark_transfer_start, record_span, update_span
+from .verify import is_verification_enabled, verify_grib
+
+
+def format_span(values: List[int]) -> str:
+    """Formats a sorted list of years or months as '1981' or '1981-1990'"""
+    if len(values) == 1:
+        return str(values[0])
+    return f"{values[0]}-{values[-1]}"
 
 
 def get_dates(year: int) -> str:
-    start_date = pd.to_datetime(f"{year}-01-01")
-    end_date = pd.to_datetime(f"{year}-12-01")
+    """Returns the first day of every month of a year, '/' separated"""
+    return "/".join(f"{year}-{month:02d}-01" for month in range(1, 13))
 
-    # Generate a sequence of monthly dates
-    date_range = pd.date_range(start=start_date, end=end_date, freq="MS")
 
-    # Convert the date range to a list of formatted strings
-    date_strings = (
-        date_range.to_series()
-        .apply(lambda date: date.strftime("%Y-%m-%d"))
-        .to_list()
-    )
+def read_cached(
+    name: str,
+    metadata: Dict[str, Any],
+    retrieve: Callable[[str], Any],
+    file_path: Optional[str] = None,
+) -> Optional[BytesIO]:
+    """
+    Serves a request from the configured request cache,
+    calling 'retrieve' with a target path only on a cache miss,
+    and returns it like the download functions do.
+    """
+    cache = get_default_cache()
+    retrieved = []
 
-    # Join the list of formatted strings into a single string with "/"
-    dates: str = "/".join(date_strings)
+    def retrieve_missing(target: str):
+        retrieved.append(target)
+        return retrieve(target)
 
-    return dates
+    # The entry is copied or read while locked, so it is not evicted
+    with cache.fetch_locked(
+        get_request_key(name, metadata), retrieve_missing
+    ) as cached_path:
+        if not retrieved:
+            update_span(outcome="cached")
+
+        if file_path:
+            copy_from_cache(cached_path, file_path)
+            print(f"Downloaded locally: {file_path}")
+            return None
+        with open(cached_path, "rb") as cached:
+            data = BytesIO(cached.read())
+    print("Downloaded in memory and ready for further processing")
+    return data
 
 
 def download_cds(
-    name: str, metadata: Dict[str, Any], file_path: Optional[str] = None
+    name: str,
+    metadata: Dict[str, Any],
+    file_path: Optional[str] = None,
+    runner: Optional[CdsJobRunner] = None,
+    expected_messages: Optional[int] = None,
 ) -> Optional[BytesIO]:  # noqa: E501
-    client = cdsapi.Client()
-
-    if file_path:
-        # Save directly to the specified path
-        client.retrieve(name, metadata, file_path)
-        print(f"Downloaded locally: {file_path}")
-        return None
-    else:
-        # Use a temporary file for in-memory operations
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            client.retrieve(name, metadata, tmp.name)
-            tmp.seek(0)  # Rewind to read content
-            data = BytesIO(tmp.read())
-
-        os.unlink(tmp.name)
-        print("Downloaded in memory and ready for further processing")
-        return data
+    """
+    Retrieves a CDS request, through the job runner when given
+    so that its queue time overlaps with the other requests.
+    A GRIB result is verified to hold 'expected_messages' when given.
+    """
+
+    def retrieve(target: str):
+        if runner:
+            runner.retrieve(name, metadata, target)
+            return
+        import cdsapi
+
+        # Waits for the request to complete, then downloads the result
+        remote = cdsapi.Client().retrieve(name, metadata)
+        mark_transfer_start()
+        remote.download(target)
+
+    return _download(
+        "cds", name, metadata, retrieve, file_path, expected_messages
+    )
 
 
 def download_mars(
-    metadata: Dict[str, Any], file_path: Optional[str] = None
+    metadata: Dict[str, Any],
+    file_path: Optional[str] = None,
+    expected_messages: Optional[int] = None,
 ) -> Optional[BytesIO]:  # noqa: E501
-    server = ECMWFService("mars")
-
-    if file_path:
-        # Download directly to the specified file path
-        server.execute(metadata, file_path)
-        print(f"Downloaded locally: {file_path}")
-        return None
-    else:
-        # Use a temporary file to handle the
-        # download and return a BytesIO object
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            server.execute(metadata, tmp.name)
-            tmp.seek(0)  # Rewind the file to read its content
-            data = BytesIO(tmp.read())
-
-        os.unlink(tmp.name)  # Delete the temporary file after reading
-        data.seek(0)  # Rewind the BytesIO object for further use
-        print("Downloaded data to memory")
+    from ecmwfapi import ECMWFService
+
+    return _download(
+        "mars",
+        "mars",
+        metadata,
+        lambda target: ECMWFService("mars", log=_log_mars).execute(
+            metadata, target
+        ),
+        file_path,
+        expected_messages,
+    )
+
+
+def _log_mars(message: str):
+    # The MARS client only reports the start of the transfer in its log
+    if message.startswith("Transfering"):
+        mark_transfer_start()
+    from ecmwfapi.api import print_with_timestamp
+
+    print_with_timestamp(message)
+
+
+def _download(
+    kind: str,
+    name: str,
+    metadata: Dict[str, Any],
+    retrieve: Callable[[str], Any],
+    file_path: Optional[str] = None,
+    expected_messages: Optional[int] = None,
+) -> Optional[BytesIO]:
+    """
+    Retrieves a request to 'file_path', or in memory without one,
+    through the request cache when configured, and records it
+    in the retrieval telemetry.
+    Failed retrievals are retried with backoff, and so are GRIB files
+    which do not hold 'expected_messages' complete messages. As the
+    file is verified before it is cached or returned, a corrupt file
+    is neither cached nor uploaded.
+    """
+
+    def retrieve_verified(target: str):
+        def attempt():
+            retrieve(target)
+            if expected_messages is not None and is_verification_enabled():
+                verify_grib(target, expected_messages)
+
+        try:
+            retry_call(attempt, f"Retrieval of {name}")
+        except Exception:
+            if os.path.exists(target):
+                os.remove(target)
+            raise
+
+    with record_span(
+        kind, request=get_request_key(name, metadata), dataset=name
+    ) as record:
+        if get_default_cache():
+            data = read_cached(name, metadata, retrieve_verified, file_path)
+        elif file_path:
+            # Save directly to the specified path
+            retrieve_verified(file_path)
+            print(f"Downloaded locally: {file_path}")
+            data = None
+        else:
+            # Use a temporary file for in-memory operations
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                tmp_path = tmp.name
+            try:
+                retrieve_verified(tmp_path)
+                with open(tmp_path, "rb") as f:
+                    data = BytesIO(f.read())
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            print("Downloaded in memory and ready for further processing")
+
+        record["bytes"] = (
+            os.path.getsize(file_path)
+            if file_path
+            else data.getbuffer().nbytes
+        )
         return data
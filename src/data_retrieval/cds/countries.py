@@ -0,0 +1,164 @@
+import csv
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from .areas import Bounds, format_bbox, parse_bbox
+
+COUNTRY_BBOX_PATH: str = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        "..",
+        "static_data",
+        "country_bbox.csv",
+    )
+)
+# Size in degrees of the cells of the spatial index
+INDEX_CELL_DEGREES: float = 10.0
+
+
+class Country(NamedTuple):
+    iso: str
+    name: str
+    # Bounding box as an 'N/W/S/E' string, as requested from MARS
+    bbox: str
+    bounds: Bounds
+
+
+class CountryRegistry:
+    """
+    Table of the supported countries and their bounding boxes, looked up
+    by ISO code or by location. The bounds are kept in a single array,
+    and a grid of INDEX_CELL_DEGREES cells lists the countries touching
+    each cell, so spatial lookups only check the countries nearby.
+    """
+
+    def __init__(self, countries: Iterable[Tuple[str, str, str]]):
+        self._isos: List[str] = []
+        self._names: List[str] = []
+        self._bboxes: List[str] = []
+        self._positions: Dict[str, int] = {}
+        for iso, name, bbox in countries:
+            iso = iso.upper()
+            if iso in self._positions:
+                raise ValueError(f"Multiple entries for the ISO code {iso}")
+            self._positions[iso] = len(self._isos)
+            self._isos.append(iso)
+            self._names.append(name)
+            self._bboxes.append(bbox)
+        # Columns north, west, south and east
+        self._bounds = np.array(
+            [parse_bbox(bbox) for bbox in self._bboxes], dtype="float64"
+        ).reshape(-1, 4)
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for position, bounds in enumerate(self._bounds):
+            for cell in _cells_of(*bounds):
+                self._cells.setdefault(cell, []).append(position)
+
+    @classmethod
+    def from_csv(cls, file_path: str = COUNTRY_BBOX_PATH) -> "CountryRegistry":
+        """Reads a CSV file with the columns iso, name_en and bbox"""
+        with open(file_path, newline="", encoding="utf-8") as f:
+            return cls(
+                (row["iso"], row["name_en"], row["bbox"])
+                for row in csv.DictReader(f)
+            )
+
+    def __len__(self) -> int:
+        return len(self._isos)
+
+    def __contains__(self, iso: str) -> bool:
+        return iso.upper() in self._positions
+
+    def __iter__(self):
+        return (self._country(i) for i in range(len(self._isos)))
+
+    def get(self, iso: str) -> Optional[Country]:
+        """Returns the country of an ISO code, in any case, if supported"""
+        position = self._positions.get(iso.upper())
+        return None if position is None else self._country(position)
+
+    def countries_at(self, lat: float, lon: float) -> List[Country]:
+        """Returns the countries whose bounding box contains a point"""
+        candidates = self._candidates(lat, lon, lat, lon)
+        north, west, south, east = self._bounds[candidates].T
+        inside = (south <= lat) & (lat <= north)
+        inside &= (west <= lon) & (lon <= east)
+        return [self._country(i) for i in candidates[inside]]
+
+    def countries_intersecting(self, bbox: str) -> List[Country]:
+        """Returns the countries whose bounding box intersects an area"""
+        north, west, south, east = parse_bbox(bbox)
+        candidates = self._candidates(north, west, south, east)
+        c_north, c_west, c_south, c_east = self._bounds[candidates].T
+        overlaps = (c_south <= north) & (south <= c_north)
+        overlaps &= (c_west <= east) & (west <= c_east)
+        return [self._country(i) for i in candidates[overlaps]]
+
+    def union_bbox(self, isos: Iterable[str]) -> str:
+        """Returns the smallest 'N/W/S/E' bounding box of the countries"""
+        positions = [self._position(iso) for iso in isos]
+        if not positions:
+            raise ValueError("No country given")
+        bounds = self._bounds[positions]
+        return format_bbox(
+            (
+                bounds[:, 0].max(),
+                bounds[:, 1].min(),
+                bounds[:, 2].min(),
+                bounds[:, 3].max(),
+            )
+        )
+
+    def _position(self, iso: str) -> int:
+        try:
+            return self._positions[iso.upper()]
+        except KeyError:
+            raise KeyError(f"{iso} is not a supported ISO code") from None
+
+    def _candidates(
+        self, north: float, west: float, south: float, east: float
+    ) -> np.ndarray:
+        positions: Set[int] = set()
+        for cell in _cells_of(north, west, south, east):
+            positions.update(self._cells.get(cell, ()))
+        return np.array(sorted(positions), dtype="int64")
+
+    def _country(self, position: int) -> Country:
+        return Country(
+            self._isos[position],
+            self._names[position],
+            self._bboxes[position],
+            tuple(float(edge) for edge in self._bounds[position]),
+        )
+
+
+def _cells_of(
+    north: float, west: float, south: float, east: float
+) -> Iterable[Tuple[int, int]]:
+    """Returns the cells of the spatial index an area touches"""
+    rows = range(
+        math.floor(south / INDEX_CELL_DEGREES),
+        math.floor(north / INDEX_CELL_DEGREES) + 1,
+    )
+    columns = range(
+        math.floor(west / INDEX_CELL_DEGREES),
+        math.floor(east / INDEX_CELL_DEGREES) + 1,
+    )
+    return [(row, column) for row in rows for column in columns]
+
+
+_default_registry: Optional[CountryRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_country_registry() -> CountryRegistry:
+    """Returns the registry of the supported countries, read once"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = CountryRegistry.from_csv()
+        return _default_registry
@@ -1,8 +1,13 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Any, Dict, List, Optional
 
-from .common import download_cds
+from .areas import parse_bbox
+from .common import download_cds, format_span
+
+RETRIEVE_NAME: str = "seasonal-monthly-single-levels"
+ALL_LEADTIME_MONTHS: List[int] = list(range(1, 7))
 
 
 # Function to create a single API request for the specified years,
@@ -12,6 +17,7 @@ def get_ecmwf_cds_metadata(
     months: List[int],
     leadtime_months: List[int],
     format: str = "grib",
+    area: Optional[str] = None,
 ) -> Dict[str, Any]:
     ecmwf_cds_metadata: Dict[str, Any] = {
         "product_type": "monthly_mean",
@@ -25,10 +31,36 @@ def get_ecmwf_cds_metadata(
             str(leadtime_month) for leadtime_month in leadtime_months
         ],
     }
+    # Global fields unless an 'N/W/S/E' area is given
+    if area:
+        ecmwf_cds_metadata["area"] = list(parse_bbox(area))
 
     return ecmwf_cds_metadata
 
 
+def get_ecmwf_cds_file_name(
+    years: List[int],
+    leadtime_months: List[int],
+    format: str = "grib",
+    area_name: Optional[str] = None,
+) -> str:
+    """
+    Returns the file name of a partition of the ECMWF seasonal forecast,
+    the same locally and in the blob container, i.e.
+    'ecmwf-monthly-seasonalforecast-1981-2023.grib' for all leadtimes or
+    'ecmwf-monthly-seasonalforecast-1981-lt1.netcdf' for a single one.
+    Partitions of an area are named after it, i.e.
+    'ecmwf-monthly-seasonalforecast-eth-1981-2023.grib'.
+    """
+    area_prefix = f"{area_name}-" if area_name else ""
+    leadtime_span = (
+        ""
+        if sorted(leadtime_months) == ALL_LEADTIME_MONTHS
+        else f"-lt{format_span(leadtime_months)}"
+    )
+    return f"ecmwf-monthly-seasonalforecast-{area_prefix}{format_span(years)}{leadtime_span}.{format}"  # noqa: E501
+
+
 def download_ecmwf_cds(
     years: List[int],
     months: List[int],
@@ -36,9 +68,14 @@ def download_ecmwf_cds(
     download_path: Optional[str] = None,
     format: str = "grib",
     file_name: Optional[str] = None,
+    workers: int = 1,
+    area: Optional[str] = None,
+    area_name: Optional[str] = None,
 ) -> Optional[BytesIO]:
-    retrieve_name = "seasonal-monthly-single-levels"
-    metadata = get_ecmwf_cds_metadata(years, months, leadtime_months, format)
+    retrieve_name = RETRIEVE_NAME
+    metadata = get_ecmwf_cds_metadata(
+        years, months, leadtime_months, format, area
+    )
 
     if download_path and file_name:
         if format == "grib":
@@ -47,13 +84,35 @@ def download_ecmwf_cds(
             download_cds(retrieve_name, metadata, file_path)
             print(f"Downloaded {file_name} to {file_path}")
         else:
-            for year in years:
-                for leadtime_month in leadtime_months:
-                    netcdf_file_name = f"ecmwf_global_forecast_{year}_lt{leadtime_month}.{format}"  # noqa: E501
-                    file_path = os.path.join(download_path, netcdf_file_name)
-                    metadata["target"] = file_path
-                    download_cds(retrieve_name, metadata, file_path)
-                    print(f"Downloaded {netcdf_file_name} to {file_path}")
+            # One file per year and leadtime month, each with a request
+            # scoped to its own partition, retrieved on 'workers' threads
+            partitions = [
+                (year, leadtime_month)
+                for year in years
+                for leadtime_month in leadtime_months
+            ]
+
+            def download_partition(partition):
+                year, leadtime_month = partition
+                # A single partition request keeps the given name
+                netcdf_file_name = (
+                    file_name
+                    if len(partitions) == 1
+                    else get_ecmwf_cds_file_name(
+                        [year], [leadtime_month], format, area_name
+                    )
+                )
+                file_path = os.path.join(download_path, netcdf_file_name)
+                partition_metadata = get_ecmwf_cds_metadata(
+                    [year], months, [leadtime_month], format, area
+                )
+                partition_metadata["target"] = file_path
+                download_cds(retrieve_name, partition_metadata, file_path)
+                print(f"Downloaded {netcdf_file_name} to {file_path}")
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Consume the results so that failures are raised
+                list(executor.map(download_partition, partitions))
         return None
     else:
         # If no file path is provided, handle the download in memory
@@ -2,11 +2,15 @@ import os
 from io import BytesIO
 from typing import Any, Dict, List, Optional
 
+from .areas import parse_bbox
 from .common import download_cds
 
 
 def get_era5_cds_metadata(
-    years: List[int], months: List[int], file_type: str
+    years: List[int],
+    months: List[int],
+    file_type: str,
+    area: Optional[str] = None,
 ) -> Dict[str, Any]:
     era5_cds_metadata: Dict[str, Any] = {
         "product_type": "monthly_averaged_reanalysis",
@@ -16,6 +20,9 @@ def get_era5_cds_metadata(
         "time": "00:00",
         "format": file_type,
     }
+    # Global fields unless an 'N/W/S/E' area is given
+    if area:
+        era5_cds_metadata["area"] = list(parse_bbox(area))
 
     return era5_cds_metadata
 
@@ -25,6 +32,7 @@ def download_era5_cds(
     months: List[int],
     file_name: str,
     download_path: Optional[str] = None,
+    area: Optional[str] = None,
 ) -> Optional[BytesIO]:
     retrieve_name = "reanalysis-era5-single-levels-monthly-means"
     file_type = (
@@ -32,7 +40,7 @@ def download_era5_cds(
     )  # Assumes file_name includes an extension
 
     # Prepare metadata with appropriate file type
-    era5_cds_metadata = get_era5_cds_metadata(years, months, file_type)
+    era5_cds_metadata = get_era5_cds_metadata(years, months, file_type, area)
 
     if download_path:
         # Construct the full file path if a download path is specified
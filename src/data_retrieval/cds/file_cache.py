@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+DATA_SUFFIX: str = ".data"
+LOCK_SUFFIX: str = ".lock"
+METADATA_SUFFIX: str = ".json"
+# Linux ioctl cloning a file, see ioctl_ficlone(2)
+_FICLONE: int = 0x40049409
+
+
+class FileCache:
+    """
+    Directory of cache entries, one '<key>.data' file each with an
+    optional '<key>.json' metadata file, with a size-bounded least
+    recently used eviction. Entries are locked for the threads of this
+    process and, with a lock file, for the other processes sharing the
+    directory, see lock. The request cache and the blob cache add how
+    entries are filled.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def entry_path(self, key: str, suffix: str = DATA_SUFFIX) -> str:
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def touch(self, key: str) -> Optional[str]:
+        """Returns the path of a cached entry and marks it as recently used"""
+        path = self.entry_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def read_metadata(self, key: str) -> Dict[str, Any]:
+        """Returns the metadata of an entry, empty when it has none"""
+        try:
+            with open(self.entry_path(key, METADATA_SUFFIX)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_metadata(self, key: str, metadata: Dict[str, Any]):
+        """Replaces the metadata of an entry atomically"""
+        path = self.entry_path(key, METADATA_SUFFIX)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(metadata, f)
+        os.replace(f"{path}.tmp", path)
+
+    def evict(self, keep: Optional[str] = None):
+        """Removes the least recently used entries above the size limit"""
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(DATA_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+            except FileNotFoundError:
+                continue
+            entries.append(
+                (stat.st_mtime, stat.st_size, file_name[: -len(DATA_SUFFIX)])
+            )
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            with self.lock(key, blocking=False) as locked:
+                # Skip entries being written or read elsewhere
+                if not locked:
+                    continue
+                # The lock file goes last, while it is still held, see lock
+                for suffix in (DATA_SUFFIX, METADATA_SUFFIX, LOCK_SUFFIX):
+                    try:
+                        os.remove(self.entry_path(key, suffix))
+                    except FileNotFoundError:
+                        pass
+            total -= size
+
+    @contextmanager
+    def lock(self, key: str, blocking: bool = True) -> Iterator[bool]:
+        """
+        Locks an entry while it is filled, read or removed, yielding
+        False when 'blocking' is False and it is already locked.
+        """
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(key, threading.Lock())
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            lock_file = self._lock_file(key, blocking)
+            if lock_file is None:
+                yield False
+                return
+            with lock_file:
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            thread_lock.release()
+
+    def _lock_file(self, key: str, blocking: bool):
+        """
+        Opens and locks the lock file of an entry, or returns None when
+        it is locked and 'blocking' is False. Eviction removes the lock
+        file while holding it, so a lock taken on a file which was
+        removed meanwhile is retried on the new one.
+        """
+        lock_path = self.entry_path(key, LOCK_SUFFIX)
+        flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock_file, flags)
+                if os.path.samestat(
+                    os.fstat(lock_file.fileno()), os.stat(lock_path)
+                ):
+                    return lock_file
+            except (BlockingIOError, FileNotFoundError):
+                lock_file.close()
+                if not blocking:
+                    return None
+                continue
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+def copy_from_cache(cached_path: str, file_path: str):
+    """
+    Materialises a cached entry at 'file_path' as a copy, which shares
+    its blocks with the entry where the file system supports reflinks.
+    It is never a hard link, so changing the file does not change the
+    entry served to later reads.
+    """
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    if not _reflink(cached_path, file_path):
+        shutil.copyfile(cached_path, file_path)
+
+
+def _reflink(source_path: str, target_path: str) -> bool:
+    """Clones a file, i.e. on Btrfs or XFS, returning False if unsupported"""
+    if fcntl is None:
+        return False
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+        except OSError:
+            return False
+    return True
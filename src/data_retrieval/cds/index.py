@@ -0,0 +1,150 @@
+import json
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+from .verify import iter_grib_messages
+
+INDEX_SUFFIX: str = ".index"
+
+_enabled: bool = True
+
+
+def configure_indexing(enabled: bool):
+    """Enables or disables the sidecar index of retrieved GRIB files"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_indexing_enabled() -> bool:
+    return _enabled
+
+
+def get_index_path(file_path: str) -> str:
+    """Returns the path of the sidecar index of a GRIB file"""
+    return file_path + INDEX_SUFFIX
+
+
+def build_grib_index(file_path: str, index_path: Optional[str] = None) -> str:
+    """
+    Writes the index of a GRIB file next to it, one JSON line per
+    message with its parameter, start year and month, leadtime month,
+    ensemble number and step, and its '_offset' and '_length' in bytes,
+    like the indexes of the ECMWF open data. Fields a message does not
+    define, i.e. the ensemble number of ERA5, are null.
+    Returns the path of the index.
+    """
+    import eccodes
+
+    index_path = index_path or get_index_path(file_path)
+    with open(file_path, "rb") as source, open(index_path, "w") as index:
+        for offset, length in iter_grib_messages(file_path):
+            source.seek(offset)
+            gid = eccodes.codes_new_from_message(source.read(length))
+            try:
+                entry = _read_entry(eccodes, gid)
+            finally:
+                eccodes.codes_release(gid)
+            entry.update(_offset=offset, _length=length)
+            index.write(json.dumps(entry) + "\n")
+    return index_path
+
+
+def read_grib_index(index_path: str) -> List[Dict[str, Any]]:
+    with open(index_path) as f:
+        return parse_grib_index(f)
+
+
+def parse_grib_index(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Parses the lines of an index, i.e. one read from storage"""
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def select_messages(
+    entries: List[Dict[str, Any]], **fields
+) -> List[Dict[str, Any]]:
+    """
+    Returns the index entries matching every given field, each either
+    a single value or a list of values, i.e. year=2021, leadtime=[1, 2].
+    """
+    wanted = {
+        key: set(value) if isinstance(value, (list, tuple, set)) else {value}
+        for key, value in fields.items()
+    }
+    return [
+        entry
+        for entry in entries
+        if all(entry.get(key) in values for key, values in wanted.items())
+    ]
+
+
+def read_messages(
+    file: Union[str, BinaryIO], entries: List[Dict[str, Any]]
+) -> Iterator[bytes]:
+    """
+    Reads the messages of the given index entries straight from a file,
+    given by its path or as a seekable binary file, i.e. a blob.
+    """
+    if not isinstance(file, str):
+        for entry in entries:
+            yield _read_range(file, entry["_offset"], entry["_length"])
+        return
+    with open(file, "rb") as f:
+        for entry in entries:
+            yield _read_range(f, entry["_offset"], entry["_length"])
+
+
+def extract_messages(
+    file_path: str,
+    target_path: str,
+    index_path: Optional[str] = None,
+    **fields,
+) -> int:
+    """
+    Copies the messages matching 'fields', see select_messages, to a
+    smaller GRIB file, i.e. for cfgrib to open instead of the whole
+    file. Returns the number of messages copied.
+    """
+    index_path = index_path or get_index_path(file_path)
+    entries = select_messages(read_grib_index(index_path), **fields)
+    with open(target_path, "wb") as target:
+        for message in read_messages(file_path, entries):
+            target.write(message)
+    return len(entries)
+
+
+def _read_entry(eccodes, gid) -> Dict[str, Any]:
+    def get(key: str):
+        return (
+            eccodes.codes_get(gid, key)
+            if eccodes.codes_is_defined(gid, key)
+            else None
+        )
+
+    data_date = get("dataDate")
+    return {
+        "param": get("shortName"),
+        "year": data_date // 10000 if data_date else None,
+        "month": data_date // 100 % 100 if data_date else None,
+        "leadtime": get("forecastMonth"),
+        "number": get("number"),
+        "step": get("stepRange"),
+    }
+
+
+def _read_range(f: BinaryIO, offset: int, length: int) -> bytes:
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) != length:
+        name = getattr(f, "name", "File")
+        raise ValueError(
+            f"{name} ends before the indexed message at byte {offset}"
+        )
+    return data
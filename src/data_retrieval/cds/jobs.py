@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional
+
+from .cache import get_default_cache, get_request_key
+from .telemetry import mark_transfer_start, update_span
+
+DEFAULT_MAX_ACTIVE_JOBS: int = 4
+# Polls start at the minimum interval and back off up to the maximum
+MIN_POLL_INTERVAL: float = 1.0
+DEFAULT_POLL_INTERVAL: float = 10.0
+
+# States of a CDS job, as reported by the legacy CDS API
+COMPLETED_STATE: str = "completed"
+FAILED_STATE: str = "failed"
+
+
+class CdsJobError(Exception):
+    """A CDS job which failed on the server"""
+
+
+class _Job:
+    def __init__(self, name: str, metadata: Dict[str, Any]):
+        self.name = name
+        self.metadata = metadata
+        self.future: Future = Future()
+        self.remote: Any = None
+        self.submitted_at: Optional[float] = None
+
+
+class CdsJobRunner:
+    """
+    Submits CDS requests without waiting for them and polls the state
+    of every active job in a single loop, so that the time requests
+    spend in the CDS queue overlaps instead of adding up.
+    At most 'max_active_jobs' jobs are queued or running on the server
+    at once, the other requests wait to be submitted. Polls back off
+    from every second to 'poll_interval' while no job is submitted.
+    Completed jobs are downloaded by the callers of 'retrieve'.
+    """
+
+    def __init__(
+        self,
+        max_active_jobs: int = DEFAULT_MAX_ACTIVE_JOBS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        client: Any = None,
+    ):
+        if max_active_jobs < 1:
+            raise ValueError(
+                f"max_active_jobs must be at least 1, got {max_active_jobs}"
+            )
+        self.max_active_jobs = max_active_jobs
+        self.poll_interval = poll_interval
+        if client is None:
+            import cdsapi
+
+            client = cdsapi.Client(wait_until_complete=False)
+        self.client = client
+        self._jobs: Dict[str, _Job] = {}
+        self._pending: Deque[_Job] = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "CdsJobRunner":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, name: str, metadata: Dict[str, Any]) -> Future:
+        """
+        Queues a request for submission and returns a future which is
+        done once its job completed on the server. Submitting the same
+        request again returns the same future, and requests already in
+        the request cache are done straight away without a job.
+        """
+        key = get_request_key(name, metadata)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed CdsJobRunner")
+            job = self._jobs.get(key)
+            if job is not None:
+                return job.future
+
+            job = _Job(name, metadata)
+            self._jobs[key] = job
+            cache = get_default_cache()
+            if cache and cache.get(key):
+                job.future.set_result(None)
+            else:
+                self._pending.append(job)
+                self._condition.notify()
+            return job.future
+
+    def retrieve(self, name: str, metadata: Dict[str, Any], target: str):
+        """
+        Submits a request, unless it already was, waits for its job
+        to complete and downloads the result to 'target'.
+        """
+        key = get_request_key(name, metadata)
+        try:
+            remote = self.submit(name, metadata).result()
+            if remote is None:
+                # Was in the cache when submitted but was evicted since
+                self._forget(key)
+                remote = self.submit(name, metadata).result()
+            # Queueing is timed from the submission of the job
+            with self._condition:
+                job = self._jobs.get(key)
+            if job is not None and job.submitted_at:
+                update_span(submitted_at=job.submitted_at)
+            mark_transfer_start()
+            try:
+                remote.download(target)
+            finally:
+                remote.delete()
+        finally:
+            # A later retrieval of the same request starts a new job
+            self._forget(key)
+
+    def close(self):
+        """Stops polling, cancelling the requests which are not done"""
+        with self._condition:
+            self._closed = True
+            for job in self._pending:
+                job.future.cancel()
+            self._pending.clear()
+            self._condition.notify()
+        self._thread.join()
+
+    def _forget(self, key: str):
+        with self._condition:
+            self._jobs.pop(key, None)
+
+    def _poll(self):
+        active: List[_Job] = []
+        interval = min(MIN_POLL_INTERVAL, self.poll_interval)
+        while True:
+            with self._condition:
+                if active and not self._closed:
+                    self._condition.wait(interval)
+                    interval = min(interval * 1.5, self.poll_interval)
+                while not active and not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    break
+
+            # Refreshes the state of every active job in a single pass
+            active = [job for job in active if not self._update(job, True)]
+
+            with self._condition:
+                submitted = []
+                while (
+                    self._pending
+                    and len(active) + len(submitted) < self.max_active_jobs
+                ):
+                    submitted.append(self._pending.popleft())
+            for job in submitted:
+                try:
+                    job.submitted_at = time.time()
+                    job.remote = self.client.retrieve(job.name, job.metadata)
+                except Exception as error:
+                    job.future.set_exception(error)
+                    continue
+                if not self._update(job):
+                    active.append(job)
+                    interval = min(MIN_POLL_INTERVAL, self.poll_interval)
+
+        for job in active:
+            job.future.cancel()
+
+    def _update(self, job: _Job, refresh: bool = False) -> bool:
+        """Updates the future of a job, returns True if it is finished"""
+        try:
+            if refresh:
+                job.remote.update()
+            reply = job.remote.reply
+        except Exception as error:
+            job.future.set_exception(error)
+            return True
+
+        if reply["state"] == COMPLETED_STATE:
+            job.future.set_result(job.remote)
+            return True
+        if reply["state"] == FAILED_STATE:
+            error = reply.get("error", {})
+            job.future.set_exception(
+                CdsJobError(f"{error.get('message')}. {error.get('reason')}.")
+            )
+            return True
+        return False
@@ -1,11 +1,12 @@
 import os
 from io import BytesIO
-from typing import Any, Dict, Optional
-
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 from .common import download_mars, get_dates
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 DEFAULT_GRID: str = "0.4/0.4"
 DEFAULT_FCMONTH: str = "1/2/3/4/5/6/7"
 
@@ -22,18 +23,16 @@ def get_ensemble_numbers(year: int) -> str:
     return number_use
 
 
-def get_country_bbox_df() -> pd.DataFrame:
-    data_path: str = os.path.normpath(
-        os.path.join(
-            os.path.realpath(__file__),
-            "..",
-            "..",
-            "static_data",
-            "country_bbox.csv",
-        )
-    )
-    df = pd.read_csv(data_path)
-    return df
+def get_country_bbox_df() -> "pd.DataFrame":
+    """
+    Reads the table of the supported countries, see get_country_registry
+    for lookups which do not read the file again.
+    """
+    import pandas as pd
+
+    from .countries import COUNTRY_BBOX_PATH
+
+    return pd.read_csv(COUNTRY_BBOX_PATH)
 
 
 def get_ecmwf_mars_metadata(
@@ -80,11 +79,16 @@ def download_ecmwf_mars(
         dates, bounding_box, numbers, fcmonth, grid
     )
 
+    # One field per ensemble member, month and leadtime month
+    expected_messages = len(numbers.split("/")) * 12 * len(fcmonth.split("/"))
+
     if download_path and file_name:
         file_path = os.path.join(download_path, file_name)
-        download_mars(ecmwf_mars_metadata, file_path)
+        download_mars(ecmwf_mars_metadata, file_path, expected_messages)
         return None
     else:
         # If file_path is not provided, download the data to memory
-        data_stream = download_mars(ecmwf_mars_metadata)
+        data_stream = download_mars(
+            ecmwf_mars_metadata, expected_messages=expected_messages
+        )
         return data_stream
@@ -0,0 +1,315 @@
+import math
+from io import BytesIO
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .areas import count_grid_points
+from .common import download_cds, download_mars, get_dates
+from .ecmwf import RETRIEVE_NAME as ECMWF_CDS_NAME
+from .ecmwf import get_ecmwf_cds_metadata
+from .era5 import get_era5_cds_metadata
+from .jobs import CdsJobRunner
+from .mars import (
+    DEFAULT_FCMONTH,
+    DEFAULT_GRID,
+    get_ecmwf_mars_metadata,
+    get_ensemble_numbers,
+)
+
+ERA5_CDS_NAME: str = "reanalysis-era5-single-levels-monthly-means"
+MARS_NAME: str = "mars"
+
+# Native grids of the CDS data sets, used when no grid is requested
+ECMWF_CDS_GRID: str = "1.0/1.0"
+ERA5_CDS_GRID: str = "0.25/0.25"
+
+# Size of one packed value and of the GRIB headers of one field
+BYTES_PER_VALUE: int = 2
+FIELD_HEADER_BYTES: int = 200
+
+# Target size of a single request which keeps the time spent in
+# the queue and in the transfer reasonable on each service
+SERVICE_TARGET_BYTES: Dict[str, int] = {
+    "cds": 2 * 1024**3,
+    "mars": 512 * 1024**2,
+}
+# Number of fields above which the services reject a single request
+SERVICE_MAX_FIELDS: Dict[str, int] = {
+    "cds": 120_000,
+    "mars": 100_000,
+}
+
+
+class PlannedRequest(NamedTuple):
+    """A single CDS or MARS request with its estimated volume"""
+
+    service: str
+    name: str
+    metadata: Dict[str, Any]
+    years: List[int]
+    leadtime_months: List[int]
+    fields: int
+    bytes: int
+
+
+def estimate_bytes(fields: int, grid_points: int) -> int:
+    return fields * (FIELD_HEADER_BYTES + grid_points * BYTES_PER_VALUE)
+
+
+def count_members(year: int) -> int:
+    return len(get_ensemble_numbers(year).split("/"))
+
+
+def _group_consecutive(
+    items: List[Any],
+    fields_of: Callable[[Any], int],
+    grid_points: int,
+    target_bytes: Optional[int],
+    max_fields: int,
+    key: Optional[Callable[[Any], Any]] = None,
+) -> List[List[Any]]:
+    """
+    Greedily merges consecutive items into groups which stay within
+    the target size and field limit and share the same 'key'.
+    An item which exceeds the limits on its own forms its own group.
+    """
+    groups: List[List[Any]] = []
+    fields = 0
+    for item in items:
+        item_fields = fields_of(item)
+        if groups:
+            merged_fields = fields + item_fields
+            fits = merged_fields <= max_fields and (
+                target_bytes is None
+                or estimate_bytes(merged_fields, grid_points) <= target_bytes
+            )
+            same_key = key is None or key(item) == key(groups[-1][-1])
+            if fits and same_key:
+                groups[-1].append(item)
+                fields = merged_fields
+                continue
+        groups.append([item])
+        fields = item_fields
+    return groups
+
+
+def plan_ecmwf_cds(
+    years: List[int],
+    months: List[int],
+    leadtime_months: List[int],
+    format: str = "grib",
+    target_bytes: Optional[int] = None,
+    per_partition: bool = False,
+    area: Optional[str] = None,
+) -> List[PlannedRequest]:
+    """
+    Plans the CDS requests of the ECMWF seasonal forecast.
+    Without a target size this is a single request, or one request per
+    year and leadtime month with 'per_partition', split further only
+    if a request exceeds the CDS field limit. With a target size
+    consecutive years are merged up to the target, and years which are
+    too large on their own are split by leadtime months.
+    Requests cover the 'N/W/S/E' area when given, else the globe.
+    """
+    grid_points = count_grid_points(area, ECMWF_CDS_GRID)
+    max_fields = SERVICE_MAX_FIELDS["cds"]
+
+    def fields_of(year_leadtimes) -> int:
+        year, year_leadtime_months = year_leadtimes
+        return count_members(year) * len(months) * len(year_leadtime_months)
+
+    if per_partition and target_bytes is None:
+        groups = [
+            [(year, [leadtime_month])]
+            for year in years
+            for leadtime_month in leadtime_months
+        ]
+    else:
+        if target_bytes is None:
+            target_bytes = math.inf
+        groups = []
+        for year_group in _group_consecutive(
+            [(year, leadtime_months) for year in years],
+            fields_of,
+            grid_points,
+            target_bytes,
+            max_fields,
+        ):
+            if len(year_group) > 1 or (
+                fields_of(year_group[0]) <= max_fields
+                and estimate_bytes(fields_of(year_group[0]), grid_points)
+                <= target_bytes
+            ):
+                groups.append(year_group)
+                continue
+            # A single year above the limits is split by leadtime months
+            year = year_group[0][0]
+            for leadtime_group in _group_consecutive(
+                leadtime_months,
+                lambda _: count_members(year) * len(months),
+                grid_points,
+                target_bytes,
+                max_fields,
+            ):
+                groups.append([(year, leadtime_group)])
+
+    requests = []
+    for group in groups:
+        group_years = [year for year, _ in group]
+        group_leadtime_months = group[0][1]
+        fields = sum(fields_of(item) for item in group)
+        requests.append(
+            PlannedRequest(
+                service="cds",
+                name=ECMWF_CDS_NAME,
+                metadata=get_ecmwf_cds_metadata(
+                    group_years, months, group_leadtime_months, format, area
+                ),
+                years=group_years,
+                leadtime_months=group_leadtime_months,
+                fields=fields,
+                bytes=estimate_bytes(fields, grid_points),
+            )
+        )
+    return requests
+
+
+def plan_era5_cds(
+    years: List[int],
+    months: List[int],
+    format: str = "grib",
+    target_bytes: Optional[int] = None,
+    area: Optional[str] = None,
+) -> List[PlannedRequest]:
+    """
+    Plans the CDS requests of the ERA5 monthly means, a single request
+    unless it exceeds the target size or the CDS field limit.
+    Requests cover the 'N/W/S/E' area when given, else the globe.
+    """
+    grid_points = count_grid_points(area, ERA5_CDS_GRID)
+    requests = []
+    for group in _group_consecutive(
+        years,
+        lambda _: len(months),
+        grid_points,
+        target_bytes,
+        SERVICE_MAX_FIELDS["cds"],
+    ):
+        fields = len(group) * len(months)
+        requests.append(
+            PlannedRequest(
+                service="cds",
+                name=ERA5_CDS_NAME,
+                metadata=get_era5_cds_metadata(group, months, format, area),
+                years=group,
+                leadtime_months=[],
+                fields=fields,
+                bytes=estimate_bytes(fields, grid_points),
+            )
+        )
+    return requests
+
+
+def plan_ecmwf_mars(
+    years: List[int],
+    bounding_box: str,
+    target_bytes: Optional[int] = None,
+    fcmonth: str = DEFAULT_FCMONTH,
+    grid: str = DEFAULT_GRID,
+) -> List[PlannedRequest]:
+    """
+    Plans the MARS requests of the ECMWF seasonal forecast for an area.
+    Without a target size this is one request per year, with a target
+    size consecutive years with the same ensemble members are merged
+    up to the target.
+    """
+    grid_points = count_grid_points(bounding_box, grid)
+    leadtime_months = [int(month) for month in fcmonth.split("/")]
+
+    def fields_of(year: int) -> int:
+        return count_members(year) * 12 * len(leadtime_months)
+
+    if target_bytes is None:
+        groups = [[year] for year in years]
+    else:
+        groups = _group_consecutive(
+            years,
+            fields_of,
+            grid_points,
+            target_bytes,
+            SERVICE_MAX_FIELDS["mars"],
+            key=get_ensemble_numbers,
+        )
+
+    requests = []
+    for group in groups:
+        fields = sum(fields_of(year) for year in group)
+        dates = "/".join(get_dates(year) for year in group)
+        requests.append(
+            PlannedRequest(
+                service="mars",
+                name=MARS_NAME,
+                metadata=get_ecmwf_mars_metadata(
+                    dates,
+                    bounding_box,
+                    get_ensemble_numbers(group[0]),
+                    fcmonth,
+                    grid,
+                ),
+                years=group,
+                leadtime_months=leadtime_months,
+                fields=fields,
+                bytes=estimate_bytes(fields, grid_points),
+            )
+        )
+    return requests
+
+
+def download_planned_request(
+    request: PlannedRequest,
+    file_path: Optional[str] = None,
+    runner: Optional[CdsJobRunner] = None,
+) -> Optional[BytesIO]:
+    """
+    Retrieves a planned request from its service,
+    CDS requests through the job runner when given.
+    GRIB results are verified to hold one message per planned field.
+    """
+    expected_messages = (
+        request.fields
+        if request.metadata.get("format", "grib") == "grib"
+        else None
+    )
+    if request.service == "mars":
+        return download_mars(request.metadata, file_path, expected_messages)
+    return download_cds(
+        request.name, request.metadata, file_path, runner, expected_messages
+    )
+
+
+def format_plan(requests: List[PlannedRequest], file_names: List[str]) -> str:
+    """Returns a printable table of the planned requests and their volume"""
+    lines = [f"{'file':<60} {'years':>11} {'fields':>8} {'size':>10}"]
+    for request, file_name in zip(requests, file_names):
+        years = (
+            str(request.years[0])
+            if len(request.years) == 1
+            else f"{request.years[0]}-{request.years[-1]}"
+        )
+        lines.append(
+            f"{file_name:<60} {years:>11} {request.fields:>8} "
+            f"{_format_size(request.bytes):>10}"
+        )
+    lines.append(
+        f"{len(requests)} requests, "
+        f"{sum(request.fields for request in requests)} fields, "
+        f"{_format_size(sum(request.bytes for request in requests))}"
+    )
+    return "\n".join(lines)
+
+
+def _format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
@@ -0,0 +1,112 @@
+import hashlib
+import os
+from typing import Dict, NamedTuple, Optional
+
+from .verify import iter_grib_messages
+
+# Lossless packing of the repacked messages by GRIB edition: CCSDS for
+# GRIB 2 and, as CCSDS is not defined in GRIB 1, second-order packing.
+# Both about halve the size of simply packed fields, but decode slower,
+# see benchmarks/repack.py
+REPACKING: Dict[int, str] = {1: "grid_second_order", 2: "grid_ccsds"}
+# Packing of the messages which are repacked, others are kept as is
+REPACKED_FROM: str = "grid_simple"
+
+_enabled: bool = False
+
+
+class RepackResult(NamedTuple):
+    messages: int
+    repacked: int
+    source_size: int
+    size: int
+    # MD5 of the file as retrieved, before repacking
+    source_md5: str
+
+
+def configure_repacking(enabled: bool):
+    """Enables or disables the repacking of retrieved GRIB files"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_repacking_enabled() -> bool:
+    return _enabled
+
+
+def repack_grib(
+    file_path: str, target_path: Optional[str] = None
+) -> RepackResult:
+    """
+    Rewrites the simply packed messages of a GRIB file with the packing
+    of REPACKING for their edition, CCSDS for GRIB 2 and second-order
+    for GRIB 1, which compresses the same packed values losslessly.
+    Every repacked message is decoded again and kept only if it holds
+    exactly the values of the original and is smaller, otherwise the
+    original message is kept. Writes to 'target_path', or replaces the
+    file, and returns the sizes and the MD5 of the original file.
+    """
+    import eccodes
+
+    target_path = target_path or file_path
+    partial_path = f"{target_path}.repack"
+    source_size = os.path.getsize(file_path)
+    messages = repacked = 0
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as source, open(partial_path, "wb") as target:
+        for chunk in iter(lambda: source.read(8 * 1024 * 1024), b""):
+            md5.update(chunk)
+        for offset, length in iter_grib_messages(file_path):
+            source.seek(offset)
+            message = source.read(length)
+            packed = _repack_message(eccodes, message)
+            target.write(packed or message)
+            messages += 1
+            repacked += packed is not None
+    os.replace(partial_path, target_path)
+    return RepackResult(
+        messages,
+        repacked,
+        source_size,
+        os.path.getsize(target_path),
+        md5.hexdigest(),
+    )
+
+
+def _repack_message(eccodes, message: bytes) -> Optional[bytes]:
+    """Returns the repacked message, or None to keep the original"""
+    import numpy as np
+
+    gid = eccodes.codes_new_from_message(message)
+    try:
+        packing = REPACKING.get(eccodes.codes_get(gid, "edition"))
+        if (
+            packing is None
+            or eccodes.codes_get(gid, "packingType") != REPACKED_FROM
+            # Constant fields hold no packed values
+            or eccodes.codes_get(gid, "bitsPerValue") == 0
+        ):
+            return None
+        values = eccodes.codes_get_values(gid)
+        clone = eccodes.codes_clone(gid)
+        try:
+            eccodes.codes_set(clone, "packingType", packing)
+            packed = eccodes.codes_get_message(clone)
+        except eccodes.CodesInternalError:
+            return None
+        finally:
+            eccodes.codes_release(clone)
+    finally:
+        eccodes.codes_release(gid)
+
+    if len(packed) >= len(message):
+        return None
+    check = eccodes.codes_new_from_message(packed)
+    try:
+        if eccodes.codes_get(check, "packingType") != packing or not (
+            np.array_equal(eccodes.codes_get_values(check), values)
+        ):
+            return None
+    finally:
+        eccodes.codes_release(check)
+    return packed
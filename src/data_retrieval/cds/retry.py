@@ -0,0 +1,78 @@
+import random
+import time
+from typing import Callable, NamedTuple, Optional, TypeVar
+
+from .telemetry import update_span
+
+DEFAULT_RETRIES: int = 3
+# Delays in seconds, doubling from the base delay up to the maximum
+DEFAULT_BASE_DELAY: float = 10.0
+DEFAULT_MAX_DELAY: float = 300.0
+
+T = TypeVar("T")
+
+
+class RetryPolicy(NamedTuple):
+    """How often and how long to wait before retrying a failed request"""
+
+    retries: int = DEFAULT_RETRIES
+    base_delay: float = DEFAULT_BASE_DELAY
+    max_delay: float = DEFAULT_MAX_DELAY
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the delay before retry 'attempt', counted from 0, drawn
+        uniformly up to the exponential backoff ('full jitter'), so that
+        requests which failed together do not retry together.
+        """
+        backoff = min(self.max_delay, self.base_delay * 2**attempt)
+        return random.uniform(0, backoff)
+
+
+_default_policy: RetryPolicy = RetryPolicy()
+
+
+def configure_retries(
+    retries: int = DEFAULT_RETRIES,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+) -> RetryPolicy:
+    """Sets the retry policy of the requests, 0 retries disables them"""
+    global _default_policy
+    if retries < 0:
+        raise ValueError(f"retries must not be negative, got {retries}")
+    _default_policy = RetryPolicy(retries, base_delay, max_delay)
+    return _default_policy
+
+
+def get_retry_policy() -> RetryPolicy:
+    return _default_policy
+
+
+def retry_call(
+    func: Callable[[], T],
+    description: str = "Request",
+    policy: Optional[RetryPolicy] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """
+    Calls 'func' until it succeeds or the retries of the policy are
+    used up, re-raising the last error. The number of retries is
+    recorded in the telemetry record of the enclosing span.
+    """
+    policy = policy or _default_policy
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as error:
+            if attempt >= policy.retries:
+                raise
+            delay = policy.delay(attempt)
+            attempt += 1
+            update_span(retries=attempt)
+            print(
+                f"{description} failed: {error!r}. Retry {attempt} of "
+                f"{policy.retries} in {delay:.1f}s"
+            )
+            sleep(delay)
@@ -0,0 +1,478 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing, contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+QUEUE_DB_ENV: str = "DATA_RETRIEVAL_QUEUE_DB"
+DEFAULT_QUEUE_DB: str = "~/.data_retrieval/jobs.sqlite"
+# Requests one user may keep active on each service at once
+DEFAULT_SERVICE_LIMITS: Dict[str, int] = {"cds": 8, "mars": 2}
+DEFAULT_POLL_INTERVAL: float = 10.0
+# Lower values run first, operational runs before any backfill
+PRIORITIES: Dict[str, int] = {"operational": 0, "backfill": 10}
+# Option of each service's commands setting their active requests
+SLOT_OPTIONS: Dict[str, str] = {"cds": "--max-jobs", "mars": "--workers"}
+
+QUEUED: str = "queued"
+RUNNING: str = "running"
+DONE: str = "done"
+FAILED: str = "failed"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    service TEXT NOT NULL,
+    args TEXT NOT NULL,
+    cwd TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    slots INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner INTEGER,
+    pid INTEGER,
+    pid_started REAL,
+    returncode INTEGER,
+    log_path TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, id);
+"""
+# Runs a job command and writes its exit status to the file given first,
+# so that a scheduler which did not start the command can still read it
+_STATUS_WRAPPER: str = """
+import os, signal, subprocess, sys
+process = subprocess.Popen(sys.argv[2:])
+signal.signal(signal.SIGTERM, lambda signum, frame: process.terminate())
+code = process.wait()
+with open(sys.argv[1] + ".tmp", "w") as f:
+    f.write(str(code))
+os.replace(sys.argv[1] + ".tmp", sys.argv[1])
+sys.exit(code)
+"""
+
+
+class Job(NamedTuple):
+    """A retrieval command waiting in, or run from, the job queue"""
+
+    id: int
+    service: str
+    args: List[str]
+    cwd: str
+    priority: int
+    # Requests the command keeps active on its service at once
+    slots: int
+    state: str
+    submitted_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    # Scheduler which started the command, and the command itself
+    owner: Optional[int]
+    pid: Optional[int]
+    # Start time of the command process, telling it from a reused PID
+    pid_started: Optional[float]
+    returncode: Optional[int]
+    log_path: Optional[str]
+
+
+class JobQueue:
+    """
+    Queue of retrieval commands in a SQLite database, shared by every
+    command and scheduler on the host. A job is only started while the
+    active requests of all running jobs of its service stay within the
+    service limit, in the order of their priority and then submission.
+    Jobs are claimed in a single write transaction, so several
+    schedulers can run from the same queue without exceeding the limits.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = os.path.expanduser(db_path)
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.executescript(_SCHEMA)
+            columns = [
+                row[1] for row in connection.execute("PRAGMA table_info(jobs)")
+            ]
+            if "pid_started" not in columns:
+                # Queues created before the start time was recorded
+                connection.execute(
+                    "ALTER TABLE jobs ADD COLUMN pid_started REAL"
+                )
+
+    def enqueue(
+        self,
+        service: str,
+        args: List[str],
+        priority: str = "operational",
+        slots: int = 1,
+        cwd: Optional[str] = None,
+    ) -> int:
+        """Adds a command to the queue and returns the id of its job"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}")
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO jobs (service, args, cwd, priority, slots, "
+                "state, submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    service,
+                    json.dumps(args),
+                    cwd or os.getcwd(),
+                    PRIORITIES[priority],
+                    max(1, slots),
+                    QUEUED,
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid
+
+    def claim(
+        self, limits: Dict[str, int], owner: Optional[int] = None
+    ) -> Optional[Job]:
+        """
+        Marks the next job which fits within the limit of its service as
+        running and returns it, or returns None. A job asking for more
+        requests than the limit of its service gets the whole limit.
+        Only the first queued job of every service is considered, so
+        a backfill never overtakes an operational job of its service.
+        """
+        with self._transaction() as connection:
+            active = dict(
+                connection.execute(
+                    "SELECT service, SUM(slots) FROM jobs "
+                    "WHERE state = ? GROUP BY service",
+                    (RUNNING,),
+                ).fetchall()
+            )
+            considered = set()
+            for job in self._select(
+                connection,
+                "WHERE state = ? ORDER BY priority, id",
+                (QUEUED,),
+            ):
+                if job.service in considered:
+                    continue
+                considered.add(job.service)
+                limit = limits.get(job.service, 1)
+                slots = min(job.slots, limit)
+                if active.get(job.service, 0) + slots > limit:
+                    continue
+                started_at = time.time()
+                connection.execute(
+                    "UPDATE jobs SET state = ?, slots = ?, started_at = ?, "
+                    "owner = ? WHERE id = ?",
+                    (RUNNING, slots, started_at, owner or os.getpid(), job.id),
+                )
+                return job._replace(
+                    state=RUNNING,
+                    slots=slots,
+                    started_at=started_at,
+                    owner=owner or os.getpid(),
+                )
+        return None
+
+    def set_process(self, job_id: int, pid: int, log_path: str):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET pid = ?, pid_started = ?, log_path = ? "
+                "WHERE id = ?",
+                (pid, _process_start_time(pid), log_path, job_id),
+            )
+
+    def finish(self, job_id: int, returncode: int):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, returncode = ?, finished_at = ? "
+                "WHERE id = ?",
+                (
+                    DONE if returncode == 0 else FAILED,
+                    returncode,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def requeue_orphans(
+        self, is_running: Optional[Callable[..., bool]] = None
+    ) -> List[int]:
+        """
+        Puts the running jobs whose scheduler and command both stopped,
+        i.e. with the host, back in the queue, and returns their ids.
+        Completed partitions are skipped when they run again, as they
+        are recorded in the manifest of their output.
+        """
+        is_running = is_running or _is_running
+        with self._transaction() as connection:
+            orphans = [
+                job.id
+                for job in self._select(
+                    connection, "WHERE state = ?", (RUNNING,)
+                )
+                if not _owner_running(job, is_running)
+                and not _command_running(job, is_running)
+            ]
+            connection.executemany(
+                "UPDATE jobs SET state = ?, started_at = NULL, "
+                "owner = NULL, pid = NULL, pid_started = NULL WHERE id = ?",
+                [(QUEUED, job_id) for job_id in orphans],
+            )
+        return orphans
+
+    def adopt_orphans(
+        self,
+        owner: Optional[int] = None,
+        is_running: Optional[Callable[..., bool]] = None,
+    ) -> List[Job]:
+        """
+        Takes over the running jobs whose scheduler stopped while their
+        command still runs, i.e. after a restart of the scheduler, and
+        returns them, so that their exit status is recorded and their
+        slots are freed once they end, see finish_adopted.
+        """
+        is_running = is_running or _is_running
+        owner = owner or os.getpid()
+        with self._transaction() as connection:
+            adopted = [
+                job._replace(owner=owner)
+                for job in self._select(
+                    connection, "WHERE state = ?", (RUNNING,)
+                )
+                if not _owner_running(job, is_running)
+                and _command_running(job, is_running)
+            ]
+            connection.executemany(
+                "UPDATE jobs SET owner = ? WHERE id = ?",
+                [(owner, job.id) for job in adopted],
+            )
+        return adopted
+
+    def finish_adopted(self, job: Job):
+        """
+        Records the exit status an adopted command wrote next to its log,
+        or, without one, i.e. when it was killed, queues the job again.
+        """
+        try:
+            with open(get_status_path(job.log_path)) as f:
+                returncode = int(f.read())
+        except (TypeError, OSError, ValueError):
+            with self._transaction() as connection:
+                connection.execute(
+                    "UPDATE jobs SET state = ?, started_at = NULL, "
+                    "owner = NULL, pid = NULL, pid_started = NULL "
+                    "WHERE id = ?",
+                    (QUEUED, job.id),
+                )
+            return None
+        self.finish(job.id, returncode)
+        return returncode
+
+    def jobs(self, states: Optional[List[str]] = None) -> List[Job]:
+        """Returns the jobs in the given states, or all of them"""
+        with closing(self._connect()) as connection:
+            if not states:
+                return self._select(connection, "ORDER BY id", ())
+            return self._select(
+                connection,
+                f"WHERE state IN ({', '.join('?' * len(states))}) "
+                f"ORDER BY id",
+                tuple(states),
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit, transactions are started explicitly
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connect()
+        try:
+            # Takes the write lock up front, so that reads and updates
+            # of a claim are not interleaved with another scheduler
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def _select(
+        self, connection: sqlite3.Connection, clause: str, params: tuple
+    ) -> List[Job]:
+        rows = connection.execute(
+            f"SELECT {', '.join(Job._fields)} FROM jobs {clause}", params
+        ).fetchall()
+        return [Job(*row[:2], json.loads(row[2]), *row[3:]) for row in rows]
+
+
+def get_status_path(log_path: str) -> str:
+    """Returns the file the exit status of a job is written to"""
+    return os.path.splitext(log_path)[0] + ".status"
+
+
+def get_queue_db() -> str:
+    """Returns the queue database defined by DATA_RETRIEVAL_QUEUE_DB"""
+    return os.getenv(QUEUE_DB_ENV, DEFAULT_QUEUE_DB)
+
+
+def run_scheduler(
+    queue: JobQueue,
+    command: List[str],
+    limits: Optional[Dict[str, int]] = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    until_empty: bool = False,
+    log_dir: Optional[str] = None,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """
+    Runs the queued jobs as '<command> <job arguments>' processes within
+    the service limits, each with its output in '<log_dir>/<id>.log',
+    and records their exit status. The active requests of a command are
+    set to the slots it was given, with the option of SLOT_OPTIONS.
+    Runs until stopped, or with 'until_empty' until no job is left.
+    Jobs left running by a stopped scheduler are adopted and watched
+    until their command ends, see JobQueue.adopt_orphans.
+    """
+    limits = limits or DEFAULT_SERVICE_LIMITS
+    log_dir = log_dir or os.path.join(os.path.dirname(queue.db_path), "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    requeued = queue.requeue_orphans()
+    if requeued:
+        print(f"Requeued the interrupted jobs {requeued}")
+    adopted = {job.id: job for job in queue.adopt_orphans()}
+    if adopted:
+        print(f"Adopted the running jobs {sorted(adopted)}")
+
+    running: Dict[int, subprocess.Popen] = {}
+    while True:
+        for job_id, process in list(running.items()):
+            if process.poll() is not None:
+                queue.finish(job_id, process.returncode)
+                print(f"Job {job_id} exited with {process.returncode}")
+                del running[job_id]
+        for job_id, job in list(adopted.items()):
+            if not _command_running(job, _is_running):
+                returncode = queue.finish_adopted(job)
+                if returncode is None:
+                    print(f"Job {job_id} ended without a status, requeued")
+                else:
+                    print(f"Job {job_id} exited with {returncode}")
+                del adopted[job_id]
+
+        job = queue.claim(limits)
+        while job is not None:
+            args = list(job.args)
+            if job.service in SLOT_OPTIONS:
+                args += [SLOT_OPTIONS[job.service], str(job.slots)]
+            log_path = os.path.join(log_dir, f"{job.id}.log")
+            with open(log_path, "ab") as log:
+                process = subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-c",
+                        _STATUS_WRAPPER,
+                        get_status_path(log_path),
+                    ]
+                    + command
+                    + args,
+                    cwd=job.cwd,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+            queue.set_process(job.id, process.pid, log_path)
+            running[job.id] = process
+            print(f"Started job {job.id}: {' '.join(args)}")
+            job = queue.claim(limits)
+
+        if (
+            until_empty
+            and not running
+            and not adopted
+            and not queue.jobs([QUEUED])
+        ):
+            return
+        sleep(poll_interval)
+
+
+def format_jobs(jobs: List[Job]) -> str:
+    """Returns a printable table of jobs"""
+    priorities = {value: name for name, value in PRIORITIES.items()}
+    lines = [
+        f"{'id':>5} {'service':<7} {'priority':<11} {'state':<8} "
+        f"{'slots':>5} {'wait':>9} {'run':>9}  command"
+    ]
+    now = time.time()
+    for job in jobs:
+        waited = (job.started_at or now) - job.submitted_at
+        ran = (
+            (job.finished_at or now) - job.started_at if job.started_at else 0
+        )
+        lines.append(
+            f"{job.id:>5} {job.service:<7} "
+            f"{priorities.get(job.priority, job.priority):<11} "
+            f"{job.state:<8} {job.slots:>5} {waited:>8.0f}s {ran:>8.0f}s  "
+            f"{' '.join(job.args)}"
+        )
+    return "\n".join(lines)
+
+
+def _owner_running(job: Job, is_running: Callable[..., bool]) -> bool:
+    # The scheduler claimed the job, so it started before it
+    return job.owner is not None and is_running(
+        job.owner, started_before=job.started_at
+    )
+
+
+def _command_running(job: Job, is_running: Callable[..., bool]) -> bool:
+    return job.pid is not None and is_running(
+        job.pid, started_at=job.pid_started
+    )
+
+
+def _is_running(
+    pid: int,
+    started_at: Optional[float] = None,
+    started_before: Optional[float] = None,
+) -> bool:
+    """
+    Tells whether a process runs, and is the process it was recorded as
+    rather than a later one given the same PID, by its start time,
+    which is only known on Linux.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    start_time = _process_start_time(pid)
+    if start_time is None:
+        return True
+    # Start times are only precise to a clock tick
+    if started_at is not None and abs(start_time - started_at) > 1:
+        return False
+    return started_before is None or start_time <= started_before + 1
+
+
+def _process_start_time(pid: int) -> Optional[float]:
+    """Returns the start time of a process as a Unix timestamp, on Linux"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the command name, which may hold spaces,
+            # the start time in clock ticks since boot is the 22nd
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/stat") as f:
+            boot_time = next(
+                int(line.split()[1]) for line in f if line.startswith("btime")
+            )
+    except (OSError, StopIteration, IndexError):
+        return None
+    return boot_time + int(fields[19]) / os.sysconf("SC_CLK_TCK")
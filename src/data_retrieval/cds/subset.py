@@ -0,0 +1,93 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .areas import parse_bbox
+
+# Tolerance when comparing grid coordinates to area edges, in degrees
+COORDINATE_TOLERANCE: float = 1e-6
+
+
+def subset_grib(source_path: str, target_areas: Dict[str, str]):
+    """
+    Cuts the fields of a regular lat/lon GRIB file down to several areas,
+    writing the points within each 'N/W/S/E' area of 'target_areas'
+    (file path -> area) to its own GRIB file, in a single pass.
+    """
+    import eccodes
+
+    areas = {path: parse_bbox(bbox) for path, bbox in target_areas.items()}
+    targets = {path: open(path, "wb") for path in target_areas}
+    try:
+        with open(source_path, "rb") as source:
+            while True:
+                gid = eccodes.codes_grib_new_from_file(source)
+                if gid is None:
+                    break
+                try:
+                    _write_subsets(eccodes, gid, areas, targets)
+                finally:
+                    eccodes.codes_release(gid)
+    finally:
+        for target in targets.values():
+            target.close()
+
+
+def grid_coordinates(eccodes, gid) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the latitudes and longitudes of the rows and columns of
+    a regular lat/lon GRIB field, in the order of its values
+    """
+    if eccodes.codes_get(gid, "gridType") != "regular_ll":
+        raise ValueError("Only regular lat/lon GRIB fields are supported")
+
+    ni = eccodes.codes_get(gid, "Ni")
+    nj = eccodes.codes_get(gid, "Nj")
+    lat_first = eccodes.codes_get(gid, "latitudeOfFirstGridPointInDegrees")
+    lon_first = eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees")
+    lat_step = eccodes.codes_get(gid, "jDirectionIncrementInDegrees")
+    lon_step = eccodes.codes_get(gid, "iDirectionIncrementInDegrees")
+    if eccodes.codes_get(gid, "jScansPositively"):
+        lats = lat_first + lat_step * np.arange(nj)
+    else:
+        lats = lat_first - lat_step * np.arange(nj)
+    lons = lon_first + lon_step * np.arange(ni)
+    return lats, lons
+
+
+def _write_subsets(eccodes, gid, areas, targets):
+    lats, lons = grid_coordinates(eccodes, gid)
+    values = eccodes.codes_get_values(gid).reshape(len(lats), len(lons))
+
+    for path, (north, west, south, east) in areas.items():
+        rows = np.flatnonzero(
+            (lats <= north + COORDINATE_TOLERANCE)
+            & (lats >= south - COORDINATE_TOLERANCE)
+        )
+        cols = np.flatnonzero(
+            (lons >= west - COORDINATE_TOLERANCE)
+            & (lons <= east + COORDINATE_TOLERANCE)
+        )
+        if not len(rows) or not len(cols):
+            raise ValueError(f"Area of {path} is outside of the GRIB field")
+
+        clone = eccodes.codes_clone(gid)
+        try:
+            eccodes.codes_set(clone, "Ni", len(cols))
+            eccodes.codes_set(clone, "Nj", len(rows))
+            eccodes.codes_set(
+                clone, "latitudeOfFirstGridPointInDegrees", lats[rows[0]]
+            )
+            eccodes.codes_set(
+                clone, "longitudeOfFirstGridPointInDegrees", lons[cols[0]]
+            )
+            eccodes.codes_set(
+                clone, "latitudeOfLastGridPointInDegrees", lats[rows[-1]]
+            )
+            eccodes.codes_set(
+                clone, "longitudeOfLastGridPointInDegrees", lons[cols[-1]]
+            )
+            eccodes.codes_set_values(clone, values[np.ix_(rows, cols)].ravel())
+            eccodes.codes_write(clone, targets[path])
+        finally:
+            eccodes.codes_release(clone)
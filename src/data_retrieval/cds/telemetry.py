@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+TELEMETRY_FILE_ENV: str = "DATA_RETRIEVAL_TELEMETRY_FILE"
+
+# Fields added to every record emitted within a telemetry_context
+_context: ContextVar[Dict[str, Any]] = ContextVar("telemetry_context")
+# Record of the innermost span, updated by the code it wraps
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "telemetry_record", default=None
+)
+
+
+class TelemetryRecorder:
+    """
+    Appends one JSON line per retrieval request or blob transfer to
+    a file, tagged with the id of the run which emitted it.
+    """
+
+    def __init__(self, file_path: str, run_id: Optional[str] = None):
+        self.file_path = os.path.expanduser(file_path)
+        self.run_id = run_id or (
+            f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}"
+        )
+        directory = os.path.dirname(self.file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        line = json.dumps({"run": self.run_id, **record}, default=str)
+        with self._lock:
+            with open(self.file_path, "a") as f:
+                f.write(line + "\n")
+
+
+_default_recorder: Optional[TelemetryRecorder] = None
+
+
+def configure_telemetry(
+    file_path: Optional[str], run_id: Optional[str] = None
+) -> Optional[TelemetryRecorder]:
+    """Sets (or with None disables) the file telemetry is written to"""
+    global _default_recorder
+    _default_recorder = (
+        TelemetryRecorder(file_path, run_id) if file_path else None
+    )
+    return _default_recorder
+
+
+def get_telemetry() -> Optional[TelemetryRecorder]:
+    """
+    Returns the configured recorder, falling back to the file defined
+    by the DATA_RETRIEVAL_TELEMETRY_FILE environment variable.
+    """
+    if _default_recorder is None and os.getenv(TELEMETRY_FILE_ENV):
+        configure_telemetry(os.getenv(TELEMETRY_FILE_ENV))
+    return _default_recorder
+
+
+@contextmanager
+def telemetry_context(**fields) -> Iterator[None]:
+    """Adds fields, i.e. the partition, to the records emitted within"""
+    token = _context.set({**_context.get({}), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextmanager
+def record_span(kind: str, **fields) -> Iterator[Dict[str, Any]]:
+    """
+    Times a request or a transfer and emits its record once it ends.
+    The record covers the submission, transfer start and finish times
+    (as Unix timestamps), the bytes moved, the throughput, the number
+    of retries and the outcome, 'ok', 'cached' or 'error'.
+    The wrapped code fills in what it knows, i.e. 'bytes', directly
+    or through update_span.
+    """
+    record: Dict[str, Any] = {
+        "kind": kind,
+        **_context.get({}),
+        **fields,
+        "submitted_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "bytes": None,
+        "retries": 0,
+        "outcome": None,
+        "error": None,
+    }
+    token = _current.set(record)
+    try:
+        yield record
+    except BaseException as error:
+        record["outcome"] = "error"
+        record["error"] = repr(error)
+        raise
+    finally:
+        _current.reset(token)
+        _finish(record)
+        recorder = get_telemetry()
+        if recorder:
+            recorder.emit(record)
+
+
+def update_span(**fields):
+    """Updates the record of the innermost span, if any"""
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+
+def mark_transfer_start():
+    """Marks the end of the queueing and the start of the transfer"""
+    update_span(started_at=time.time())
+
+
+def _finish(record: Dict[str, Any]):
+    record["finished_at"] = time.time()
+    record["outcome"] = record["outcome"] or "ok"
+    if record["started_at"] is None:
+        record["started_at"] = record["submitted_at"]
+    record["queue_seconds"] = record["started_at"] - record["submitted_at"]
+    record["transfer_seconds"] = record["finished_at"] - record["started_at"]
+    record["bytes_per_second"] = (
+        record["bytes"] / record["transfer_seconds"]
+        if record["bytes"] and record["transfer_seconds"] > 0
+        else None
+    )
+
+
+def read_telemetry(file_path: str) -> List[Dict[str, Any]]:
+    """Reads the records of a telemetry file, skipping malformed lines"""
+    records = []
+    with open(os.path.expanduser(file_path)) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def summarize_telemetry(
+    records: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Totals the records of every run by kind of request or transfer"""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault((record["run"], record["kind"]), []).append(record)
+
+    summary = []
+    for (run, kind), group in sorted(groups.items()):
+        transfer_seconds = sum(r["transfer_seconds"] for r in group)
+        total_bytes = sum(r["bytes"] or 0 for r in group)
+        summary.append(
+            {
+                "run": run,
+                "kind": kind,
+                "count": len(group),
+                "ok": sum(r["outcome"] == "ok" for r in group),
+                "cached": sum(r["outcome"] == "cached" for r in group),
+                "failed": sum(r["outcome"] == "error" for r in group),
+                "retries": sum(r["retries"] for r in group),
+                "bytes": total_bytes,
+                "wall_seconds": max(r["finished_at"] for r in group)
+                - min(r["submitted_at"] for r in group),
+                "queue_seconds": sum(r["queue_seconds"] for r in group),
+                "transfer_seconds": transfer_seconds,
+                "bytes_per_second": (
+                    total_bytes / transfer_seconds
+                    if transfer_seconds
+                    else None
+                ),
+            }
+        )
+    return summary
+
+
+def format_telemetry_summary(
+    records: List[Dict[str, Any]], top: int = 5
+) -> str:
+    """Returns a printable summary per run and the slowest partitions"""
+    lines = [
+        f"{'run':<24} {'kind':<14} {'count':>6} {'failed':>6} "
+        f"{'cached':>6} {'retries':>7} {'size':>10} {'wall':>9} "
+        f"{'queue':>9} {'transfer':>9} {'rate':>11}"
+    ]
+    for row in summarize_telemetry(records):
+        rate = (
+            f"{row['bytes_per_second'] / 1024**2:.1f}MB/s"
+            if row["bytes_per_second"]
+            else "-"
+        )
+        lines.append(
+            f"{row['run']:<24} {row['kind']:<14} {row['count']:>6} "
+            f"{row['failed']:>6} {row['cached']:>6} {row['retries']:>7} "
+            f"{row['bytes'] / 1024**2:>8.1f}MB "
+            f"{row['wall_seconds']:>8.1f}s {row['queue_seconds']:>8.1f}s "
+            f"{row['transfer_seconds']:>8.1f}s {rate:>11}"
+        )
+
+    slowest = sorted(
+        records,
+        key=lambda r: r["finished_at"] - r["submitted_at"],
+        reverse=True,
+    )[:top]
+    if slowest:
+        lines.append("")
+        lines.append(f"Slowest {len(slowest)} requests and transfers:")
+        for record in slowest:
+            lines.append(
+                f"{record['kind']:<14} "
+                f"{record.get('partition') or record.get('request') or '-'}: "
+                f"{record['finished_at'] - record['submitted_at']:.1f}s "
+                f"(queue {record['queue_seconds']:.1f}s, "
+                f"transfer {record['transfer_seconds']:.1f}s), "
+                f"{record['outcome']}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,130 @@
+import os
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+GRIB_START: bytes = b"GRIB"
+GRIB_END: bytes = b"7777"
+# Size of the reads when searching for the start or end of a message
+SCAN_CHUNK_SIZE: int = 1024 * 1024
+
+_enabled: bool = True
+
+
+class GribIntegrityError(Exception):
+    """A retrieved GRIB file which is truncated or incomplete"""
+
+
+def configure_verification(enabled: bool):
+    """Enables or disables the verification of retrieved GRIB files"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_verification_enabled() -> bool:
+    return _enabled
+
+
+def iter_grib_messages(file_path: str) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the byte offset and length of every GRIB message of a file,
+    read from their headers without decoding them, and raises a
+    GribIntegrityError if a message is cut short or does not end with
+    its end marker. Bytes between messages are skipped, as ecCodes does.
+    """
+    size = os.path.getsize(file_path)
+    count = 0
+    with open(file_path, "rb") as f:
+        position = _find(f, GRIB_START, 0)
+        while position is not None:
+            length = _message_length(f, position, size)
+            end = position + length
+            if end > size:
+                raise GribIntegrityError(
+                    f"{file_path} is truncated: message {count + 1} at byte "
+                    f"{position} has {length} bytes, {size - position} left"
+                )
+            f.seek(end - len(GRIB_END))
+            if f.read(len(GRIB_END)) != GRIB_END:
+                raise GribIntegrityError(
+                    f"{file_path} is corrupt: message {count + 1} at byte "
+                    f"{position} does not end with {GRIB_END!r}"
+                )
+            count += 1
+            yield position, length
+            position = _find(f, GRIB_START, end)
+
+
+def count_grib_messages(file_path: str) -> int:
+    """Counts the GRIB messages of a file, see iter_grib_messages"""
+    return sum(1 for _ in iter_grib_messages(file_path))
+
+
+def verify_grib(file_path: str, expected_messages: Optional[int] = None):
+    """
+    Raises a GribIntegrityError unless the file holds complete GRIB
+    messages, as many as expected when 'expected_messages' is given.
+    """
+    count = count_grib_messages(file_path)
+    if count == 0:
+        raise GribIntegrityError(f"{file_path} holds no GRIB message")
+    if expected_messages is not None and count != expected_messages:
+        raise GribIntegrityError(
+            f"{file_path} holds {count} GRIB messages, "
+            f"expected {expected_messages}"
+        )
+
+
+def _message_length(f: BinaryIO, position: int, size: int) -> int:
+    f.seek(position)
+    header = f.read(16)
+    if len(header) < 8:
+        raise GribIntegrityError(f"Truncated GRIB header at byte {position}")
+    edition = header[7]
+    if edition == 1:
+        length = int.from_bytes(header[4:7], "big")
+        if length & 0x800000:
+            # Messages above 8MB flag an encoded length, found by
+            # looking for the end marker followed by the next message
+            return _find_end(f, position, size) - position
+        return length
+    if edition == 2:
+        if len(header) < 16:
+            raise GribIntegrityError(
+                f"Truncated GRIB header at byte {position}"
+            )
+        return int.from_bytes(header[8:16], "big")
+    raise GribIntegrityError(
+        f"Unsupported GRIB edition {edition} at byte {position}"
+    )
+
+
+def _find_end(f: BinaryIO, position: int, size: int) -> int:
+    search_from = position + 8
+    while True:
+        marker = _find(f, GRIB_END, search_from)
+        if marker is None:
+            raise GribIntegrityError(
+                f"Truncated GRIB message at byte {position}"
+            )
+        end = marker + len(GRIB_END)
+        f.seek(end)
+        if end == size or f.read(len(GRIB_START)) == GRIB_START:
+            return end
+        search_from = marker + 1
+
+
+def _find(f: BinaryIO, pattern: bytes, start: int) -> Optional[int]:
+    """Returns the position of the next 'pattern' from 'start', if any"""
+    f.seek(start)
+    offset = start
+    tail = b""
+    while True:
+        chunk = f.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            return None
+        data = tail + chunk
+        index = data.find(pattern)
+        if index >= 0:
+            return offset - len(tail) + index
+        # Keeps the end of the chunk, which may hold part of the pattern
+        tail = data[-(len(pattern) - 1) :]
+        offset += len(chunk)
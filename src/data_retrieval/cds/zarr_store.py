@@ -0,0 +1,265 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .index import build_grib_index, read_grib_index, read_messages
+from .subset import grid_coordinates
+
+# Dimensions of every forecast variable of the store
+DIMENSIONS: Tuple[str, ...] = (
+    "number",
+    "year",
+    "month",
+    "lead",
+    "latitude",
+    "longitude",
+)
+MAX_MEMBERS: int = 51
+MONTHS: List[int] = list(range(1, 13))
+# The year coordinate grows with later runs, within its single chunk
+YEAR_CHUNK_SIZE: int = 1024
+DEFAULT_COMPRESSION_LEVEL: int = 5
+# zarr 3, which writes the store, requires Python 3.11
+ZARR_MAJOR_VERSION: int = 3
+
+
+def get_zarr_support_error() -> Optional[str]:
+    """
+    Returns why Zarr stores cannot be written with the installed
+    packages, or None when they can, without importing zarr.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        zarr_version = version("zarr")
+        version("numcodecs")
+    except PackageNotFoundError as error:
+        return (
+            f"{error.name} is not installed, it is only installed "
+            "on Python 3.11 or later"
+        )
+    if int(zarr_version.split(".")[0]) < ZARR_MAJOR_VERSION:
+        return f"zarr {ZARR_MAJOR_VERSION} is required, not {zarr_version}"
+    return None
+
+
+class ZarrStore:
+    """
+    Chunked, compressed Zarr store (format 2) of the ECMWF seasonal
+    forecast, with the dimensions number, year and month of the start
+    date, lead (month), latitude and longitude. Each chunk holds the 12
+    start months of one member, year and lead month, so retrieved GRIB
+    partitions are converted a chunk at a time and never share a chunk.
+    Opening an existing store appends the years it does not cover yet,
+    which must all follow its last year, so the years stay sorted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        years: List[int],
+        leadtime_months: List[int],
+        members: int = MAX_MEMBERS,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    ):
+        import numcodecs
+        import zarr
+
+        self.path = path
+        self.members = members
+        self.compressor = numcodecs.Blosc(
+            cname="zstd",
+            clevel=compression_level,
+            shuffle=numcodecs.Blosc.BITSHUFFLE,
+        )
+        self.group = zarr.open_group(path, mode="a", zarr_format=2)
+        self._lock = threading.Lock()
+
+        if "year" not in self.group:
+            self._create_coordinate("number", np.arange(members))
+            self._create_coordinate(
+                "year", np.array(sorted(years)), YEAR_CHUNK_SIZE
+            )
+            self._create_coordinate("month", np.array(MONTHS))
+            self._create_coordinate("lead", np.array(sorted(leadtime_months)))
+        else:
+            self._add_years(years)
+
+        self._years = {
+            int(year): i for i, year in enumerate(self.group["year"][:])
+        }
+        self._leads = {
+            int(lead): i for i, lead in enumerate(self.group["lead"][:])
+        }
+        missing = sorted(set(leadtime_months) - set(self._leads))
+        if missing:
+            raise ValueError(
+                f"{path} does not cover the lead months {missing}"
+            )
+
+    def add_grib(
+        self, file_path: str, index_path: Optional[str] = None
+    ) -> List[str]:
+        """
+        Writes the messages of a GRIB file to the store, reading them
+        a chunk at a time through the sidecar index, built first when
+        not given. Returns the paths of the chunks written, relative to
+        the store.
+        """
+        import eccodes
+
+        entries = read_grib_index(index_path or build_grib_index(file_path))
+        chunks: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+        for entry in entries:
+            if entry["number"] is None or entry["leadtime"] is None:
+                raise ValueError(
+                    f"{file_path} is not a seasonal forecast with "
+                    f"ensemble members and lead months"
+                )
+            key = (
+                entry["param"],
+                entry["number"],
+                entry["year"],
+                entry["leadtime"],
+            )
+            chunks.setdefault(key, []).append(entry)
+
+        written = []
+        for (param, number, year, lead), chunk_entries in chunks.items():
+            array = None
+            block = None
+            messages = read_messages(file_path, chunk_entries)
+            for entry, message in zip(chunk_entries, messages):
+                gid = eccodes.codes_new_from_message(message)
+                try:
+                    if array is None:
+                        array = self._variable(eccodes, gid, param)
+                        block = np.full(
+                            (len(MONTHS),) + array.shape[-2:],
+                            np.nan,
+                            dtype="float32",
+                        )
+                    block[entry["month"] - 1] = _read_values(
+                        eccodes, gid, array.shape[-2:]
+                    )
+                finally:
+                    eccodes.codes_release(gid)
+
+            if year not in self._years:
+                raise ValueError(f"{self.path} does not cover the year {year}")
+            position = (number, self._years[year], self._leads[lead])
+            array[position[0], position[1], :, position[2]] = block
+            written.append(
+                f"{param}/{position[0]}.{position[1]}.0.{position[2]}.0.0"
+            )
+        return written
+
+    def consolidate(self) -> List[str]:
+        """
+        Consolidates the metadata of the store, so that it opens with
+        a single read, and returns the paths of its metadata and
+        coordinate files, relative to the store.
+        """
+        import zarr
+
+        zarr.consolidate_metadata(self.path, zarr_format=2)
+        coordinates = [
+            name
+            for name, array in self.group.arrays()
+            if len(array.shape) == 1
+        ]
+        paths = []
+        for root, _, file_names in os.walk(self.path):
+            relative_root = os.path.relpath(root, self.path)
+            for file_name in file_names:
+                if file_name.startswith(".z") or (
+                    relative_root in coordinates and file_name == "0"
+                ):
+                    paths.append(
+                        os.path.normpath(
+                            os.path.join(relative_root, file_name)
+                        )
+                    )
+        return sorted(paths)
+
+    def _create_coordinate(
+        self, name: str, values: np.ndarray, chunk_size: Optional[int] = None
+    ):
+        array = self.group.create_array(
+            name,
+            shape=values.shape,
+            chunks=(chunk_size or len(values),),
+            dtype=values.dtype,
+            # Without a fill value, xarray does not mask i.e. member 0
+            fill_value=None,
+            attributes={"_ARRAY_DIMENSIONS": [name]},
+        )
+        array[:] = values
+
+    def _add_years(self, years: List[int]):
+        existing = [int(year) for year in self.group["year"][:]]
+        new_years = sorted(set(years) - set(existing))
+        if not new_years:
+            return
+        # Inserting a year would move the chunks of every later year,
+        # which may already be mirrored to storage
+        if new_years[0] < existing[-1]:
+            raise ValueError(
+                f"{self.path} covers {existing[0]} to {existing[-1]}, "
+                f"years can only be appended after {existing[-1]}, not "
+                f"{[year for year in new_years if year < existing[-1]]}"
+            )
+        year_count = len(existing) + len(new_years)
+        year_array = self.group["year"]
+        year_array.resize((year_count,))
+        year_array[len(existing) :] = new_years
+        for _, array in self.group.arrays():
+            if len(array.shape) == len(DIMENSIONS):
+                shape = list(array.shape)
+                shape[DIMENSIONS.index("year")] = year_count
+                array.resize(tuple(shape))
+
+    def _variable(self, eccodes, gid, param: str):
+        """Returns the array of a parameter, created on its first field"""
+        with self._lock:
+            if param in self.group:
+                return self.group[param]
+
+            lats, lons = grid_coordinates(eccodes, gid)
+            if "latitude" not in self.group:
+                self._create_coordinate("latitude", lats)
+                self._create_coordinate("longitude", lons)
+            shape = (
+                self.members,
+                len(self._years),
+                len(MONTHS),
+                len(self._leads),
+                len(lats),
+                len(lons),
+            )
+            return self.group.create_array(
+                param,
+                shape=shape,
+                chunks=(1, 1, len(MONTHS), 1, len(lats), len(lons)),
+                dtype="float32",
+                fill_value=np.nan,
+                compressors=self.compressor,
+                attributes={
+                    "_ARRAY_DIMENSIONS": list(DIMENSIONS),
+                    "long_name": eccodes.codes_get(gid, "name"),
+                    "units": eccodes.codes_get(gid, "units"),
+                },
+            )
+
+
+def _read_values(eccodes, gid, shape: Tuple[int, ...]) -> np.ndarray:
+    values = eccodes.codes_get_values(gid)
+    if eccodes.codes_get(gid, "bitmapPresent"):
+        values[values == eccodes.codes_get(gid, "missingValue")] = np.nan
+    if values.size != shape[0] * shape[1]:
+        raise ValueError(
+            f"Field of {values.size} values does not match the grid {shape}"
+        )
+    return values.reshape(shape)
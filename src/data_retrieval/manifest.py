@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+MANIFEST_FILE_NAME: str = "manifest.json"
+MANIFEST_VERSION: int = 1
+
+
+def file_md5(file_path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """Returns the hex MD5 checksum of a file, read in chunks"""
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as data:
+        for chunk in iter(lambda: data.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class Manifest:
+    """
+    Record of the retrieved partitions of a dataset, keyed by file name.
+    Each entry keeps the partition (dataset, year, leadtime, ISO, format)
+    together with the size, checksum and, for blobs, the ETag of the file,
+    so an interrupted retrieval only fetches what is missing or corrupt.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.entries: Dict[str, Dict[str, Any]] = entries or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_json(cls, text: str) -> "Manifest":
+        return cls(json.loads(text).get("partitions", {}))
+
+    def to_json(self) -> str:
+        with self._lock:
+            return json.dumps(
+                {"version": MANIFEST_VERSION, "partitions": self.entries},
+                indent=2,
+                sort_keys=True,
+            )
+
+    @classmethod
+    def load(cls, file_path: str) -> "Manifest":
+        """Reads a local manifest, or returns an empty one if missing"""
+        if not os.path.exists(file_path):
+            return cls()
+        with open(file_path) as f:
+            return cls.from_json(f.read())
+
+    def save(self, file_path: str):
+        """Writes the manifest atomically to a local path"""
+        partial_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}"
+        with open(partial_path, "w") as f:
+            f.write(self.to_json())
+        os.replace(partial_path, file_path)
+
+    def record(
+        self,
+        file_name: str,
+        *,
+        dataset: str,
+        year: Union[int, List[int], None],
+        format: str,
+        size: int,
+        md5: str,
+        leadtime: Union[int, List[int], None] = None,
+        iso: Optional[str] = None,
+        etag: Optional[str] = None,
+        source_size: Optional[int] = None,
+        source_md5: Optional[str] = None,
+    ):
+        entry = {
+            "dataset": dataset,
+            "year": year,
+            "leadtime": leadtime,
+            "iso": iso,
+            "format": format,
+            "size": size,
+            "md5": md5,
+            "etag": etag,
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        # Size and checksum of a file as retrieved, before repacking
+        if source_md5 is not None:
+            entry.update(source_size=source_size, source_md5=source_md5)
+        with self._lock:
+            self.entries[file_name] = entry
+
+    def record_file(self, file_name: str, file_path: str, **partition):
+        """Records a partition with the size and checksum of a local file"""
+        self.record(
+            file_name,
+            size=os.path.getsize(file_path),
+            md5=file_md5(file_path),
+            **partition,
+        )
+
+    def is_complete(
+        self,
+        file_name: str,
+        size: Optional[int],
+        etag: Optional[str] = None,
+    ) -> bool:
+        """
+        Checks that a partition was recorded and that the existing
+        file still matches it, a missing file has a size of None.
+        """
+        with self._lock:
+            entry = self.entries.get(file_name)
+        if entry is None or size is None or entry["size"] != size:
+            return False
+        return etag is None or entry.get("etag") == etag
+
+    def is_complete_local(self, file_name: str, file_path: str) -> bool:
+        size = (
+            os.path.getsize(file_path) if os.path.exists(file_path) else None
+        )
+        return self.is_complete(file_name, size)
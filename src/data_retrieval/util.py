@@ -1,6 +1,29 @@
 import logging
 import os
-from typing import Any
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+
+class TaskOutcome(NamedTuple):
+    """Result of a single task run by `run_parallel`"""
+
+    item: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 def setup_output_path(output_path: str):
@@ -8,6 +31,145 @@ def setup_output_path(output_path: str):
     os.makedirs(output_path, exist_ok=True)
 
 
+def parse_years(value: str) -> List[int]:
+    """
+    Parses a comma separated list of years and inclusive
+    year ranges, i.e. '2023', '2023-2024' or '1981-1990,2023'
+    """
+    years = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        try:
+            first, last = int(start), int(end or start)
+        except ValueError:
+            raise ValueError(f"Invalid year or year range: {part!r}")
+        if first > last:
+            raise ValueError(f"Invalid year range: {part!r}")
+        years.update(range(first, last + 1))
+    if not years:
+        raise ValueError(f"No years given in {value!r}")
+    return sorted(years)
+
+
+def run_parallel(
+    func: Callable[[Any], Any], items: Iterable[Any], workers: int = 1
+) -> Iterator[TaskOutcome]:
+    """
+    Runs 'func' for every item on a pool of 'workers' threads
+    and yields one TaskOutcome per item as soon as it completes.
+    Exceptions are captured in the outcome instead of being raised,
+    so one failed item does not abort the others.
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            error = future.exception()
+            result = None if error else future.result()
+            yield TaskOutcome(futures[future], result, error)
+
+
+def run_pipeline(
+    produce: Callable[[Any], Any],
+    consume: Callable[[Any, Any], Any],
+    items: Iterable[Any],
+    workers: int = 1,
+    consumer_workers: int = 1,
+    max_pending: Optional[int] = None,
+) -> Iterator[TaskOutcome]:
+    """
+    Runs 'produce' for every item on 'workers' threads and hands
+    each payload straight to 'consume' on 'consumer_workers' threads,
+    yielding one TaskOutcome per item once it is consumed.
+    At most 'max_pending' payloads (default: one per producer and
+    consumer worker, 'workers' + 'consumer_workers') exist
+    at once, the next item is only taken from 'items' once a slot
+    is free, so a slow consumer holds back the producers and 'items'
+    may be a lazy iterator, i.e. yielding jobs as they complete.
+    """
+    if workers < 1 or consumer_workers < 1:
+        raise ValueError(
+            f"workers must be at least 1, got {workers}/{consumer_workers}"
+        )
+    max_pending = max_pending or workers + consumer_workers
+    slots = threading.BoundedSemaphore(max_pending)
+    outcomes: "queue.Queue[Optional[TaskOutcome]]" = queue.Queue()
+    feed_errors: List[BaseException] = []
+
+    with ThreadPoolExecutor(max_workers=consumer_workers) as consumers:
+
+        def consume_item(item: Any, payload: Any):
+            try:
+                outcomes.put(TaskOutcome(item, consume(item, payload)))
+            except Exception as error:
+                outcomes.put(TaskOutcome(item, error=error))
+            finally:
+                slots.release()
+
+        def produce_item(item: Any):
+            try:
+                payload = produce(item)
+            except Exception as error:
+                slots.release()
+                outcomes.put(TaskOutcome(item, error=error))
+                return
+            consumers.submit(consume_item, item, payload)
+
+        with ThreadPoolExecutor(max_workers=workers) as producers:
+            feed_counts: List[int] = []
+
+            def feed():
+                count = 0
+                try:
+                    for item in _acquire_each(slots, items):
+                        producers.submit(produce_item, item)
+                        count += 1
+                except Exception as error:
+                    feed_errors.append(error)
+                finally:
+                    # Wakes up the loop below to read the number of items
+                    feed_counts.append(count)
+                    outcomes.put(None)
+
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+
+            received = 0
+            while not feed_counts or received < feed_counts[0]:
+                outcome = outcomes.get()
+                if outcome is None:
+                    continue
+                received += 1
+                yield outcome
+            feeder.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+
+
+def _acquire_each(
+    slots: threading.BoundedSemaphore, items: Iterable[Any]
+) -> Iterator[Any]:
+    """Yields the items one by one, each once a slot was acquired for it"""
+    iterator = iter(items)
+    while True:
+        slots.acquire()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            slots.release()
+            return
+        except BaseException:
+            slots.release()
+            raise
+        yield item
+
+
 def get_logger(
     name: str, *, log_lvl: Any = logging.DEBUG, format: str = None
 ) -> logging.Logger:
@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.repack import benchmark_file, write_synthetic_grib
+
+
+def test_benchmark_file_reports_sizes_and_decode_times(tmp_path):
+    pytest.importorskip("eccodes")
+    file_path = str(tmp_path / "synthetic.grib")
+    write_synthetic_grib(file_path, "GRIB2", fields=2)
+
+    result = benchmark_file(file_path, repeat=1)
+
+    assert (result.messages, result.repacked) == (2, 2)
+    assert result.repacked_bytes < result.source_bytes
+    assert result.source_decode > 0 and result.repacked_decode > 0
@@ -0,0 +1,46 @@
+import pytest
+
+from benchmarks.standin_server import StandInConfig, StandInServer
+from src.data_retrieval.cds import retry
+from src.data_retrieval.cds.common import download_cds, download_mars
+from src.data_retrieval.cds.retry import RetryPolicy
+
+
+@pytest.fixture
+def standin(request, monkeypatch):
+    config = getattr(request, "param", StandInConfig(payload_size=300_000))
+    with StandInServer(config) as server:
+        for key, value in server.environ().items():
+            monkeypatch.setenv(key, value)
+        yield server
+
+
+def test_download_cds_retrieves_from_standin(standin, tmp_path):
+    file_path = tmp_path / "era5.grib"
+
+    download_cds("dataset", {"year": ["2021"]}, str(file_path))
+
+    assert file_path.stat().st_size == 300_000
+    assert standin.stats["submitted"] == 1
+
+
+def test_download_mars_retrieves_from_standin(standin, tmp_path):
+    file_path = tmp_path / "mars.grib"
+
+    download_mars({"date": "2021-01-01"}, str(file_path))
+
+    assert file_path.stat().st_size == 300_000
+    assert standin.stats["bytes_served"] == 300_000
+
+
+@pytest.mark.parametrize(
+    "standin", [StandInConfig(failure_rate=1.0)], indirect=True
+)
+def test_download_cds_raises_failed_standin_requests(
+    standin, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(retry, "_default_policy", RetryPolicy(1, 0, 0))
+    with pytest.raises(Exception, match="Stand-in request failed"):
+        download_cds("dataset", {"year": ["2021"]}, str(tmp_path / "f"))
+    # The failed request was submitted again once
+    assert standin.stats["submitted"] == 2
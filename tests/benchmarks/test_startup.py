@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.startup import COMMANDS, HEAVY_MODULES, imported_modules
+
+
+@pytest.mark.parametrize("command", COMMANDS, ids=" ".join)
+def test_commands_which_retrieve_nothing_skip_heavy_imports(command):
+    assert HEAVY_MODULES & imported_modules(command) == set()
@@ -0,0 +1,42 @@
+from typing import Any, Dict, Iterable
+
+import pytest
+
+
+@pytest.fixture
+def eccodes():
+    # Imported when the tests run, as in the GRIB functions, since loading
+    # the GRIB library before pyproj breaks its database lookup
+    return pytest.importorskip("eccodes")
+
+
+@pytest.fixture
+def write_grib(eccodes):
+    """
+    Returns a function writing a GRIB file from a sample, with 'keys'
+    set on every message and then the keys of each dict of 'messages',
+    the 'values' of the field last.
+    """
+
+    def write(
+        file_path: str,
+        messages: Iterable[Dict[str, Any]],
+        sample: str = "regular_ll_sfc_grib1",
+        **keys,
+    ):
+        gid = eccodes.codes_grib_new_from_samples(sample)
+        try:
+            for key, value in keys.items():
+                eccodes.codes_set(gid, key, value)
+            with open(file_path, "wb") as f:
+                for message in messages:
+                    for key, value in message.items():
+                        if key != "values":
+                            eccodes.codes_set(gid, key, value)
+                    if "values" in message:
+                        eccodes.codes_set_values(gid, message["values"])
+                    eccodes.codes_write(gid, f)
+        finally:
+            eccodes.codes_release(gid)
+
+    return write
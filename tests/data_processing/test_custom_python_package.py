@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+from azure.core.exceptions import ResourceNotFoundError
+
+from src.data_processing import custom_python_package
+from src.data_retrieval import azure_blob_utils
+from src.data_retrieval.cds.index import build_grib_index
+from tests.grib import SEASONAL_KEYS
+
+BLOB_URL = "az://container/raw/forecast.grib"
+
+
+@pytest.fixture
+def blobs(tmp_path, monkeypatch):
+    """Serves the files of a directory as blobs, recording bytes read"""
+    read = {}
+
+    class FakeBlob:
+        def __init__(self, file_path):
+            self.file = open(file_path, "rb")
+            self.name = file_path
+
+        def read(self, size=-1):
+            data = self.file.read(size)
+            read[self.name] = read.get(self.name, 0) + len(data)
+            return data
+
+        def __getattr__(self, name):
+            return getattr(self.file, name)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            self.file.close()
+
+    def open_blob(url, block_cache=None):
+        file_path = str(tmp_path / url.split("/", 3)[3])
+        if not os.path.exists(file_path):
+            raise ResourceNotFoundError(url)
+        return FakeBlob(file_path)
+
+    monkeypatch.setattr(azure_blob_utils, "open_blob", open_blob)
+    (tmp_path / "raw").mkdir()
+    return read
+
+
+def _write_seasonal_grib(write_grib, file_path: str, members: int):
+    """Writes one field per leadtime month and member, of the member"""
+    write_grib(
+        file_path,
+        [
+            {
+                "forecastMonth": leadtime,
+                "number": number,
+                "values": np.full(496, float(number)),
+            }
+            for leadtime in [1, 2]
+            for number in range(members)
+        ],
+        **SEASONAL_KEYS,
+    )
+
+
+def test_load_climate_data_reads_indexed_member_of_grib_blob(
+    write_grib, tmp_path, blobs
+):
+    file_path = str(tmp_path / "raw" / "forecast.grib")
+    _write_seasonal_grib(write_grib, file_path, members=4)
+    build_grib_index(file_path)
+
+    input_xr = custom_python_package._load_climate_data(
+        BLOB_URL, filter_value=2
+    )
+
+    assert int(input_xr["number"]) == 2
+    assert float(input_xr["t2m"].min()) == float(input_xr["t2m"].max()) == 2
+    assert blobs[file_path] == os.path.getsize(file_path) / 4
+
+
+def test_open_climate_data_reads_unindexed_grib_blob_once(
+    write_grib, tmp_path, blobs
+):
+    file_path = str(tmp_path / "raw" / "forecast.grib")
+    _write_seasonal_grib(write_grib, file_path, members=4)
+
+    with custom_python_package._open_climate_data(BLOB_URL) as (
+        input_xr,
+        selected,
+    ):
+        members = [
+            float(
+                custom_python_package._select_climate_data(
+                    input_xr, filter_value=number
+                )["t2m"].mean()
+            )
+            for number in range(4)
+        ]
+
+    assert not selected
+    assert members == [0, 1, 2, 3]
+    assert blobs == {file_path: os.path.getsize(file_path)}
+
+
+def test_load_climate_data_reads_netcdf_blob(tmp_path, blobs):
+    pytest.importorskip("h5netcdf")
+    file_path = str(tmp_path / "raw" / "era5.netcdf")
+    xr.Dataset(
+        {"tp": (("latitude", "longitude"), [[1.0, 2.0], [3.0, 4.0]])},
+        coords={"latitude": [10.0, 20.0], "longitude": [30.0, 40.0]},
+    ).to_netcdf(file_path, engine="h5netcdf")
+
+    input_xr = custom_python_package._load_climate_data(
+        "az://container/raw/era5.netcdf", bbox=(35, 5, 45, 15)
+    )
+
+    assert input_xr["tp"].values.tolist() == [[2.0]]
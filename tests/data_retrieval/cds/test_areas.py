@@ -0,0 +1,53 @@
+import pytest
+
+from src.data_retrieval.cds.areas import (
+    count_grid_points,
+    get_boundary_bbox,
+    group_bboxes,
+    snap_bbox,
+    union_bbox,
+)
+
+
+def test_count_grid_points_returns_correct_value():
+    assert count_grid_points(None, "1.0/1.0") == 181 * 360
+    assert count_grid_points("10.0/20.0/9.2/21.2", "0.4/0.4") == 3 * 4
+
+
+def test_union_bbox_returns_the_enclosing_area():
+    assert union_bbox(["10/20/0/30", "15/25/5/40"]) == "15/20/0/40"
+
+
+def test_group_bboxes_merges_neighbours_and_keeps_distant_areas_apart():
+    bboxes = {
+        "A": "10/20/0/30",
+        "B": "10/30/0/40",
+        "C": "11/29/-1/31",
+        "D": "-30/120/-40/130",
+    }
+
+    assert group_bboxes(bboxes, "0.4/0.4") == [["A", "B", "C"], ["D"]]
+    assert group_bboxes(bboxes, "0.4/0.4", max_overhead=0) == [
+        ["A", "B"],
+        ["C"],
+        ["D"],
+    ]
+
+
+def test_snap_bbox_buffers_and_snaps_outwards_to_the_grid():
+    assert snap_bbox("14.9/33.0/3.4/47.95", "1.0/1.0") == "16/32/2/49"
+    assert snap_bbox("14.9/33.0/3.4/47.95", "0.25/0.25", 0) == "15/33/3.25/48"
+    assert snap_bbox("89.5/-179.5/-89.5/179.5", "1.0/1.0") == "90/-180/-90/180"
+
+
+def test_get_boundary_bbox_returns_bounds_in_degrees(tmp_path):
+    gpd = pytest.importorskip("geopandas")
+    boundaries = gpd.GeoDataFrame(
+        {"adm1": ["A", "B"]},
+        geometry=gpd.points_from_xy([38.5, 40.0], [8.0, 10.5]),
+        crs="EPSG:4326",
+    ).to_crs("EPSG:3857")
+    file_path = tmp_path / "adm1.geojson"
+    boundaries.to_file(file_path, driver="GeoJSON")
+
+    assert get_boundary_bbox(str(file_path)) == "10.5/38.5/8/40"
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.data_retrieval.cds import cache, common, file_cache
+from src.data_retrieval.cds.cache import RequestCache, get_request_key
+
+
+def test_get_request_key_ignores_key_order_and_target():
+    first = get_request_key("dataset", {"year": ["2021"], "target": "a"})
+    second = get_request_key("dataset", {"target": "b", "year": ["2021"]})
+    other = get_request_key("dataset", {"year": ["2022"]})
+
+    assert first == second
+    assert first != other
+
+
+def test_fetch_collapses_concurrent_identical_requests(tmp_path):
+    request_cache = RequestCache(str(tmp_path))
+    calls = []
+
+    def retrieve(target: str):
+        calls.append(target)
+        time.sleep(0.05)
+        with open(target, "wb") as f:
+            f.write(b"grib")
+
+    threads = [
+        threading.Thread(target=request_cache.fetch, args=("key", retrieve))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    with open(request_cache.path_for("key"), "rb") as f:
+        assert f.read() == b"grib"
+
+
+def test_fetch_does_not_keep_failed_retrievals(tmp_path):
+    request_cache = RequestCache(str(tmp_path))
+
+    def retrieve(target: str):
+        with open(target, "wb") as f:
+            f.write(b"truncated")
+        raise ConnectionError("dropped")
+
+    with pytest.raises(ConnectionError):
+        request_cache.fetch("key", retrieve)
+
+    assert request_cache.get("key") is None
+    assert not [name for name in os.listdir(tmp_path) if "key.data" in name]
+
+
+FILES = [".data", ".lock"]
+
+
+def write_bytes(data: bytes):
+    def retrieve(target: str):
+        with open(target, "wb") as f:
+            f.write(data)
+
+    return retrieve
+
+
+def test_evict_removes_least_recently_used_entries(tmp_path):
+    request_cache = RequestCache(str(tmp_path), max_bytes=10)
+
+    def write(size: int):
+        return write_bytes(b"x" * size)
+
+    request_cache.fetch("old", write(4))
+    request_cache.fetch("used", write(4))
+    os.utime(request_cache.path_for("old"), (1, 1))
+    os.utime(request_cache.path_for("used"), (2, 2))
+    request_cache.get("used")
+    request_cache.fetch("new", write(4))
+
+    assert request_cache.get("old") is None
+    assert request_cache.get("used") is not None
+    assert request_cache.get("new") is not None
+    assert sorted(os.listdir(tmp_path)) == [
+        f"{key}{suffix}" for key in ["new", "used"] for suffix in FILES
+    ]
+
+
+def test_evict_skips_entries_being_read(tmp_path):
+    request_cache = RequestCache(str(tmp_path), max_bytes=0)
+
+    with request_cache.fetch_locked("key", write_bytes(b"grib")) as path:
+        request_cache.evict()
+        with open(path, "rb") as f:
+            assert f.read() == b"grib"
+    request_cache.evict()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_lock_retries_on_lock_file_removed_while_waiting(tmp_path):
+    first, second = RequestCache(str(tmp_path)), RequestCache(str(tmp_path))
+    locked = threading.Event()
+
+    def wait_for_lock():
+        with second.lock("key"):
+            locked.set()
+            time.sleep(0.2)
+
+    with first.lock("key"):
+        waiting = threading.Thread(target=wait_for_lock)
+        waiting.start()
+        time.sleep(0.1)
+        # As eviction does, while the other thread waits on the file
+        os.remove(first.entry_path("key", ".lock"))
+    assert locked.wait(5)
+    with first.lock("key", blocking=False) as acquired:
+        assert not acquired
+    waiting.join()
+
+
+def test_download_cds_serves_repeated_request_from_cache(
+    tmp_path, monkeypatch
+):
+    calls = []
+
+    class FakeResult:
+        def download(self, target):
+            with open(target, "wb") as f:
+                f.write(b"grib")
+
+    class FakeClient:
+        def retrieve(self, name, metadata):
+            calls.append(name)
+            return FakeResult()
+
+    monkeypatch.setattr("cdsapi.Client", FakeClient)
+    monkeypatch.setattr(cache, "_default_cache", None)
+    cache.configure_cache(str(tmp_path / "cache"))
+
+    file_path = str(tmp_path / "first.grib")
+    common.download_cds("dataset", {"year": ["2021"]}, file_path)
+    data = common.download_cds("dataset", {"year": ["2021"]})
+
+    assert calls == ["dataset"]
+    assert data.read() == b"grib"
+    with open(file_path, "rb") as f:
+        assert f.read() == b"grib"
+
+
+def test_copy_from_cache_does_not_share_changes(tmp_path):
+    cached_path = tmp_path / "entry.data"
+    cached_path.write_bytes(b"grib")
+    file_path = tmp_path / "output.grib"
+
+    file_cache.copy_from_cache(str(cached_path), str(file_path))
+    with open(file_path, "r+b") as f:
+        f.write(b"GR")
+
+    assert cached_path.read_bytes() == b"grib"
+    assert file_path.read_bytes() == b"GRib"
@@ -1,4 +1,13 @@
+import os
+
+import pytest
+
+from src.data_retrieval.cds import cache, common, retry
 from src.data_retrieval.cds.common import get_dates
+from src.data_retrieval.cds.retry import RetryPolicy
+from src.data_retrieval.cds.verify import GribIntegrityError
+
+GRIB_MESSAGE: bytes = b"GRIB" + (16).to_bytes(3, "big") + b"\x01" * 5 + b"7777"
 
 
 def test_get_dates_returns_correct_value():
@@ -8,3 +17,51 @@ def test_get_dates_returns_correct_value():
     returned: str = get_dates(2019)
 
     assert expected == returned
+
+
+@pytest.fixture
+def fake_cds(tmp_path, monkeypatch):
+    """CDS client which returns the queued payloads, one per retrieval"""
+    payloads = []
+
+    class FakeResult:
+        def __init__(self, payload: bytes):
+            self.payload = payload
+
+        def download(self, target):
+            with open(target, "wb") as f:
+                f.write(self.payload)
+
+    class FakeClient:
+        def retrieve(self, name, metadata):
+            return FakeResult(payloads.pop(0))
+
+    monkeypatch.setattr("cdsapi.Client", FakeClient)
+    monkeypatch.setattr(retry, "_default_policy", RetryPolicy(1, 0, 0))
+    monkeypatch.setattr(cache, "_default_cache", None)
+    cache.configure_cache(str(tmp_path / "cache"))
+    return payloads
+
+
+def test_download_cds_retries_truncated_grib(fake_cds, tmp_path):
+    fake_cds.extend([GRIB_MESSAGE * 2 + GRIB_MESSAGE[:10], GRIB_MESSAGE * 3])
+    file_path = str(tmp_path / "data.grib")
+
+    common.download_cds("dataset", {"year": ["2021"]}, file_path, None, 3)
+
+    with open(file_path, "rb") as f:
+        assert f.read() == GRIB_MESSAGE * 3
+    assert not fake_cds
+
+
+def test_download_cds_never_caches_incomplete_grib(fake_cds, tmp_path):
+    fake_cds.extend([GRIB_MESSAGE * 2, GRIB_MESSAGE * 2])
+    file_path = str(tmp_path / "data.grib")
+
+    with pytest.raises(GribIntegrityError):
+        common.download_cds("dataset", {"year": ["2021"]}, file_path, None, 3)
+
+    assert not os.path.exists(file_path)
+    assert not cache.get_default_cache().get(
+        cache.get_request_key("dataset", {"year": ["2021"]})
+    )
@@ -0,0 +1,56 @@
+import pytest
+
+from src.data_retrieval.cds.countries import (
+    CountryRegistry,
+    get_country_registry,
+)
+
+
+@pytest.fixture
+def registry():
+    return CountryRegistry(
+        [
+            ("AAA", "Alpha", "10/20/0/30"),
+            ("BBB", "Beta", "10/30/0/40"),
+            ("CCC", "Gamma", "-30/120/-40/130"),
+        ]
+    )
+
+
+def test_get_returns_parsed_country(registry):
+    country = registry.get("bbb")
+
+    assert country.name == "Beta"
+    assert country.bbox == "10/30/0/40"
+    assert country.bounds == (10.0, 30.0, 0.0, 40.0)
+    assert registry.get("XXX") is None
+
+
+def test_countries_at_returns_containing_bboxes(registry):
+    assert [c.iso for c in registry.countries_at(5, 30)] == ["AAA", "BBB"]
+    assert [c.iso for c in registry.countries_at(-35, 125)] == ["CCC"]
+    assert registry.countries_at(50, 0) == []
+
+
+def test_countries_intersecting_returns_overlapping_bboxes(registry):
+    assert [
+        c.iso for c in registry.countries_intersecting("5/35/-50/125")
+    ] == [
+        "BBB",
+        "CCC",
+    ]
+    assert registry.countries_intersecting("60/0/50/10") == []
+
+
+def test_union_bbox_encloses_countries(registry):
+    assert registry.union_bbox(["AAA", "bbb"]) == "10/20/0/40"
+    with pytest.raises(KeyError):
+        registry.union_bbox(["XXX"])
+
+
+def test_get_country_registry_reads_supported_countries():
+    registry = get_country_registry()
+
+    assert registry is get_country_registry()
+    assert registry.get("ETH").name == "Ethiopia"
+    assert "ETH" in [c.iso for c in registry.countries_at(9.0, 38.7)]
@@ -1,6 +1,11 @@
+import os
 from typing import Any, Dict, List
 
-from src.data_retrieval.cds.ecmwf import get_ecmwf_cds_metadata
+from src.data_retrieval.cds import ecmwf
+from src.data_retrieval.cds.ecmwf import (
+    get_ecmwf_cds_file_name,
+    get_ecmwf_cds_metadata,
+)
 
 
 def test_get_ecmwf_cds_metadata_returns_correct_value():
@@ -23,3 +28,74 @@ def test_get_ecmwf_cds_metadata_returns_correct_value():
     )
 
     assert expected == returned
+
+
+def test_get_ecmwf_cds_file_name_returns_correct_value():
+    assert (
+        get_ecmwf_cds_file_name(list(range(1981, 2024)), list(range(1, 7)))
+        == "ecmwf-monthly-seasonalforecast-1981-2023.grib"
+    )
+    assert (
+        get_ecmwf_cds_file_name([2021], [3], "netcdf")
+        == "ecmwf-monthly-seasonalforecast-2021-lt3.netcdf"
+    )
+
+
+def test_download_ecmwf_cds_scopes_netcdf_requests_to_partitions(
+    tmp_path, monkeypatch
+):
+    requests: Dict[str, Dict[str, Any]] = {}
+
+    def fake_download_cds(name, metadata, file_path=None):
+        requests[os.path.basename(file_path)] = metadata
+
+    monkeypatch.setattr(ecmwf, "download_cds", fake_download_cds)
+
+    ecmwf.download_ecmwf_cds(
+        [2020, 2021],
+        [1, 2],
+        [1, 2],
+        str(tmp_path),
+        "netcdf",
+        "ignored.netcdf",
+        workers=2,
+    )
+
+    assert sorted(requests) == [
+        "ecmwf-monthly-seasonalforecast-2020-lt1.netcdf",
+        "ecmwf-monthly-seasonalforecast-2020-lt2.netcdf",
+        "ecmwf-monthly-seasonalforecast-2021-lt1.netcdf",
+        "ecmwf-monthly-seasonalforecast-2021-lt2.netcdf",
+    ]
+    metadata = requests["ecmwf-monthly-seasonalforecast-2021-lt2.netcdf"]
+    assert metadata["year"] == ["2021"]
+    assert metadata["leadtime_month"] == ["2"]
+
+
+def test_download_ecmwf_cds_names_netcdf_partitions_of_an_area(
+    tmp_path, monkeypatch
+):
+    requests: Dict[str, Dict[str, Any]] = {}
+
+    def fake_download_cds(name, metadata, file_path=None):
+        requests[os.path.basename(file_path)] = metadata
+
+    monkeypatch.setattr(ecmwf, "download_cds", fake_download_cds)
+
+    ecmwf.download_ecmwf_cds(
+        [2021],
+        [1],
+        [1, 2],
+        str(tmp_path),
+        "netcdf",
+        "ignored.netcdf",
+        area="15/33/3/48",
+        area_name="eth",
+    )
+
+    assert sorted(requests) == [
+        "ecmwf-monthly-seasonalforecast-eth-2021-lt1.netcdf",
+        "ecmwf-monthly-seasonalforecast-eth-2021-lt2.netcdf",
+    ]
+    for metadata in requests.values():
+        assert metadata["area"] == [15.0, 33.0, 3.0, 48.0]
@@ -0,0 +1,87 @@
+from src.data_retrieval.cds.index import (
+    build_grib_index,
+    extract_messages,
+    get_index_path,
+    read_grib_index,
+    select_messages,
+)
+from tests.grib import SEASONAL_KEYS
+
+
+def _write_seasonal_grib(write_grib, file_path: str, members: int):
+    """Writes one field per start month, leadtime month and member"""
+    write_grib(
+        file_path,
+        [
+            {
+                "dataDate": 20210001 + month * 100,
+                "forecastMonth": leadtime,
+                "number": number,
+            }
+            for month in [1, 2]
+            for leadtime in [1, 2, 3]
+            for number in range(members)
+        ],
+        **SEASONAL_KEYS,
+    )
+
+
+def test_build_grib_index_maps_fields_to_byte_ranges(write_grib, tmp_path):
+    file_path = str(tmp_path / "forecast.grib")
+    _write_seasonal_grib(write_grib, file_path, members=2)
+
+    index_path = build_grib_index(file_path)
+    entries = read_grib_index(index_path)
+
+    assert index_path == get_index_path(file_path)
+    assert len(entries) == 12
+    assert entries[0]["_offset"] == 0
+    assert entries[1]["_offset"] == entries[0]["_length"]
+    assert {
+        (e["year"], e["month"], e["leadtime"], e["number"]) for e in entries
+    } == {
+        (2021, month, leadtime, number)
+        for month in [1, 2]
+        for leadtime in [1, 2, 3]
+        for number in range(2)
+    }
+
+
+def test_extract_messages_copies_only_selected_messages(
+    eccodes, write_grib, tmp_path
+):
+    file_path = str(tmp_path / "forecast.grib")
+    _write_seasonal_grib(write_grib, file_path, members=3)
+    build_grib_index(file_path)
+    target_path = str(tmp_path / "member-1.grib")
+
+    count = extract_messages(file_path, target_path, number=1, leadtime=[1, 3])
+
+    assert count == 4
+    fields = []
+    with open(target_path, "rb") as f:
+        while True:
+            gid = eccodes.codes_grib_new_from_file(f)
+            if gid is None:
+                break
+            fields.append(
+                (
+                    eccodes.codes_get(gid, "number"),
+                    eccodes.codes_get(gid, "forecastMonth"),
+                )
+            )
+            eccodes.codes_release(gid)
+    assert fields == [(1, 1), (1, 3), (1, 1), (1, 3)]
+
+
+def test_select_messages_matches_single_values_and_lists():
+    entries = [
+        {"year": 2021, "leadtime": 1},
+        {"year": 2021, "leadtime": 2},
+        {"year": 2022, "leadtime": 1},
+    ]
+
+    assert select_messages(entries, year=2021, leadtime=[2, 3]) == [
+        {"year": 2021, "leadtime": 2}
+    ]
+    assert select_messages(entries) == entries
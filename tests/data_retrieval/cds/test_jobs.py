@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import as_completed
+from typing import Any, Dict, List
+
+import pytest
+
+from src.data_retrieval.cds.jobs import CdsJobError, CdsJobRunner
+
+
+class FakeRemote:
+    def __init__(self, client: "FakeClient", year: str, polls: int):
+        self.client = client
+        self.year = year
+        self.polls = polls
+        self.reply: Dict[str, Any] = {"state": "queued"}
+        self.deleted = False
+
+    def update(self):
+        self.polls -= 1
+        if self.polls <= 0:
+            with self.client.lock:
+                self.client.active -= 1
+            if self.year == "failing":
+                self.reply = {"state": "failed", "error": {"message": "x"}}
+            else:
+                self.reply = {"state": "completed"}
+        else:
+            self.reply = {"state": "running"}
+
+    def download(self, target: str):
+        with open(target, "w") as f:
+            f.write(self.year)
+
+    def delete(self):
+        self.deleted = True
+
+
+class FakeClient:
+    """Jobs complete after the given number of polls of their state"""
+
+    def __init__(self, polls: Dict[str, int]):
+        self.polls = polls
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak_active = 0
+        self.submitted: List[str] = []
+
+    def retrieve(self, name: str, metadata: Dict[str, Any]):
+        with self.lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            self.submitted.append(metadata["year"])
+        return FakeRemote(self, metadata["year"], self.polls[metadata["year"]])
+
+
+def test_runner_retrieves_jobs_in_completion_order(tmp_path):
+    client = FakeClient({"2021": 30, "2022": 20, "2023": 10})
+
+    with CdsJobRunner(poll_interval=0.001, client=client) as runner:
+        futures = {
+            runner.submit("dataset", {"year": year}): year
+            for year in ["2021", "2022", "2023"]
+        }
+        completed = [futures[future] for future in as_completed(futures)]
+        for year in completed:
+            runner.retrieve("dataset", {"year": year}, tmp_path / year)
+            assert (tmp_path / year).read_text() == year
+
+    assert completed == ["2023", "2022", "2021"]
+    assert client.submitted == ["2021", "2022", "2023"]
+
+
+def test_runner_limits_active_jobs(tmp_path):
+    client = FakeClient({str(year): 2 for year in range(10)})
+
+    with CdsJobRunner(2, poll_interval=0.001, client=client) as runner:
+        futures = [
+            runner.submit("dataset", {"year": str(year)}) for year in range(10)
+        ]
+        for future in as_completed(futures):
+            year = future.result().year
+            runner.retrieve("dataset", {"year": year}, str(tmp_path / year))
+
+    assert len(client.submitted) == 10
+    assert client.peak_active == 2
+
+
+def test_runner_raises_failed_jobs(tmp_path):
+    client = FakeClient({"failing": 1})
+
+    with CdsJobRunner(poll_interval=0.001, client=client) as runner:
+        with pytest.raises(CdsJobError):
+            runner.retrieve(
+                "dataset", {"year": "failing"}, str(tmp_path / "f")
+            )
@@ -0,0 +1,88 @@
+from typing import List
+
+from src.data_retrieval.cds.planner import (
+    PlannedRequest,
+    plan_ecmwf_cds,
+    plan_ecmwf_mars,
+    plan_era5_cds,
+)
+
+
+def test_plan_ecmwf_cds_defaults_to_a_single_grib_request():
+    years = list(range(1981, 2024))
+
+    returned: List[PlannedRequest] = plan_ecmwf_cds(
+        years, list(range(1, 13)), list(range(1, 7))
+    )
+
+    assert len(returned) == 1
+    assert returned[0].years == years
+    assert returned[0].fields == (36 * 25 + 7 * 51) * 12 * 6
+
+
+def test_plan_ecmwf_cds_netcdf_plans_one_request_per_partition():
+    returned = plan_ecmwf_cds(
+        [2021, 2022], [1, 2], [1, 2, 3], "netcdf", per_partition=True
+    )
+
+    assert [(r.years, r.leadtime_months) for r in returned] == [
+        ([2021], [1]),
+        ([2021], [2]),
+        ([2021], [3]),
+        ([2022], [1]),
+        ([2022], [2]),
+        ([2022], [3]),
+    ]
+    assert returned[0].metadata["year"] == ["2021"]
+    assert returned[0].metadata["leadtime_month"] == ["1"]
+
+
+def test_plan_ecmwf_cds_splits_to_target_size():
+    target_bytes = 2 * 1024**3
+
+    returned = plan_ecmwf_cds(
+        list(range(1981, 2024)),
+        list(range(1, 13)),
+        list(range(1, 7)),
+        target_bytes=target_bytes,
+    )
+
+    assert len(returned) > 1
+    assert all(request.bytes <= target_bytes for request in returned)
+    assert [y for r in returned for y in r.years] == list(range(1981, 2024))
+
+
+def test_plan_ecmwf_cds_splits_large_year_by_leadtime_months():
+    single_leadtime = plan_ecmwf_cds([2021], list(range(1, 13)), [1])[0]
+
+    returned = plan_ecmwf_cds(
+        [2021],
+        list(range(1, 13)),
+        list(range(1, 7)),
+        target_bytes=single_leadtime.bytes * 2,
+    )
+
+    assert [r.leadtime_months for r in returned] == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_plan_ecmwf_mars_merges_years_with_same_members():
+    returned = plan_ecmwf_mars(
+        list(range(2014, 2020)), "15.0/33.0/3.4/48.0", target_bytes=1024**3
+    )
+
+    assert [r.years for r in returned] == [
+        [2014, 2015, 2016],
+        [2017, 2018, 2019],
+    ]
+    assert returned[0].metadata["date"].startswith("2014-01-01/")
+    assert returned[0].metadata["date"].endswith("/2016-12-01")
+
+
+def test_plan_era5_cds_requests_only_the_given_area():
+    global_request = plan_era5_cds([2021], list(range(1, 13)))[0]
+
+    returned = plan_era5_cds([2021], list(range(1, 13)), area="16/32/2/49")
+
+    assert returned[0].metadata["area"] == [16.0, 32.0, 2.0, 49.0]
+    assert "area" not in global_request.metadata
+    assert returned[0].bytes < global_request.bytes / 100
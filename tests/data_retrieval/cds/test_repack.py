@@ -0,0 +1,86 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from src.data_retrieval.cds.repack import repack_grib
+from src.data_retrieval.cds.verify import count_grib_messages
+
+
+def _write_fields(write_grib, file_path: str, sample: str, fields: int):
+    """Writes smooth, simply packed fields of a 1 degree global grid"""
+    rng = np.random.default_rng(0)
+    write_grib(
+        file_path,
+        [
+            {"values": np.cumsum(rng.random(360 * 181) * 0.01) % 5}
+            for _ in range(fields)
+        ],
+        sample,
+        Ni=360,
+        Nj=181,
+        bitsPerValue=16,
+    )
+
+
+def _read_values(eccodes, file_path: str):
+    fields = []
+    with open(file_path, "rb") as f:
+        while True:
+            gid = eccodes.codes_grib_new_from_file(f)
+            if gid is None:
+                return fields
+            fields.append(
+                (
+                    eccodes.codes_get(gid, "packingType"),
+                    eccodes.codes_get_values(gid),
+                )
+            )
+            eccodes.codes_release(gid)
+
+
+@pytest.mark.parametrize(
+    "sample, packing",
+    [("GRIB2", "grid_ccsds"), ("GRIB1", "grid_second_order")],
+)
+def test_repack_grib_is_lossless_and_smaller(
+    eccodes, write_grib, tmp_path, sample, packing
+):
+    source_path = str(tmp_path / "source.grib")
+    target_path = str(tmp_path / "repacked.grib")
+    _write_fields(write_grib, source_path, sample, fields=3)
+    with open(source_path, "rb") as f:
+        source_md5 = hashlib.md5(f.read()).hexdigest()
+
+    result = repack_grib(source_path, target_path)
+
+    assert (result.messages, result.repacked) == (3, 3)
+    assert result.source_md5 == source_md5
+    assert result.size < result.source_size * 0.7
+    assert count_grib_messages(target_path) == 3
+    source = _read_values(eccodes, source_path)
+    repacked = _read_values(eccodes, target_path)
+    assert [p for p, _ in repacked] == [packing] * 3
+    for (_, expected), (_, values) in zip(source, repacked):
+        assert np.array_equal(values, expected)
+
+
+def test_repack_grib_keeps_constant_fields(eccodes, tmp_path):
+    file_path = str(tmp_path / "constant.grib")
+    gid = eccodes.codes_grib_new_from_samples("GRIB2")
+    try:
+        eccodes.codes_set_values(
+            gid, np.zeros(eccodes.codes_get_size(gid, "values"))
+        )
+        with open(file_path, "wb") as f:
+            eccodes.codes_write(gid, f)
+    finally:
+        eccodes.codes_release(gid)
+    with open(file_path, "rb") as f:
+        original = f.read()
+
+    result = repack_grib(file_path)
+
+    assert (result.messages, result.repacked) == (1, 0)
+    with open(file_path, "rb") as f:
+        assert f.read() == original
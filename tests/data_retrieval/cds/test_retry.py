@@ -0,0 +1,50 @@
+import pytest
+
+from src.data_retrieval.cds.retry import RetryPolicy, retry_call
+from src.data_retrieval.cds.telemetry import record_span
+
+
+def test_retry_call_retries_until_success():
+    calls = []
+    delays = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("dropped")
+        return "done"
+
+    with record_span("cds") as record:
+        result = retry_call(flaky, policy=RetryPolicy(3), sleep=delays.append)
+
+    assert result == "done"
+    assert len(calls) == 3
+    assert record["retries"] == 2
+    assert len(delays) == 2
+
+
+def test_retry_call_raises_once_retries_are_used_up():
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise ConnectionError("dropped")
+
+    with pytest.raises(ConnectionError):
+        retry_call(failing, policy=RetryPolicy(2), sleep=lambda _: None)
+
+    assert len(calls) == 3
+
+
+def test_retry_policy_delays_back_off_with_jitter():
+    policy = RetryPolicy(retries=10, base_delay=1.0, max_delay=8.0)
+
+    delays = [
+        [policy.delay(attempt) for _ in range(200)] for attempt in range(6)
+    ]
+
+    for attempt, attempt_delays in enumerate(delays):
+        assert all(0 <= d <= min(8.0, 2**attempt) for d in attempt_delays)
+        # Jittered delays are spread out, not all equal
+        assert len(set(attempt_delays)) > 1
+    assert max(delays[5]) > max(delays[0])
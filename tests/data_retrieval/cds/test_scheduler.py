@@ -0,0 +1,115 @@
+import subprocess
+import sys
+import threading
+
+from src.data_retrieval.cds.scheduler import (
+    _STATUS_WRAPPER,
+    DONE,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    JobQueue,
+    _is_running,
+    _process_start_time,
+    get_status_path,
+    run_scheduler,
+)
+
+
+def test_claim_keeps_services_within_their_limits(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    first = queue.enqueue("cds", ["cds", "era5"], slots=3)
+    second = queue.enqueue("cds", ["cds", "ecmwf"], slots=2)
+    mars = queue.enqueue("mars", ["mars", "ETH"], slots=4)
+    limits = {"cds": 4, "mars": 2}
+
+    claimed = [queue.claim(limits), queue.claim(limits), queue.claim(limits)]
+
+    assert [job.id for job in claimed[:2]] == [first, mars]
+    assert claimed[1].slots == 2
+    assert claimed[2] is None
+    queue.finish(first, 0)
+    assert queue.claim(limits).id == second
+
+
+def test_claim_runs_operational_jobs_before_backfills(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    backfill = queue.enqueue("cds", ["cds", "era5"], "backfill")
+    operational = queue.enqueue("cds", ["cds", "ecmwf"], "operational")
+
+    assert queue.claim({"cds": 1}).id == operational
+    assert queue.claim({"cds": 1}) is None
+    queue.finish(operational, 0)
+    assert queue.claim({"cds": 1}).id == backfill
+
+
+def test_requeue_orphans_requeues_jobs_of_stopped_schedulers(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    orphan = queue.enqueue("mars", ["mars", "ETH"])
+    alive = queue.enqueue("mars", ["mars", "KEN"])
+    queue.claim({"mars": 2}, owner=111)
+    queue.claim({"mars": 2}, owner=222)
+
+    requeued = queue.requeue_orphans(
+        is_running=lambda pid, **kwargs: pid == 222
+    )
+
+    assert requeued == [orphan]
+    states = {job.id: job.state for job in queue.jobs()}
+    assert states == {orphan: QUEUED, alive: RUNNING}
+
+
+def test_run_scheduler_records_the_exit_status_of_every_job(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    ok = queue.enqueue("cds", ["cds", "era5"], slots=2)
+    failed = queue.enqueue("mars", ["mars", "fail"])
+    command = [
+        sys.executable,
+        "-c",
+        "import sys; sys.exit(1 if 'fail' in sys.argv else 0)",
+    ]
+
+    run_scheduler(queue, command, poll_interval=0.05, until_empty=True)
+
+    jobs = {job.id: job for job in queue.jobs()}
+    assert jobs[ok].state == DONE
+    assert jobs[failed].state == FAILED
+    assert jobs[failed].returncode == 1
+    assert (tmp_path / "logs" / f"{ok}.log").exists()
+
+
+def test_run_scheduler_adopts_running_jobs_of_stopped_schedulers(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    job_id = queue.enqueue("mars", ["mars", "ETH"])
+    stopped = subprocess.Popen([sys.executable, "-c", ""])
+    stopped.wait()
+    queue.claim({"mars": 1}, owner=stopped.pid)
+    log_path = str(tmp_path / f"{job_id}.log")
+    command = subprocess.Popen(
+        [sys.executable, "-c", _STATUS_WRAPPER, get_status_path(log_path)]
+        + [sys.executable, "-c", "import time; time.sleep(1); exit(3)"]
+    )
+    # Reaps the command, as init does for the commands of a stopped
+    # scheduler
+    threading.Thread(target=command.wait).start()
+    queue.set_process(job_id, command.pid, log_path)
+
+    assert queue.requeue_orphans() == []
+    run_scheduler(queue, [], poll_interval=0.05, until_empty=True)
+
+    job = queue.jobs()[0]
+    assert not _is_running(command.pid, started_at=job.pid_started)
+    assert (job.state, job.returncode) == (FAILED, 3)
+
+
+def test_is_running_tells_reused_pids_apart():
+    process = subprocess.Popen([sys.executable, "-c", "input()"], stdin=-1)
+    try:
+        started = _process_start_time(process.pid)
+        assert _is_running(process.pid, started_at=started)
+        if started is not None:
+            assert not _is_running(process.pid, started_at=started - 60)
+            assert not _is_running(process.pid, started_before=started - 60)
+    finally:
+        process.communicate(b"\n")
+    assert not _is_running(process.pid)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from src.data_retrieval.cds.subset import subset_grib
+from tests.grib import regular_grid
+
+
+def _write_sample_grib(write_grib, file_path: str, count: int):
+    write_grib(
+        file_path,
+        [{"values": np.arange(66.0) + i} for i in range(count)],
+        **regular_grid(10.0, 20.0, 0.0, 30.0, lat_step=2.0),
+    )
+
+
+def _read_grib(eccodes, file_path: str):
+    fields = []
+    with open(file_path, "rb") as f:
+        while True:
+            gid = eccodes.codes_grib_new_from_file(f)
+            if gid is None:
+                return fields
+            fields.append(
+                (
+                    eccodes.codes_get(gid, "Nj"),
+                    eccodes.codes_get(gid, "Ni"),
+                    eccodes.codes_get_values(gid).tolist(),
+                )
+            )
+            eccodes.codes_release(gid)
+
+
+def test_subset_grib_writes_each_area_to_its_own_file(
+    eccodes, write_grib, tmp_path
+):
+    source_path = str(tmp_path / "union.grib")
+    _write_sample_grib(write_grib, source_path, count=2)
+    north_path = str(tmp_path / "north.grib")
+    east_path = str(tmp_path / "east.grib")
+
+    subset_grib(
+        source_path, {north_path: "10/20/8/21", east_path: "2/29/0/30"}
+    )
+
+    assert _read_grib(eccodes, north_path) == [
+        (2, 2, [0.0, 1.0, 11.0, 12.0]),
+        (2, 2, [1.0, 2.0, 12.0, 13.0]),
+    ]
+    assert _read_grib(eccodes, east_path) == [
+        (2, 2, [53.0, 54.0, 64.0, 65.0]),
+        (2, 2, [54.0, 55.0, 65.0, 66.0]),
+    ]
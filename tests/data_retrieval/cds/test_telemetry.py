@@ -0,0 +1,74 @@
+import pytest
+
+from src.data_retrieval.cds import telemetry
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "_default_recorder", None)
+    yield telemetry.configure_telemetry(str(tmp_path / "t.jsonl"), "run-1")
+    telemetry.configure_telemetry(None)
+
+
+def test_record_span_emits_timed_record_with_context(recorder):
+    with telemetry.telemetry_context(partition="era5-2021.grib"):
+        with telemetry.record_span("cds", dataset="era5") as record:
+            telemetry.mark_transfer_start()
+            record["bytes"] = 1000
+
+    (emitted,) = telemetry.read_telemetry(recorder.file_path)
+    assert emitted["run"] == "run-1"
+    assert emitted["kind"] == "cds"
+    assert emitted["partition"] == "era5-2021.grib"
+    assert emitted["outcome"] == "ok"
+    assert emitted["bytes"] == 1000
+    assert emitted["submitted_at"] <= emitted["started_at"]
+    assert emitted["started_at"] <= emitted["finished_at"]
+
+
+def test_record_span_records_errors(recorder):
+    with pytest.raises(RuntimeError):
+        with telemetry.record_span("mars"):
+            raise RuntimeError("queue timeout")
+
+    (emitted,) = telemetry.read_telemetry(recorder.file_path)
+    assert emitted["outcome"] == "error"
+    assert "queue timeout" in emitted["error"]
+
+
+def test_summarize_telemetry_totals_each_run_and_kind():
+    def record(run, kind, outcome, size, queue, transfer):
+        return {
+            "run": run,
+            "kind": kind,
+            "outcome": outcome,
+            "bytes": size,
+            "retries": 1,
+            "submitted_at": 0.0,
+            "finished_at": queue + transfer,
+            "queue_seconds": queue,
+            "transfer_seconds": transfer,
+        }
+
+    summary = telemetry.summarize_telemetry(
+        [
+            record("a", "cds", "ok", 100, 5.0, 1.0),
+            record("a", "cds", "error", None, 2.0, 0.0),
+            record("a", "blob_upload", "ok", 100, 0.0, 2.0),
+            record("b", "cds", "cached", 100, 0.0, 1.0),
+        ]
+    )
+
+    assert [(row["run"], row["kind"]) for row in summary] == [
+        ("a", "blob_upload"),
+        ("a", "cds"),
+        ("b", "cds"),
+    ]
+    cds = summary[1]
+    assert (cds["count"], cds["ok"], cds["failed"]) == (2, 1, 1)
+    assert cds["bytes"] == 100
+    assert cds["retries"] == 2
+    assert cds["wall_seconds"] == 6.0
+    assert cds["queue_seconds"] == 7.0
+    assert cds["bytes_per_second"] == 100.0
+    assert summary[2]["cached"] == 1
@@ -0,0 +1,60 @@
+import pytest
+
+from src.data_retrieval.cds.verify import (
+    GribIntegrityError,
+    count_grib_messages,
+    verify_grib,
+)
+
+
+def grib1_message(payload: bytes = b"\0" * 20) -> bytes:
+    length = 8 + len(payload) + 4
+    return b"GRIB" + length.to_bytes(3, "big") + b"\x01" + payload + b"7777"
+
+
+def grib2_message(payload: bytes = b"\0" * 30) -> bytes:
+    length = 16 + len(payload) + 4
+    header = b"GRIB\0\0\0\x02" + length.to_bytes(8, "big")
+    return header + payload + b"7777"
+
+
+def test_count_grib_messages_counts_both_editions(tmp_path):
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(
+        grib1_message() + grib2_message() + b"\0\0" + grib2_message()
+    )
+
+    assert count_grib_messages(str(file_path)) == 3
+
+
+def test_count_grib_messages_detects_truncated_file(tmp_path):
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(grib2_message() + grib2_message()[:-10])
+
+    with pytest.raises(GribIntegrityError, match="truncated"):
+        count_grib_messages(str(file_path))
+
+
+def test_count_grib_messages_detects_missing_end_marker(tmp_path):
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(grib1_message()[:-4] + b"0000")
+
+    with pytest.raises(GribIntegrityError, match="does not end"):
+        count_grib_messages(str(file_path))
+
+
+def test_verify_grib_compares_with_expected_messages(tmp_path):
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(grib2_message() * 4)
+
+    verify_grib(str(file_path), 4)
+    with pytest.raises(GribIntegrityError, match="expected 6"):
+        verify_grib(str(file_path), 6)
+
+
+def test_verify_grib_rejects_file_without_messages(tmp_path):
+    file_path = tmp_path / "error.grib"
+    file_path.write_bytes(b"<html>Service unavailable</html>")
+
+    with pytest.raises(GribIntegrityError, match="no GRIB message"):
+        verify_grib(str(file_path))
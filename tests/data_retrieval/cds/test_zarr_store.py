@@ -0,0 +1,121 @@
+from importlib.metadata import PackageNotFoundError
+
+import numpy as np
+import pytest
+
+from src.data_retrieval.cds import zarr_store
+from src.data_retrieval.cds.zarr_store import ZarrStore
+from tests.grib import SEASONAL_KEYS, regular_grid
+
+
+@pytest.fixture
+def zarr():
+    # zarr 3 is only installed on Python 3.11 or later
+    error = zarr_store.get_zarr_support_error()
+    if error:
+        pytest.skip(error)
+    return pytest.importorskip("zarr")
+
+
+def _write_forecast_grib(write_grib, file_path: str, year: int, members: int):
+    """Writes a 3x4 field per start month, lead month and member"""
+    write_grib(
+        file_path,
+        [
+            {
+                "dataDate": year * 10000 + month * 100 + 1,
+                "forecastMonth": lead,
+                "number": number,
+                "values": np.full(12, year + month / 100 + lead * 10 + number),
+            }
+            for month in range(1, 13)
+            for lead in [1, 2]
+            for number in range(members)
+        ],
+        **regular_grid(10.0, 20.0, 8.0, 23.0),
+        **SEASONAL_KEYS,
+    )
+
+
+def test_add_grib_writes_one_chunk_per_member_year_and_lead(
+    write_grib, zarr, tmp_path
+):
+    grib_path = str(tmp_path / "2021.grib")
+    _write_forecast_grib(write_grib, grib_path, 2021, members=2)
+    store = ZarrStore(str(tmp_path / "store.zarr"), [2020, 2021], [1, 2], 3)
+
+    written = store.add_grib(grib_path)
+
+    assert sorted(written) == sorted(
+        f"2t/{number}.1.0.{lead}.0.0"
+        for number in range(2)
+        for lead in range(2)
+    )
+    group = zarr.open_group(str(tmp_path / "store.zarr"), mode="r")
+    array = group["2t"]
+    assert array.shape == (3, 2, 12, 2, 3, 4)
+    assert array.attrs["_ARRAY_DIMENSIONS"] == [
+        "number",
+        "year",
+        "month",
+        "lead",
+        "latitude",
+        "longitude",
+    ]
+    assert group["latitude"][:].tolist() == [10.0, 9.0, 8.0]
+    assert array[1, 1, 2, 1, 0, 0] == pytest.approx(2021.03 + 20 + 1)
+    # Years and members without data stay empty
+    assert np.isnan(array[0, 0]).all()
+    assert np.isnan(array[2, 1]).all()
+
+
+def test_reopened_store_appends_new_years(write_grib, zarr, tmp_path):
+    path = str(tmp_path / "store.zarr")
+    first_path = str(tmp_path / "2021.grib")
+    _write_forecast_grib(write_grib, first_path, 2021, members=1)
+    ZarrStore(path, [2021], [1, 2], 1).add_grib(first_path)
+    second_path = str(tmp_path / "2022.grib")
+    _write_forecast_grib(write_grib, second_path, 2022, members=1)
+
+    store = ZarrStore(path, [2022], [1, 2], 1)
+    store.add_grib(second_path)
+    files = store.consolidate()
+
+    group = zarr.open_consolidated(path, zarr_format=2)
+    assert group["year"][:].tolist() == [2021, 2022]
+    assert group["2t"].shape == (1, 2, 12, 2, 3, 4)
+    assert group["2t"][0, 0, 0, 0, 0, 0] == pytest.approx(2021.01 + 10)
+    assert group["2t"][0, 1, 0, 0, 0, 0] == pytest.approx(2022.01 + 10)
+    assert ".zmetadata" in files
+    assert "year/0" in files
+    assert "2t/0.1.0.0.0.0" not in files
+
+
+def test_reopened_store_rejects_earlier_years(eccodes, zarr, tmp_path):
+    path = str(tmp_path / "store.zarr")
+    ZarrStore(path, [2024], [1, 2], 1)
+
+    with pytest.raises(ValueError, match="2020"):
+        ZarrStore(path, [2020, 2025], [1, 2], 1)
+    assert ZarrStore(path, [2025], [1, 2], 1).group["year"][:].tolist() == [
+        2024,
+        2025,
+    ]
+
+
+def test_get_zarr_support_error_names_missing_packages(monkeypatch):
+    installed = {"zarr": "2.18.2", "numcodecs": "0.12.1"}
+
+    def version(name):
+        if name not in installed:
+            raise PackageNotFoundError(name)
+        return installed[name]
+
+    monkeypatch.setattr("importlib.metadata.version", version)
+    assert zarr_store.get_zarr_support_error() == (
+        "zarr 3 is required, not 2.18.2"
+    )
+    installed["zarr"] = "3.1.0"
+    assert zarr_store.get_zarr_support_error() is None
+    del installed["numcodecs"]
+    assert "numcodecs is not installed" in zarr_store.get_zarr_support_error()
@@ -0,0 +1,658 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from types import SimpleNamespace
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_retrieval import azure_blob_utils
+from src.data_retrieval.cds import telemetry
+
+SAS_TOKEN = "sv=1&sig=x"
+
+
+class FakeBlobClient:
+    def __init__(self):
+        self.staged = {}
+        self.committed = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def stage_block(self, block_id, data, length=None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        self.staged[block_id] = bytes(data)
+        with self._lock:
+            self.in_flight -= 1
+
+    def commit_block_list(self, block_list, content_settings=None):
+        self.committed = b"".join(
+            self.staged[block.id] for block in block_list
+        )
+        self.content_md5 = bytes(content_settings.content_md5)
+        return {"etag": '"0x1"'}
+
+
+@pytest.fixture
+def fake_blob_client(monkeypatch):
+    client = FakeBlobClient()
+    monkeypatch.setattr(
+        azure_blob_utils,
+        "get_blob_client",
+        lambda sas_token, container_name, storage_account, blob_path: client,
+    )
+    return client
+
+
+def test_upload_file_in_blocks_commits_file_content(
+    tmp_path, fake_blob_client
+):
+    payload = os.urandom(10_000)
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(payload)
+
+    etag = azure_blob_utils.upload_file_in_blocks(
+        "sas",
+        "container",
+        "account",
+        str(file_path),
+        "raw/data.grib",
+        block_size=1024,
+        max_concurrency=3,
+    )
+
+    assert etag == '"0x1"'
+    assert fake_blob_client.committed == payload
+    assert fake_blob_client.content_md5 == hashlib.md5(payload).digest()
+    assert len(fake_blob_client.staged) == 10
+    assert fake_blob_client.max_in_flight <= 3
+
+
+def test_upload_file_in_blocks_rejects_too_many_blocks(
+    tmp_path, fake_blob_client, monkeypatch
+):
+    monkeypatch.setattr(azure_blob_utils, "MAX_BLOCK_COUNT", 2)
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(b"x" * 30)
+
+    with pytest.raises(ValueError):
+        azure_blob_utils.upload_file_in_blocks(
+            "sas",
+            "container",
+            "account",
+            str(file_path),
+            "raw/data.grib",
+            block_size=10,
+        )
+
+
+def test_get_container_client_is_shared_until_reconfigured():
+    client = azure_blob_utils.get_container_client(
+        SAS_TOKEN, "cont", "account"
+    )
+    blob_client = azure_blob_utils.get_blob_client(
+        SAS_TOKEN, "cont", "account", "raw/data.grib"
+    )
+
+    assert (
+        azure_blob_utils.get_container_client(SAS_TOKEN, "cont", "account")
+        is client
+    )
+    assert blob_client.url == (
+        "https://account.blob.core.windows.net/cont/raw/data.grib?sv=1&sig=x"
+    )
+    assert blob_client._pipeline._transport._transport is (
+        client._pipeline._transport
+    )
+
+    azure_blob_utils.configure_blob_transfers(block_size=1024)
+    try:
+        reconfigured = azure_blob_utils.get_container_client(
+            SAS_TOKEN, "cont", "account"
+        )
+        assert reconfigured is not client
+        assert reconfigured._config.max_block_size == 1024
+    finally:
+        azure_blob_utils.configure_blob_transfers(
+            block_size=azure_blob_utils.DEFAULT_BLOCK_SIZE
+        )
+
+
+def test_upload_files_reports_failed_transfers(tmp_path, monkeypatch):
+    uploaded = []
+
+    def fake_upload(sas, container, account, local_file_path, blob_path):
+        if blob_path.endswith("2.grib"):
+            raise IOError("connection reset")
+        uploaded.append(blob_path)
+
+    monkeypatch.setattr(azure_blob_utils, "upload_file_in_blocks", fake_upload)
+    for i in range(5):
+        (tmp_path / f"{i}.grib").write_bytes(b"grib")
+
+    errors = azure_blob_utils.upload_files(
+        "sas",
+        "container",
+        "account",
+        [(str(tmp_path / f"{i}.grib"), f"raw/{i}.grib") for i in range(5)],
+        workers=3,
+    )
+
+    assert sorted(uploaded) == [
+        "raw/0.grib",
+        "raw/1.grib",
+        "raw/3.grib",
+        "raw/4.grib",
+    ]
+    assert list(errors) == ["raw/2.grib"]
+    assert isinstance(errors["raw/2.grib"], IOError)
+
+
+def test_upload_files_records_a_span_per_file(tmp_path, monkeypatch):
+    def fake_upload(sas, container, account, local_file_path, blob_path):
+        if blob_path.endswith("1.grib"):
+            raise IOError("connection reset")
+
+    monkeypatch.setattr(azure_blob_utils, "upload_file_in_blocks", fake_upload)
+    for i in range(3):
+        (tmp_path / f"{i}.grib").write_bytes(b"x" * (i + 1))
+    recorder = telemetry.configure_telemetry(str(tmp_path / "t.jsonl"))
+    try:
+        with telemetry.telemetry_context(partition="2021"):
+            azure_blob_utils.upload_files(
+                "sas",
+                "container",
+                "account",
+                [
+                    (str(tmp_path / f"{i}.grib"), f"raw/{i}.grib")
+                    for i in range(3)
+                ],
+            )
+    finally:
+        telemetry.configure_telemetry(None)
+
+    records = sorted(
+        telemetry.read_telemetry(recorder.file_path), key=lambda r: r["blob"]
+    )
+    assert [
+        (r["kind"], r["partition"], r["blob"], r["outcome"]) for r in records
+    ] == [
+        ("blob_upload", "2021", "raw/0.grib", "ok"),
+        ("blob_upload", "2021", "raw/1.grib", "error"),
+        ("blob_upload", "2021", "raw/2.grib", "ok"),
+    ]
+    assert [records[0]["bytes"], records[2]["bytes"]] == [1, 3]
+
+
+class FakeDownload:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def readall(self) -> bytes:
+        return self.data
+
+
+class FakeRangeBlobClient:
+    """Serves a payload, recording the bytes of every range request"""
+
+    def __init__(self, payload: bytes, content_md5=None):
+        self.payload = payload
+        self.content_md5 = content_md5
+        self.account_name = "account"
+        self.container_name = "container"
+        self.blob_name = "blob"
+        self.etag = '"0x1"'
+        self.transferred = 0
+        self.ranges = []
+        self.fail_at = None
+
+    def get_blob_properties(self):
+        return SimpleNamespace(
+            size=len(self.payload),
+            etag=self.etag,
+            last_modified=None,
+            content_settings=SimpleNamespace(content_md5=self.content_md5),
+        )
+
+    def download_blob(self, offset=0, length=None, **kwargs):
+        if offset == self.fail_at:
+            raise IOError("Connection reset")
+        end = len(self.payload) if length is None else offset + length
+        self.transferred += len(self.payload[offset:end])
+        self.ranges.append(offset)
+        return FakeDownload(self.payload[offset:end])
+
+
+@pytest.fixture
+def blob_payload(monkeypatch):
+    """Sets the payload served by the fake blob client"""
+    clients = []
+
+    def serve(payload: bytes, content_md5=None) -> FakeRangeBlobClient:
+        clients.append(FakeRangeBlobClient(payload, content_md5))
+        return clients[-1]
+
+    monkeypatch.setattr(
+        azure_blob_utils,
+        "get_blob_client",
+        lambda sas_token, container_name, storage_account, blob_path: clients[
+            -1
+        ],
+    )
+    return serve
+
+
+def test_read_parquet_blob_fetches_only_matching_row_groups(blob_payload):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    df = pd.DataFrame(
+        {
+            "iso": np.repeat([f"C{i:02d}" for i in range(100)], 2000),
+            "value": np.random.default_rng(0).random(200_000),
+            "other": np.random.default_rng(1).random(200_000),
+        }
+    )
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df), buffer, row_group_size=2000)
+    client = blob_payload(buffer.getvalue())
+
+    result = azure_blob_utils.read_blob_to_dataframe(
+        SAS_TOKEN,
+        "container",
+        "account",
+        "results.parquet",
+        columns=["value"],
+        filters=[("iso", "==", "C07")],
+    )
+
+    assert list(result.columns) == ["value"]
+    assert result["value"].tolist() == df[df["iso"] == "C07"]["value"].tolist()
+    assert client.transferred < len(client.payload) / 20
+
+
+def test_read_geoparquet_blob_returns_geodataframe(blob_payload):
+    pytest.importorskip("pyarrow")
+    gdf = gpd.GeoDataFrame(
+        {"iso": ["ETH", "KEN"]},
+        geometry=gpd.points_from_xy([38.7, 36.8], [9.0, -1.3]),
+        crs="EPSG:4326",
+    )
+    buffer = io.BytesIO()
+    gdf.to_parquet(buffer)
+    blob_payload(buffer.getvalue())
+
+    result = azure_blob_utils.read_blob_to_dataframe(
+        SAS_TOKEN,
+        "container",
+        "account",
+        "boundaries.parquet",
+        columns=["iso"],
+        filters=[("iso", "==", "KEN")],
+    )
+
+    assert isinstance(result, gpd.GeoDataFrame)
+    assert result.crs.to_epsg() == 4326
+    assert result["iso"].tolist() == ["KEN"]
+    assert result.geometry.iloc[0].x == pytest.approx(36.8)
+
+
+def test_read_csv_blob_streams_chunks(blob_payload):
+    csv = "iso,value\n" + "".join(f"C{i},{i}\n" for i in range(25))
+    blob_payload(csv.encode("utf-8"))
+
+    chunks = azure_blob_utils.read_blob_to_dataframe(
+        SAS_TOKEN, "container", "account", "results.csv", chunksize=10
+    )
+
+    with chunks:
+        sizes = [len(chunk) for chunk in chunks]
+    assert sizes == [10, 10, 5]
+
+
+def test_download_file_in_ranges_verifies_md5(tmp_path, blob_payload):
+    payload = os.urandom(10_000)
+    client = blob_payload(payload, hashlib.md5(payload).digest())
+    local_path = tmp_path / "data.grib"
+
+    etag = azure_blob_utils.download_file_in_ranges(
+        SAS_TOKEN,
+        "container",
+        "account",
+        "raw/data.grib",
+        str(local_path),
+        range_size=1024,
+        max_concurrency=4,
+    )
+
+    assert etag == '"0x1"'
+    assert local_path.read_bytes() == payload
+    assert sorted(client.ranges) == list(range(0, 10_000, 1024))
+    assert os.listdir(tmp_path) == ["data.grib"]
+
+
+def test_download_file_in_ranges_resumes_missing_ranges(
+    tmp_path, blob_payload
+):
+    payload = os.urandom(10_000)
+    client = blob_payload(payload, hashlib.md5(payload).digest())
+    client.fail_at = 5 * 1024
+    local_path = tmp_path / "data.grib"
+    download = partial(
+        azure_blob_utils.download_file_in_ranges,
+        SAS_TOKEN,
+        "container",
+        "account",
+        "raw/data.grib",
+        str(local_path),
+        range_size=1024,
+        max_concurrency=1,
+    )
+
+    with pytest.raises(IOError):
+        download()
+    assert not local_path.exists()
+    client.fail_at = None
+    client.ranges = []
+    download()
+
+    assert local_path.read_bytes() == payload
+    assert client.ranges == [5 * 1024]
+
+
+def test_download_file_in_ranges_records_ranges_once_on_disk(
+    tmp_path, blob_payload, monkeypatch
+):
+    events = []
+    write_progress = azure_blob_utils._write_progress
+    monkeypatch.setattr(
+        azure_blob_utils, "_sync_data", lambda fd: events.append("sync")
+    )
+    monkeypatch.setattr(
+        azure_blob_utils,
+        "_write_progress",
+        lambda path, progress: events.append(len(progress["done"]))
+        or write_progress(path, progress),
+    )
+    blob_payload(os.urandom(3 * 1024))
+
+    azure_blob_utils.download_file_in_ranges(
+        SAS_TOKEN,
+        "container",
+        "account",
+        "raw/data.grib",
+        str(tmp_path / "data.grib"),
+        range_size=1024,
+        max_concurrency=1,
+    )
+
+    assert events == ["sync", 1, "sync", 2, "sync", 3]
+
+
+def test_download_file_in_ranges_rejects_md5_mismatch(tmp_path, blob_payload):
+    blob_payload(os.urandom(10_000), hashlib.md5(b"other").digest())
+    local_path = tmp_path / "data.grib"
+
+    with pytest.raises(IOError, match="Content-MD5"):
+        azure_blob_utils.download_file_in_ranges(
+            SAS_TOKEN,
+            "container",
+            "account",
+            "raw/data.grib",
+            str(local_path),
+            range_size=1024,
+        )
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_file_in_ranges_rejects_md5_mismatch_of_empty_blob(
+    tmp_path, blob_payload
+):
+    blob_payload(b"", hashlib.md5(b"other").digest())
+    local_path = tmp_path / "data.grib"
+
+    with pytest.raises(IOError, match="Content-MD5"):
+        azure_blob_utils.download_file_in_ranges(
+            SAS_TOKEN, "container", "account", "raw/data.grib", str(local_path)
+        )
+    assert os.listdir(tmp_path) == []
+
+
+def test_blob_cache_revalidates_with_etag(tmp_path, blob_payload):
+    azure_blob_utils.configure_blob_cache(str(tmp_path / "cache"))
+    try:
+        client = blob_payload(b"iso,value\nETH,1\n")
+        read = partial(
+            azure_blob_utils.read_blob_to_dataframe,
+            SAS_TOKEN,
+            "container",
+            "account",
+            "results.csv",
+        )
+
+        assert read()["value"].tolist() == [1]
+        transferred = client.transferred
+        assert read()["value"].tolist() == [1]
+        assert client.transferred == transferred
+
+        client.payload = b"iso,value\nETH,2\n"
+        client.etag = '"0x2"'
+        assert read()["value"].tolist() == [2]
+    finally:
+        azure_blob_utils.configure_blob_cache(None)
+
+
+def test_blob_cache_evicts_least_recently_used(tmp_path, blob_payload):
+    cache = azure_blob_utils.BlobCache(str(tmp_path), max_bytes=15_000)
+    fetch = partial(cache.fetch, SAS_TOKEN, "container", "account")
+    blob_payload(os.urandom(10_000))
+    first = fetch("raw/first.grib")
+    blob_payload(os.urandom(10_000))
+    second = fetch("raw/second.grib")
+
+    assert not os.path.exists(first)
+    assert os.path.getsize(second) == 10_000
+
+
+def test_block_cache_fetches_only_missing_blocks(tmp_path, blob_payload):
+    payload = os.urandom(10 * 1024)
+    client = blob_payload(payload)
+    cache = azure_blob_utils.BlockCache(str(tmp_path), block_size=1024)
+    reader = azure_blob_utils.BlobReader(client, block_cache=cache)
+
+    reader.seek(2500)
+    assert reader.read(1000) == payload[2500:3500]
+    assert client.ranges == [2048]
+    assert client.transferred == 2048
+
+    # Another process sharing the directory reuses the blocks
+    other = azure_blob_utils.BlockCache(str(tmp_path), block_size=1024)
+    reader = azure_blob_utils.BlobReader(client, block_cache=other)
+    reader.seek(2048)
+    assert reader.read(3000) == payload[2048:5048]
+    assert client.ranges == [2048, 4096]
+    assert other.bytes_fetched == 1024
+
+
+def test_open_blob_reads_az_url_through_block_cache(
+    tmp_path, blob_payload, monkeypatch
+):
+    monkeypatch.setenv("STORAGE_SAS_TOKEN_CHD", SAS_TOKEN)
+    monkeypatch.setenv("CONTAINER_NAME_CHD", "container")
+    monkeypatch.setenv("STORAGE_ACCOUNT_CHD", "account")
+    payload = os.urandom(100_000)
+    client = blob_payload(payload)
+    cache = azure_blob_utils.BlockCache(str(tmp_path), block_size=4096)
+    url = "az://container/raw/ecmwf.grib"
+
+    assert azure_blob_utils.is_blob_url(url)
+    assert not azure_blob_utils.is_blob_url("data/ecmwf.grib")
+    with azure_blob_utils.open_blob(url, cache) as f:
+        f.seek(50_000)
+        assert f.read(100) == payload[50_000:50_100]
+    assert client.transferred < len(payload) / 5
+
+
+def fake_blob_properties(data: bytes, last_modified: float):
+    return SimpleNamespace(
+        size=len(data),
+        last_modified=datetime.fromtimestamp(last_modified, timezone.utc),
+        content_settings=SimpleNamespace(
+            content_md5=bytearray(hashlib.md5(data).digest())
+        ),
+    )
+
+
+def test_plan_sync_transfers_only_changed_files(tmp_path, monkeypatch):
+    (tmp_path / "adm").mkdir()
+    (tmp_path / "ref_grid.parquet").write_bytes(b"grid")
+    (tmp_path / "adm" / "eth.parquet").write_bytes(b"new adm")
+    (tmp_path / "pixel.parquet").write_bytes(b"local pixel")
+    os.utime(tmp_path / "pixel.parquet", (1_000, 1_000))
+    blobs = {
+        "processed/ref_grid.parquet": fake_blob_properties(b"grid", 1_000),
+        "processed/adm/eth.parquet": fake_blob_properties(b"old adm", 1_000),
+        "processed/pixel.parquet": fake_blob_properties(b"remote px", 2_000),
+        "processed/adm/ken.parquet": fake_blob_properties(b"ken", 1_000),
+    }
+
+    plan = azure_blob_utils.plan_sync(str(tmp_path), blobs, "processed")
+
+    assert plan.uploads == [
+        (str(tmp_path / "adm" / "eth.parquet"), "processed/adm/eth.parquet")
+    ]
+    assert plan.downloads == [
+        ("processed/adm/ken.parquet", str(tmp_path / "adm" / "ken.parquet")),
+        ("processed/pixel.parquet", str(tmp_path / "pixel.parquet")),
+    ]
+    assert plan.unchanged == 1
+
+    up = azure_blob_utils.plan_sync(str(tmp_path), blobs, "processed", "up")
+    assert [blob_path for _, blob_path in up.uploads] == [
+        "processed/adm/eth.parquet",
+        "processed/pixel.parquet",
+    ]
+    assert up.downloads == []
+
+    # Unchanged files are not read again
+    def fail(file_path):
+        raise AssertionError(f"{file_path} read again")
+
+    monkeypatch.setattr(azure_blob_utils, "_file_md5", fail)
+    plan = azure_blob_utils.plan_sync(str(tmp_path), blobs, "processed")
+    assert plan.unchanged == 1
+
+
+def test_download_file_copies_from_blob_cache(tmp_path, blob_payload):
+    azure_blob_utils.configure_blob_cache(str(tmp_path / "cache"))
+    try:
+        client = blob_payload(b"original")
+        download = partial(
+            azure_blob_utils.download_file,
+            SAS_TOKEN,
+            "container",
+            "account",
+            "raw/era5.grib",
+        )
+        first_path = tmp_path / "first.grib"
+        download(str(first_path))
+        with open(first_path, "r+b") as f:
+            f.write(b"changed")
+        transferred = client.transferred
+
+        second_path = tmp_path / "second.grib"
+        download(str(second_path))
+
+        assert second_path.read_bytes() == b"original"
+        assert client.transferred == transferred
+    finally:
+        azure_blob_utils.configure_blob_cache(None)
+
+
+def test_blob_cache_evict_skips_entries_being_read(tmp_path, blob_payload):
+    cache = azure_blob_utils.BlobCache(str(tmp_path), max_bytes=0)
+    blob_payload(b"grib")
+    fetch_locked = partial(
+        cache.fetch_locked, SAS_TOKEN, "container", "account", "raw/era5.grib"
+    )
+
+    with fetch_locked() as path:
+        cache.evict()
+        with open(path, "rb") as f:
+            assert f.read() == b"grib"
+    cache.evict()
+    assert not os.path.exists(path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_plan_sync_compares_blobs_without_md5_by_size_and_time(tmp_path):
+    (tmp_path / "adm.parquet").write_bytes(b"adm")
+    os.utime(tmp_path / "adm.parquet", (1_000, 1_000))
+    (tmp_path / "pixel.parquet").write_bytes(b"new")
+    os.utime(tmp_path / "pixel.parquet", (3_000, 3_000))
+    blobs = {
+        name: fake_blob_properties(b"old", 2_000)
+        for name in ["processed/adm.parquet", "processed/pixel.parquet"]
+    }
+    for blob in blobs.values():
+        blob.content_settings.content_md5 = None
+
+    plan = azure_blob_utils.plan_sync(str(tmp_path), blobs, "processed")
+
+    assert plan.unchanged == 1
+    assert plan.uploads == [
+        (str(tmp_path / "pixel.parquet"), "processed/pixel.parquet")
+    ]
+    assert plan.downloads == []
+
+
+def test_sync_directory_stores_md5_of_downloaded_blobs(tmp_path, monkeypatch):
+    blob = fake_blob_properties(b"grid", 2_000)
+    blob.content_settings.content_md5 = None
+    blob.etag = '"0x1"'
+    headers = []
+
+    def download_files(sas, container, account, blobs, workers):
+        for _, local_file_path in blobs:
+            with open(local_file_path, "wb") as f:
+                f.write(b"grid")
+        return {}
+
+    client = SimpleNamespace(
+        blob_name="processed/ref_grid.parquet",
+        set_http_headers=lambda **kwargs: headers.append(kwargs),
+    )
+    monkeypatch.setattr(
+        azure_blob_utils,
+        "list_blobs",
+        lambda *args: {"processed/ref_grid.parquet": blob},
+    )
+    monkeypatch.setattr(azure_blob_utils, "download_files", download_files)
+    monkeypatch.setattr(
+        azure_blob_utils, "get_blob_client", lambda *args: client
+    )
+
+    plan, errors = azure_blob_utils.sync_directory(
+        SAS_TOKEN, "container", "account", str(tmp_path), "processed"
+    )
+
+    assert len(plan.downloads) == 1 and errors == {}
+    assert os.path.getmtime(tmp_path / "ref_grid.parquet") == 2_000
+    assert headers[0]["etag"] == '"0x1"'
+    assert bytes(headers[0]["content_settings"].content_md5) == (
+        hashlib.md5(b"grid").digest()
+    )
+    # Synced back both ways, the file is not uploaded again
+    plan = azure_blob_utils.plan_sync(
+        str(tmp_path), {"processed/ref_grid.parquet": blob}, "processed"
+    )
+    assert (plan.uploads, plan.downloads, plan.unchanged) == ([], [], 1)
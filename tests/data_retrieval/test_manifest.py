@@ -0,0 +1,96 @@
+import hashlib
+
+from src.data_retrieval.manifest import Manifest, file_md5
+
+
+def test_file_md5_returns_checksum_of_file_content(tmp_path):
+    file_path = tmp_path / "data.grib"
+    file_path.write_bytes(b"grib" * 1000)
+
+    returned: str = file_md5(str(file_path), chunk_size=7)
+
+    assert returned == hashlib.md5(b"grib" * 1000).hexdigest()
+
+
+def test_manifest_round_trips_through_local_file(tmp_path):
+    manifest = Manifest()
+    manifest.record(
+        "eth_2021.grib",
+        dataset="mars",
+        year=2021,
+        iso="ETH",
+        format="grib",
+        size=4,
+        md5="abc",
+    )
+    manifest_path = str(tmp_path / "manifest.json")
+    manifest.save(manifest_path)
+
+    loaded = Manifest.load(manifest_path)
+
+    assert loaded.entries == manifest.entries
+    assert Manifest.load(str(tmp_path / "missing.json")).entries == {}
+
+
+def test_is_complete_local_detects_missing_and_truncated_files(tmp_path):
+    file_path = tmp_path / "eth_2021.grib"
+    file_path.write_bytes(b"grib")
+    manifest = Manifest()
+    manifest.record_file(
+        "eth_2021.grib",
+        str(file_path),
+        dataset="mars",
+        year=2021,
+        format="grib",
+    )
+
+    assert manifest.is_complete_local("eth_2021.grib", str(file_path))
+    assert not manifest.is_complete_local("eth_2022.grib", str(file_path))
+
+    file_path.write_bytes(b"gr")
+    assert not manifest.is_complete_local("eth_2021.grib", str(file_path))
+
+    file_path.unlink()
+    assert not manifest.is_complete_local("eth_2021.grib", str(file_path))
+
+
+def test_is_complete_compares_blob_etag():
+    manifest = Manifest()
+    manifest.record(
+        "eth_2021.grib",
+        dataset="mars",
+        year=2021,
+        format="grib",
+        size=4,
+        md5="abc",
+        etag='"0x1"',
+    )
+
+    assert manifest.is_complete("eth_2021.grib", 4, '"0x1"')
+    assert not manifest.is_complete("eth_2021.grib", 4, '"0x2"')
+
+
+def test_record_keeps_checksum_of_repacked_source():
+    manifest = Manifest()
+    manifest.record(
+        "ecmwf_2021.grib",
+        dataset="ecmwf",
+        year=2021,
+        format="grib",
+        size=4,
+        md5="abc",
+    )
+    manifest.record(
+        "era5_2021.grib",
+        dataset="era5",
+        year=2021,
+        format="grib",
+        size=4,
+        md5="abc",
+        source_size=10,
+        source_md5="def",
+    )
+
+    assert "source_md5" not in manifest.entries["ecmwf_2021.grib"]
+    assert manifest.entries["era5_2021.grib"]["source_size"] == 10
+    assert manifest.entries["era5_2021.grib"]["source_md5"] == "def"
@@ -0,0 +1,128 @@
+import threading
+import time
+from typing import List
+
+import pytest
+
+from src.data_retrieval.util import (
+    TaskOutcome,
+    parse_years,
+    run_parallel,
+    run_pipeline,
+)
+
+
+def test_parse_years_expands_ranges_and_lists():
+    assert parse_years("2023") == [2023]
+    assert parse_years("2023-2024") == [2023, 2024]
+    assert parse_years("1981-1983, 2023") == [1981, 1982, 1983, 2023]
+
+
+@pytest.mark.parametrize("value", ["", "20x3", "2024-2023"])
+def test_parse_years_rejects_invalid_values(value: str):
+    with pytest.raises(ValueError):
+        parse_years(value)
+
+
+def test_run_parallel_returns_outcome_for_each_item():
+    def square(value: int) -> int:
+        if value == 3:
+            raise RuntimeError("boom")
+        return value * value
+
+    outcomes: List[TaskOutcome] = list(run_parallel(square, range(5), 2))
+
+    results = {o.item: o.result for o in outcomes if o.ok}
+    failed = [o.item for o in outcomes if not o.ok]
+    assert results == {0: 0, 1: 1, 2: 4, 4: 16}
+    assert failed == [3]
+
+
+def test_run_parallel_keeps_several_items_in_flight():
+    barrier = threading.Barrier(3, timeout=5)
+
+    # Deadlocks (and times out) unless three items run concurrently
+    outcomes = list(run_parallel(lambda _: barrier.wait(), range(3), 3))
+
+    assert all(outcome.ok for outcome in outcomes)
+
+
+def test_run_parallel_rejects_invalid_worker_count():
+    with pytest.raises(ValueError):
+        list(run_parallel(print, [1], 0))
+
+
+def test_run_pipeline_consumes_every_produced_payload():
+    def produce(value: int) -> str:
+        if value == 2:
+            raise RuntimeError("download failed")
+        return f"payload-{value}"
+
+    def consume(value: int, payload: str) -> str:
+        if value == 3:
+            raise RuntimeError("upload failed")
+        return payload.upper()
+
+    outcomes = list(run_pipeline(produce, consume, range(5), 2, 2))
+
+    results = {o.item: o.result for o in outcomes if o.ok}
+    failed = sorted(o.item for o in outcomes if not o.ok)
+    assert results == {0: "PAYLOAD-0", 1: "PAYLOAD-1", 4: "PAYLOAD-4"}
+    assert failed == [2, 3]
+
+
+def test_run_pipeline_bounds_pending_payloads():
+    lock = threading.Lock()
+    pending = [0]
+    peak = [0]
+
+    def produce(value: int) -> int:
+        with lock:
+            pending[0] += 1
+            peak[0] = max(peak[0], pending[0])
+        return value
+
+    def consume(value: int, payload: int) -> int:
+        # Slow consumer, producers have to wait for free slots
+        time.sleep(0.01)
+        with lock:
+            pending[0] -= 1
+        return payload
+
+    outcomes = list(
+        run_pipeline(produce, consume, range(20), 4, 1, max_pending=3)
+    )
+
+    assert len(outcomes) == 20
+    assert peak[0] <= 3
+
+
+def test_run_pipeline_takes_items_lazily_once_a_slot_is_free():
+    consumed: List[int] = []
+    unconsumed_when_taken: List[int] = []
+
+    def items():
+        for value in range(10):
+            unconsumed_when_taken.append(value - len(consumed))
+            yield value
+
+    def consume(value: int, payload: int) -> int:
+        time.sleep(0.01)
+        consumed.append(value)
+        return payload
+
+    outcomes = list(
+        run_pipeline(lambda v: v, consume, items(), 2, 1, max_pending=2)
+    )
+
+    assert sorted(o.result for o in outcomes) == list(range(10))
+    assert max(unconsumed_when_taken) <= 2
+
+
+def test_run_pipeline_raises_errors_of_the_items_iterator():
+    def items():
+        yield 1
+        raise RuntimeError("listing failed")
+
+    with pytest.raises(RuntimeError, match="listing failed"):
+        list(run_pipeline(lambda v: v, lambda v, p: p, items()))
@@ -0,0 +1,30 @@
+"""Keys of the GRIB files written by the write_grib fixture"""
+
+from typing import Any, Dict
+
+# Local definition of the ECMWF seasonal forecast monthly means
+SEASONAL_KEYS: Dict[str, int] = {
+    "setLocalDefinition": 1,
+    "localDefinitionNumber": 16,
+}
+
+
+def regular_grid(
+    north: float,
+    west: float,
+    south: float,
+    east: float,
+    lon_step: float = 1.0,
+    lat_step: float = 1.0,
+) -> Dict[str, Any]:
+    """Returns the keys of a regular latitude longitude grid"""
+    return {
+        "Ni": round((east - west) / lon_step) + 1,
+        "Nj": round((north - south) / lat_step) + 1,
+        "latitudeOfFirstGridPointInDegrees": north,
+        "longitudeOfFirstGridPointInDegrees": west,
+        "latitudeOfLastGridPointInDegrees": south,
+        "longitudeOfLastGridPointInDegrees": east,
+        "iDirectionIncrementInDegrees": lon_step,
+        "jDirectionIncrementInDegrees": lat_step,
+    }